@@ -0,0 +1,102 @@
+'''
+Compare the running time and peak memory use of the page-based and the
+streaming revision readers on a synthetic dump with very large pages.
+
+Run as
+python src/chapter1/benchmark_process_revisions.py
+'''
+
+import gzip, os, resource, shutil, tempfile, time
+import multiprocessing
+from xml.sax import make_parser
+
+from process_revisions_xml import ProcessRevisions, create_reader
+
+
+# The shape of the synthetic dump; a few pages with very many revisions,
+# like the busiest talk pages.
+PAGES = 4
+REVISIONS_PER_PAGE = 250000
+
+REVISION = '''    <revision>
+      <id>%d</id>
+      <parentid>%d</parentid>
+      <timestamp>2013-01-%02dT%02d:%02d:%02dZ</timestamp>
+      <contributor>
+        <username>User %d</username>
+        <id>%d</id>
+      </contributor>
+      <comment>Synthetic edit</comment>
+      <model>wikitext</model>
+      <format>text/x-wiki</format>
+      <text id="%d" bytes="1024" />
+      <sha1>phoiac9h4m842xq45sp7s6u21eteeq1</sha1>
+    </revision>
+'''
+
+
+class NullOutput():
+    '''Discard the output so that we only measure the parsing.'''
+
+    def write(self, data):
+        pass
+
+
+def write_synthetic_dump(file_name, pages, revisions_per_page):
+    '''Write a stub-meta-history like dump with the given number of pages.'''
+    with gzip.open(file_name, 'w') as f:
+        f.write('<mediawiki>\n  <siteinfo>\n  </siteinfo>\n')
+        rev_id = 0
+        for page_id in xrange(1, pages + 1):
+            f.write('  <page>\n    <title>User talk:Page %d</title>\n'
+                    '    <ns>3</ns>\n    <id>%d</id>\n' % (page_id, page_id))
+            for i in xrange(0, revisions_per_page):
+                rev_id += 1
+                f.write(REVISION % (rev_id, rev_id - 1, i % 28 + 1, i % 24,
+                                    i % 60, i % 60, i % 1000, i % 1000,
+                                    rev_id))
+            f.write('  </page>\n')
+        f.write('</mediawiki>\n')
+
+
+def parse(args):
+    '''Parse the dump and return the elapsed time and the peak memory use.'''
+    file_name, streaming = args
+    begin = time.time()
+    parser = make_parser()
+    parser.setContentHandler(create_reader(ProcessRevisions(NullOutput()),
+                                           streaming))
+    with gzip.open(file_name, 'r') as f:
+        parser.parse(f)
+    return (time.time() - begin,
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def baseline(args):
+    '''The peak memory use of a worker that does nothing.'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_in_new_process(function, args):
+    '''Run every measurement in a fresh process to get its own peak memory.'''
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    result = pool.apply(function, (args,))
+    pool.close()
+    pool.join()
+    return result
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp()
+    try:
+        dump = os.path.join(directory, 'synthetic-stub-meta-history.xml.gz')
+        write_synthetic_dump(dump, PAGES, REVISIONS_PER_PAGE)
+        print 'Pages:', PAGES, 'revisions per page:', REVISIONS_PER_PAGE
+        base_memory = run_in_new_process(baseline, None)
+        for streaming in [False, True]:
+            elapsed, memory = run_in_new_process(parse, (dump, streaming))
+            print '%-10s %8.2f s %10.1f MB' % (
+                'streaming' if streaming else 'page',
+                elapsed, (memory - base_memory) / 1024.0)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,47 @@
+'''
+Check that the serial and the parallel modes of process_revisions_xml.py
+write the same rows, on a synthetic dump that is cut into many chunks.
+
+Run as
+python src/chapter1/check_process_revisions.py
+'''
+
+import gzip, os, shutil, sys, tempfile
+
+from benchmark_process_revisions import write_synthetic_dump
+from process_revisions_xml import process_serial, process_parallel
+
+
+# The shape of the synthetic dump, and the chunk size, which is much
+# smaller than a page so that the chunks are cut in the middle of them.
+PAGES = 20
+REVISIONS_PER_PAGE = 500
+CHUNK_SIZE = 64 * 1024
+PROCESSES = 2
+
+
+def read_rows(file_name):
+    with gzip.open(file_name, 'r') as f:
+        return f.read().splitlines()
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp()
+    try:
+        dump = os.path.join(directory, 'synthetic-stub-meta-history.xml.gz')
+        write_synthetic_dump(dump, PAGES, REVISIONS_PER_PAGE)
+        serial = os.path.join(directory, 'serial.tsv.gz')
+        parallel = os.path.join(directory, 'parallel.tsv.gz')
+        process_serial(dump, serial)
+        process_parallel(dump, parallel, PROCESSES, CHUNK_SIZE)
+        serial_rows, parallel_rows = read_rows(serial), read_rows(parallel)
+    finally:
+        shutil.rmtree(directory)
+    print 'Rows:', len(serial_rows), 'serial,', len(parallel_rows), \
+        'parallel'
+    if len(serial_rows) != PAGES * REVISIONS_PER_PAGE:
+        sys.exit('The serial mode wrote %d rows instead of %d' %
+                 (len(serial_rows), PAGES * REVISIONS_PER_PAGE))
+    if serial_rows != parallel_rows:
+        sys.exit('The serial and the parallel modes wrote different rows')
+    print 'The serial and the parallel modes wrote the same rows'
@@ -0,0 +1,32 @@
+'''
+Convert a Wikipedia revision file into the columnar, memory-mapped store that
+the scripts of chapters 1-3 read instead of the file when it exists.
+
+Run as
+python src/chapter1/convert_revisions_to_columns.py [revision file]
+
+The default is the time-sorted revision file; the store is written into a
+directory next to it, e.g. data/wikipedia/revisions_time_sorted.columns.
+'''
+
+import sys
+
+sys.path.append('src/python')
+from parallel_gzip import read_lines
+from revision_store import RevisionStoreWriter, store_path
+
+
+INPUT_FILE = 'data/wikipedia/revisions_time_sorted.tsv.gz'
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        input_file_name = sys.argv[1]
+    else:
+        input_file_name = INPUT_FILE
+
+    writer = RevisionStoreWriter(store_path(input_file_name),
+                                 input_file_name)
+    for line in read_lines(input_file_name):
+        writer.add(line[:-1].split('\t'))
+    writer.close()
@@ -1,14 +1,32 @@
 '''
 Retrieve the most recent Tweets of certain user handles from Twitter using its
 API calls.
+
+The Tweets go to the directory OUTPUT_DIRECTORY, which replaces the single
+file data/twitter/tweets_per_user.tsv. Every run writes the Tweets it
+fetched to one or more segment files tweets-<run ID>-<number>.tsv.gz, where
+the run ID is the UTC time the run started at as YYYYmmddHHMMSS. A segment
+is a series of gzip members, which gzip.open and zcat read as one file. The
+lines are the same as in the old file: the user ID, the Tweet ID and the
+creation time of the Tweet, separated by tabs. A later run only fetches the
+Tweets newer than the ones we have, so all the Tweets of a user are in the
+segments of all runs together, e.g.
+
+    zcat data/twitter/tweets_per_user/*.tsv.gz
+
+The progress of the runs is kept in CHECKPOINT_FILE, see
+src/chapter1/timeline_checkpoints.py.
 '''
 
 import sys
 import gzip
-import time
-import tweepy
 from datetime import datetime, timedelta
 
+from timeline_collector import TimelineCollector, RateLimiter, \
+    TweepyClient, HttpTimelineClient, CONCURRENCY
+from timeline_checkpoints import CheckpointStore, CheckpointedOutput, \
+    SegmentWriter
+
 # The consumer and access keys & secrets for the Twitter application
 # See https://developer.twitter.com/en/docs/basics/authentication/overview/oauth
 # on how to access these credentials
@@ -17,66 +35,52 @@ CONSUMER_SECRET = '<copy consumer secret here from the Twitter dev site>'
 ACCESS_KEY = '<copy access key here from the Twitter dev site>'
 ACCESS_SECRET = '<copy access secret here from the Twitter dev site>'
 
-# The maximum number of Tweets we can ask for in one request
-# See https://developer.twitter.com/en/docs/tweets/timelines/api-reference/get-statuses-user_timeline.html
-MAX_ITEMS_PER_REQUEST = 200
-
 # The file where we store a list of valid Twitter user IDs
 USER_LIST = 'data/twitter/user_handles_sample.gz'
-# The result file
-OUTPUT_FILE = 'data/twitter/tweets_per_user.tsv'
+# The directory of the result files, one or more gzip segments per run
+OUTPUT_DIRECTORY = 'data/twitter/tweets_per_user'
+# The newest Tweet we have of every user, and the progress of the last run
+CHECKPOINT_FILE = 'data/twitter/tweets_per_user_checkpoints.tsv'
+
+# To collect offline from src/chapter1/mock_timeline_server.py, set this to
+# its URL, e.g. 'http://localhost:8765'.
+TIMELINE_SERVER = None
+
+
+if __name__ == '__main__':
+    if TIMELINE_SERVER is None:
+        # tweepy is only needed to collect from Twitter itself.
+        import tweepy
+        auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
+        auth.set_access_token(ACCESS_KEY, ACCESS_SECRET)
+        client = TweepyClient(auth)
+    else:
+        client = HttpTimelineClient(TIMELINE_SERVER)
+    # The requests are scheduled by the rate limits of the API, and a few
+    # timelines are fetched at the same time.
+    collector = TimelineCollector(client, RateLimiter(), CONCURRENCY)
 
-auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
-auth.set_access_token(ACCESS_KEY, ACCESS_SECRET)
-api = tweepy.API(auth)
+    # The start date and time of our data collection; 28 days before now
+    start_day = datetime.utcnow() - timedelta(days=28)
 
-# The start date and time of our data collection; 28 days before now
-start_day = datetime.utcnow() - timedelta(days=28)
+    # A run that stopped halfway is resumed, skipping the users it
+    # finished. Otherwise only the Tweets newer than the ones we have are
+    # fetched.
+    checkpoints = CheckpointStore(CHECKPOINT_FILE)
+    resumed = checkpoints.start_run()
+    if resumed:
+        print >> sys.stderr, 'Resuming run', checkpoints.run_id
+    output = CheckpointedOutput(
+        SegmentWriter(OUTPUT_DIRECTORY, 'tweets-' + checkpoints.run_id,
+                      checkpoints.segments if resumed else None),
+        checkpoints)
 
-user_list_file = gzip.open(USER_LIST, 'r')
-output_file = open(OUTPUT_FILE, 'w')
-for user_id in user_list_file:
-    user_id = user_id.rstrip()
-    # The ID of the earliest Tweet in the result batch
-    earliest_tweet_id = None
-    while True:
-        try:
-            if earliest_tweet_id is None:
-                # The first request for the user
-                timeline = api.user_timeline(id=user_id, include_rts=True,
-                                             count=MAX_ITEMS_PER_REQUEST)
-            else:
-                # There are possibly more recent Tweets than MAX_ITEMS_PER_REQUEST
-                timeline = api.user_timeline(id=user_id, include_rts=True,
-                                             count=MAX_ITEMS_PER_REQUEST,
-                                             max_id=earliest_tweet_id)
-        except Exception as e:
-            if e.response.status == 429:
-                # If we are rate limited, wait 60 seconds before retrying
-                # See https://developer.twitter.com/en/docs/basics/response-codes.html
-                time.sleep(60)
-                continue
-            else:
-                # In any other case do not retry to load user data
-                # This may be changed to cover other error conditions
-                print 'Could not access', user_id
-                break
-        tweet_count = 0
-        found_early_tweets = False
-        for tweet in timeline:
-            if tweet.created_at >= start_day:
-                output_file.write('\t'.join( \
-                    [str(f) for f in [user_id, tweet.id, tweet.created_at]]))
-                output_file.write('\n')
-                output_file.flush()
-            else:
-                found_early_tweets = True
-            if earliest_tweet_id is None or tweet.id < earliest_tweet_id:
-                earliest_tweet_id = tweet.id
-            tweet_count += 1
-        if tweet_count < MAX_ITEMS_PER_REQUEST or found_early_tweets:
-            # Finished with this user's Tweets if no more to download or we
-            # got back before start_day
-            break
-user_list_file.close()
-output_file.close()
+    user_list_file = gzip.open(USER_LIST, 'r')
+    user_ids = (user_id.rstrip() for user_id in user_list_file)
+    collector.collect(((user_id, checkpoints.since_id(user_id))
+                       for user_id in user_ids
+                       if not checkpoints.is_done(user_id)),
+                      start_day, output.write, output.done)
+    user_list_file.close()
+    output.close()
+    checkpoints.finish_run()
@@ -0,0 +1,32 @@
+'''
+Rewrite the time-sorted Wikipedia revision file into independently
+compressed blocks, and build the index that lets the scripts start reading
+at the beginning of their date range instead of at the start of the file.
+
+Files written by src/chapter1/sort_revisions_by_time.py already have this
+layout; this is for files sorted by other means, e.g. by
+src/chapter3/wikipedia_sort_by_time.sh.
+
+Run as
+python src/chapter1/index_revisions_by_time.py [time-sorted revision file]
+'''
+
+import sys, os
+
+sys.path.append('src/python')
+from time_index import rewrite_with_index
+
+
+INPUT_FILE = 'data/wikipedia/revisions_time_sorted.tsv.gz'
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        input_file_name = sys.argv[1]
+    else:
+        input_file_name = INPUT_FILE
+
+    temp_file_name = input_file_name + '.blocks'
+    rewrite_with_index(input_file_name, temp_file_name)
+    os.rename(temp_file_name, input_file_name)
+    os.rename(temp_file_name + '.idx', input_file_name + '.idx')
@@ -0,0 +1,136 @@
+'''
+A local mock of the statuses/user_timeline API of Twitter, to run the
+timeline collector offline.
+
+Every numeric user ID has a made-up, but always the same, timeline. The
+server enforces a rate limit with the x-rate-limit-* headers and HTTP 429
+responses, fails some of the requests with HTTP 503, and answers HTTP 404
+for some of the users, so that the retries of the collector are exercised.
+
+Run as
+python src/chapter1/mock_timeline_server.py [port]
+
+and set TIMELINE_SERVER in src/chapter1/get_users_tweets.py to
+http://localhost:<port>.
+'''
+
+import sys, json, random, threading, time, urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+PORT = 8765
+
+# The rate limit and its window in seconds.
+RATE_LIMIT = 900
+RATE_LIMIT_WINDOW = 15 * 60
+# The probability that a request fails with a server error.
+ERROR_RATE = 0.02
+# The most Tweets that the API returns for a user.
+MAX_TIMELINE_LENGTH = 3200
+# The users whose ID is divisible by this do not exist.
+MISSING_USERS_MODULUS = 97
+
+CREATED_AT_FORMAT = '%a %b %d %H:%M:%S +0000 %Y'
+
+
+def user_timeline(user_id, now):
+    '''The (ID, epoch time) of the Tweets of a user, newest first.'''
+    generator = random.Random(user_id)
+    tweet_count = min(int(generator.paretovariate(1.2)) - 1,
+                      MAX_TIMELINE_LENGTH)
+    tweets = []
+    created_at = now
+    for i in xrange(0, tweet_count):
+        created_at -= int(generator.expovariate(1.0 / (6 * 3600))) + 1
+        tweets.append((user_id * 1000000 + tweet_count - i, created_at))
+    return tweets
+
+
+class RateLimitWindow():
+    '''Count the requests in fixed windows.'''
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self._reset = time.time() + window
+        self._remaining = limit
+        self._lock = threading.Lock()
+
+    def request(self):
+        '''Register a request; return whether it is allowed, and the
+           remaining count and reset time after it.'''
+        with self._lock:
+            now = time.time()
+            if now >= self._reset:
+                self._reset = now + self.window
+                self._remaining = self.limit
+            if self._remaining == 0:
+                return False, 0, int(self._reset)
+            self._remaining -= 1
+            return True, self._remaining, int(self._reset)
+
+
+class TimelineHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        if url.path != '/1.1/statuses/user_timeline.json':
+            return self._respond(404, [])
+        parameters = dict(urlparse.parse_qsl(url.query))
+        allowed, remaining, reset = self.server.rate_limit.request()
+        headers = {'x-rate-limit-limit': self.server.rate_limit.limit,
+                   'x-rate-limit-remaining': remaining,
+                   'x-rate-limit-reset': reset}
+        if not allowed:
+            return self._respond(429, {'errors': [{'code': 88}]}, headers)
+        if random.random() < self.server.error_rate:
+            return self._respond(503, {'errors': []}, headers)
+        user_id = int(parameters['user_id'])
+        if user_id % MISSING_USERS_MODULUS == 0:
+            return self._respond(404, {'errors': [{'code': 34}]}, headers)
+        count = int(parameters.get('count', 20))
+        max_id = parameters.get('max_id')
+        since_id = parameters.get('since_id')
+        statuses = []
+        for tweet_id, created_at in user_timeline(user_id, self.server.now):
+            if max_id is not None and tweet_id > int(max_id):
+                continue
+            if since_id is not None and tweet_id <= int(since_id):
+                break
+            statuses.append({'id': tweet_id, 'created_at': time.strftime(
+                CREATED_AT_FORMAT, time.gmtime(created_at))})
+            if len(statuses) == count:
+                break
+        self._respond(200, statuses, headers)
+
+    def _respond(self, code, body, headers={}):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in headers.iteritems():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(json.dumps(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockTimelineServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=PORT, rate_limit=RATE_LIMIT,
+                 rate_limit_window=RATE_LIMIT_WINDOW, error_rate=ERROR_RATE):
+        HTTPServer.__init__(self, ('localhost', port), TimelineHandler)
+        self.rate_limit = RateLimitWindow(rate_limit, rate_limit_window)
+        self.error_rate = error_rate
+        # The time of the newest Tweets.
+        self.now = int(time.time())
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    else:
+        port = PORT
+    MockTimelineServer(port).serve_forever()
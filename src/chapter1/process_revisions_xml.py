@@ -1,6 +1,17 @@
 '''
-Count the number of times users contributed to some kind of content
-within the given time frame.
+Extract the revisions of the Wikipedia stub-meta-history dump into a
+tab-separated file with a row per revision: the page title, namespace and
+ID, the revision ID and timestamp, and the user ID, name and IP address.
+
+Run as
+python src/chapter1/process_revisions_xml.py [processes]
+to parse INPUT_FILE into OUTPUT_FILE with PROCESSES processes by default.
+With a single process the SAX parser runs over the whole dump as a stream.
+With more, the dump is cut into chunks of about CHUNK_SIZE uncompressed
+bytes at <page> boundaries, the worker processes parse the chunks, and
+their rows are written in the order of the dump, so the output is the same
+as in the serial mode. src/chapter1/check_process_revisions.py checks that
+on a synthetic dump.
 
 This script assumes that the Wikipedia page revision history dataset
 has been downloaded by running the src/chapter2/wikipedia/get_data.sh script.
@@ -9,13 +20,29 @@ Documentation for the XML fields can be found at
 http://www.mediawiki.org/wiki/Manual:Revision_table
 '''
 
-import gzip
-from xml.sax import make_parser, handler
+import gzip, sys
+import multiprocessing
+from collections import deque
+from cStringIO import StringIO
+from xml.sax import make_parser, parseString, handler
+
+sys.path.append('src/python')
+from parallel_gzip import GzipReader, GzipWriter, GzipIndex
 
 
 INPUT_FILE = 'data/wikipedia/enwiki-stub-meta-history.xml.gz'
 OUTPUT_FILE = 'data/wikipedia/revisions.tsv.gz'
 
+# The number of worker processes parsing the dump in parallel; with a single
+# process we run the SAX parser over the whole file as a stream.
+PROCESSES = multiprocessing.cpu_count()
+# The approximate size of the uncompressed XML chunks, always cut at <page>
+# boundaries, that we hand to the workers.
+CHUNK_SIZE = 32 * 1024 * 1024
+# Whether to emit every revision as soon as it is closed instead of building
+# up the whole page in memory first.
+STREAMING = True
+
 
 class Node(dict):
     '''A Node object represents an XML node of interest to us.'''
@@ -80,6 +107,72 @@ class WikipediaXMLReader(handler.ContentHandler):
             self._current.get(self._store_into, '') + content
 
 
+class StreamingWikipediaXMLReader(handler.ContentHandler):
+    '''A reader that emits every revision as soon as its closing tag is seen.
+
+    Only the header fields of the current page and the fields of the current
+    revision and contributor are kept, so the memory use does not depend on
+    the number of revisions of a page. This relies on the page title,
+    namespace and ID preceding the revisions, as they do in the dumps.
+    '''
+
+    # The fields we keep for every kind of element.
+    FIELDS = {
+        'page': set(['title', 'ns', 'id']),
+        'revision': set(['id', 'timestamp']),
+        'contributor': set(['id', 'username', 'ip'])
+    }
+
+    def __init__(self, process_revision):
+        handler.ContentHandler.__init__(self)
+
+        # The callback function to be called with the page, revision and
+        # contributor fields when a revision is complete
+        self._process_revision = process_revision
+
+        self._page = dict()
+        self._revision = dict()
+        self._contributor = dict()
+
+        # The element whose fields we are collecting, and its name
+        self._fields = self._page
+        self._container = 'page'
+
+        # The field we are reading and its character content in pieces
+        self._store_into = None
+        self._content = []
+
+    def startElement(self, name, attrs):
+        if name == 'page':
+            self._page.clear()
+            self._fields, self._container = self._page, name
+        elif name == 'revision':
+            self._revision.clear()
+            self._contributor.clear()
+            self._fields, self._container = self._revision, name
+        elif name == 'contributor':
+            self._fields, self._container = self._contributor, name
+        self._store_into = None
+        if name in StreamingWikipediaXMLReader.FIELDS[self._container]:
+            self._store_into = name
+            self._content = []
+
+    def endElement(self, name):
+        if self._store_into is not None:
+            self._fields[self._store_into] = ''.join(self._content)
+            self._store_into = None
+        if name == 'revision':
+            self._process_revision(self._page, self._revision,
+                                   self._contributor)
+            self._fields, self._container = self._page, 'page'
+        elif name == 'contributor':
+            self._fields, self._container = self._revision, 'revision'
+
+    def characters(self, content):
+        if self._store_into is not None:
+            self._content.append(content)
+
+
 class ProcessRevisions():
     '''Process the revision data.'''
 
@@ -92,28 +185,142 @@ class ProcessRevisions():
                 contributor = dict()
             else:
                 contributor = rev.children[0]
-            self._output.write('\t'.join([
-                page.get('title', ''),
-                page.get('ns', ''),
-                page.get('id', ''),
-                rev.get('id', ''),
-                rev.get('timestamp', ''),
-                contributor.get('id', ''),
-                contributor.get('username', ''),
-                contributor.get('ip' , '')
-            ]).encode('utf-8'))
-            self._output.write('\n')
-
-
-input_file = gzip.open(INPUT_FILE, 'r')
-output_file = gzip.open(OUTPUT_FILE, 'w')
-
-# This is the object to process every Wikipedia edit revision
-process_revisions = ProcessRevisions(output_file)
-
-parser = make_parser()
-parser.setContentHandler(WikipediaXMLReader(process_revisions.process_revision))
-parser.parse(input_file)
-
-input_file.close()
-output_file.close()
+            self.write_revision(page, rev, contributor)
+
+    def write_revision(self, page, rev, contributor):
+        '''Write out a single revision, this is the callback for the
+           streaming reader.'''
+        self._output.write('\t'.join([
+            page.get('title', ''),
+            page.get('ns', ''),
+            page.get('id', ''),
+            rev.get('id', ''),
+            rev.get('timestamp', ''),
+            contributor.get('id', ''),
+            contributor.get('username', ''),
+            contributor.get('ip' , '')
+        ]).encode('utf-8'))
+        self._output.write('\n')
+
+
+def create_reader(process_revisions, streaming=STREAMING):
+    '''Create the SAX content handler that feeds `process_revisions`.'''
+    if streaming:
+        return StreamingWikipediaXMLReader(process_revisions.write_revision)
+    else:
+        return WikipediaXMLReader(process_revisions.process_revision)
+
+
+def page_chunks(input_file, chunk_size=CHUNK_SIZE):
+    '''Split the XML dump into chunks that consist of whole <page> elements.
+
+    The header of the dump (the <siteinfo> section) and the closing tag of the
+    root element are dropped. A '<' in the character data is always escaped
+    in XML, so it is safe to look for the page tags in the raw text.
+    '''
+    buffered = ''
+    found_first_page = False
+    while True:
+        block = input_file.read(chunk_size)
+        if not block:
+            break
+        buffered += block
+        if not found_first_page:
+            begin = buffered.find('<page>')
+            if begin < 0:
+                # Keep the tail in case the tag is split between two blocks.
+                buffered = buffered[-len('<page>'):]
+                continue
+            buffered = buffered[begin:]
+            found_first_page = True
+        end = buffered.rfind('</page>')
+        if end >= 0:
+            end += len('</page>')
+            yield buffered[:end]
+            buffered = buffered[end:]
+
+
+def process_chunk(chunk):
+    '''Parse a chunk of pages and return the rows as a gzip member, and
+       their length.
+
+    Concatenated gzip members form a valid gzip file, so the results of the
+    workers can be written one after the other into the output file.
+    '''
+    rows = StringIO()
+    process_revisions = ProcessRevisions(rows)
+    parseString('<mediawiki>' + chunk + '</mediawiki>',
+                create_reader(process_revisions))
+    member = StringIO()
+    compressed = gzip.GzipFile(fileobj=member, mode='wb')
+    compressed.write(rows.getvalue())
+    compressed.close()
+    return member.getvalue(), rows.tell()
+
+
+def process_serial(input_file_name, output_file_name):
+    '''Run the SAX parser over the whole dump in the current process.'''
+    input_file = GzipReader(input_file_name)
+    # The revisions are read again by the later steps, in parallel with the
+    # index.
+    output_file = GzipWriter(output_file_name, index=True)
+
+    # This is the object to process every Wikipedia edit revision
+    process_revisions = ProcessRevisions(output_file)
+
+    parser = make_parser()
+    parser.setContentHandler(create_reader(process_revisions))
+    parser.parse(input_file)
+
+    input_file.close()
+    output_file.close()
+
+
+def process_parallel(input_file_name, output_file_name, processes,
+                     chunk_size=CHUNK_SIZE):
+    '''Parse chunks of the dump in a pool of worker processes.
+
+    The output rows are written in the same order as in the serial case, and
+    we only keep a bounded number of chunks in flight so that the memory use
+    does not depend on how far the decompression gets ahead of the workers.
+    The chunks end with whole lines, so the members of the output are
+    indexed like the ones GzipWriter writes.
+    '''
+    input_file = GzipReader(input_file_name)
+    output_file = open(output_file_name, 'wb')
+    # The compressed and uncompressed offsets of the members
+    offsets, positions = [0], [0]
+
+    def write_member(result):
+        member, length = result.get()
+        output_file.write(member)
+        offsets.append(offsets[-1] + len(member))
+        positions.append(positions[-1] + length)
+
+    pool = multiprocessing.Pool(processes)
+    in_flight = deque()
+    for chunk in page_chunks(input_file, chunk_size):
+        in_flight.append(pool.apply_async(process_chunk, (chunk,)))
+        if len(in_flight) >= 2 * processes:
+            write_member(in_flight.popleft())
+    while in_flight:
+        write_member(in_flight.popleft())
+    pool.close()
+    pool.join()
+    input_file.close()
+    output_file.close()
+    if len(offsets) > 1:
+        GzipIndex(offsets, positions,
+                  [True] * len(offsets)).save(output_file_name)
+
+
+if __name__ == '__main__':
+    # The number of processes can be given as the first argument.
+    if len(sys.argv) > 1:
+        processes = int(sys.argv[1])
+    else:
+        processes = PROCESSES
+    if processes > 1:
+        process_parallel(INPUT_FILE, OUTPUT_FILE, processes)
+    else:
+        process_serial(INPUT_FILE, OUTPUT_FILE)
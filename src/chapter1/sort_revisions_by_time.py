@@ -0,0 +1,206 @@
+'''
+Sort the Wikipedia revision file by the time of the revisions, producing
+the revisions_time_sorted.tsv.gz file that the scripts of chapters 2 and 3
+expect.
+
+This is an external merge sort with bounded memory use: the input is cut
+into blocks that are sorted in a pool of worker processes and written into
+compressed temporary run files, and then the runs are merged with a k-way
+heap merge. Revisions with the same timestamp stay in their original order.
+The output is written in independently compressed blocks with a time index
+(see src/python/time_index.py), so that readers can seek to a date range.
+It is an alternative to src/chapter3/wikipedia_sort_by_time.sh for machines
+without GNU sort and pigz, or with little temporary disk space.
+
+Run as
+python src/chapter1/sort_revisions_by_time.py [memory limit in MB]
+'''
+
+import sys, gzip, heapq, os, shutil, tempfile
+import multiprocessing
+from collections import deque
+
+sys.path.append('src/python')
+from parallel_gzip import GzipReader
+from time_index import BlockGzipWriter
+
+
+INPUT_FILE = 'data/wikipedia/revisions.tsv.gz'
+OUTPUT_FILE = 'data/wikipedia/revisions_time_sorted.tsv.gz'
+
+# The number of worker processes sorting the runs.
+PROCESSES = multiprocessing.cpu_count()
+# The approximate memory we may use in total, in bytes. The sorted lines take
+# a few times more memory than their text, so a run is only a fraction of it.
+MEMORY_LIMIT = 2 * 1024 ** 3
+# Where to put the temporary run files; None is the system default.
+TEMP_DIRECTORY = None
+# The largest amount of compressed temporary data we may write, in bytes.
+TEMP_SPACE_LIMIT = 100 * 1024 ** 3
+# The maximum number of runs merged at once; with more runs than this we merge
+# them in several passes.
+MERGE_FAN_IN = 64
+# The compression level of the temporary files, we favor speed.
+TEMP_COMPRESS_LEVEL = 1
+
+
+def timestamp_of(line):
+    '''The timestamp is the fifth field of a revision line.'''
+    return line.split('\t', 5)[4]
+
+
+def line_blocks(input_file, block_size):
+    '''Read the input in blocks of about block_size bytes of whole lines.'''
+    rest = ''
+    while True:
+        data = input_file.read(block_size)
+        if not data:
+            if rest:
+                yield rest + '\n'
+            break
+        data = rest + data
+        end = data.rfind('\n') + 1
+        rest = data[end:]
+        if end > 0:
+            yield data[:end]
+
+
+def sort_run(args):
+    '''Sort a block of lines by time, and write it into a run file.'''
+    block, run_file = args
+    lines = block.split('\n')
+    lines.pop()
+    # The sort is stable, so we keep the input order for equal timestamps.
+    lines.sort(key=timestamp_of)
+    with gzip.open(run_file, 'wb', TEMP_COMPRESS_LEVEL) as f:
+        f.write('\n'.join(lines))
+        f.write('\n')
+    return len(lines)
+
+
+def read_run(run_file, run_index):
+    '''Iterate over a run decorated with the keys for the merge.
+
+    The run index breaks the ties between equal timestamps so that the
+    merge keeps the original order of the runs.
+    '''
+    with gzip.open(run_file, 'rb') as f:
+        for line in f:
+            yield (timestamp_of(line), run_index, line)
+
+
+class ExternalSort():
+    '''Sort the lines of a revision file by time with bounded memory use.'''
+
+    def __init__(self, processes=PROCESSES, memory_limit=MEMORY_LIMIT,
+                 temp_directory=TEMP_DIRECTORY,
+                 temp_space_limit=TEMP_SPACE_LIMIT, fan_in=MERGE_FAN_IN):
+        self.processes = processes
+        # A run takes about four times its text size while it is being
+        # sorted, and we keep two runs in flight per process.
+        self.run_size = max(1, memory_limit / (8 * processes))
+        self.temp_directory = temp_directory
+        self.temp_space_limit = temp_space_limit
+        self.fan_in = fan_in
+        self._run_count = 0
+        self._temp_space = 0
+
+    def _progress(self, message):
+        sys.stderr.write(message + '    \r')
+
+    def _new_run_file(self):
+        self._run_count += 1
+        return os.path.join(self._directory, 'run-%06d.gz' % self._run_count)
+
+    def _register(self, run_file):
+        '''Keep track of the temporary space used.'''
+        self._temp_space += os.path.getsize(run_file)
+        if self._temp_space > self.temp_space_limit:
+            raise IOError('The temporary files exceed %d bytes' %
+                          self.temp_space_limit)
+
+    def _remove(self, run_file):
+        self._temp_space -= os.path.getsize(run_file)
+        os.remove(run_file)
+
+    def _create_runs(self, input_file):
+        '''Sort the blocks of the input in parallel and return the runs.'''
+        runs = []
+        lines_sorted = 0
+        pool = multiprocessing.Pool(self.processes)
+        in_flight = deque()
+
+        def finish_oldest():
+            run_file, result = in_flight.popleft()
+            lines = result.get()
+            self._register(run_file)
+            runs.append(run_file)
+            return lines
+
+        for block in line_blocks(input_file, self.run_size):
+            run_file = self._new_run_file()
+            in_flight.append(
+                (run_file, pool.apply_async(sort_run, ((block, run_file),))))
+            del block
+            if len(in_flight) >= 2 * self.processes:
+                lines_sorted += finish_oldest()
+                self._progress('Sorted %.1fM lines in %d runs' %
+                               (lines_sorted / 1e6, len(runs)))
+        while in_flight:
+            lines_sorted += finish_oldest()
+        pool.close()
+        pool.join()
+        self._progress('Sorted %.1fM lines in %d runs' %
+                       (lines_sorted / 1e6, len(runs)))
+        sys.stderr.write('\n')
+        return runs
+
+    def _merge(self, runs, output_file):
+        '''Merge the runs into the output file with a heap.'''
+        merged = 0
+        for timestamp, run_index, line in heapq.merge(
+                *[read_run(run, i) for i, run in enumerate(runs)]):
+            output_file.write(line)
+            merged += 1
+            if merged % 1000000 == 0:
+                self._progress('Merged %.1fM lines' % (merged / 1e6))
+        return merged
+
+    def sort(self, input_file_name, output_file_name):
+        self._directory = tempfile.mkdtemp(prefix='revisions-sort-',
+                                           dir=self.temp_directory)
+        try:
+            with GzipReader(input_file_name) as input_file:
+                runs = self._create_runs(input_file)
+            # Merge consecutive groups of runs until we can merge all of
+            # them in one go; merging neighbors keeps the sort stable.
+            merge_pass = 0
+            while len(runs) > self.fan_in:
+                merge_pass += 1
+                merged_runs = []
+                for begin in xrange(0, len(runs), self.fan_in):
+                    group = runs[begin:begin + self.fan_in]
+                    run_file = self._new_run_file()
+                    with gzip.open(run_file, 'wb', TEMP_COMPRESS_LEVEL) as f:
+                        self._merge(group, f)
+                    self._register(run_file)
+                    for run in group:
+                        self._remove(run)
+                    merged_runs.append(run_file)
+                runs = merged_runs
+                sys.stderr.write('\nMerge pass %d: %d runs left\n' %
+                                 (merge_pass, len(runs)))
+            with BlockGzipWriter(output_file_name) as output_file:
+                merged = self._merge(runs, output_file)
+            sys.stderr.write('\nWrote %d lines\n' % merged)
+        finally:
+            shutil.rmtree(self._directory)
+
+
+if __name__ == '__main__':
+    # The memory limit can be given in megabytes as the first argument.
+    if len(sys.argv) > 1:
+        memory_limit = int(sys.argv[1]) * 1024 ** 2
+    else:
+        memory_limit = MEMORY_LIMIT
+    ExternalSort(memory_limit=memory_limit).sort(INPUT_FILE, OUTPUT_FILE)
@@ -0,0 +1,263 @@
+'''
+Keep track of the Tweets collected from every user, so that a collection can
+be resumed when it stops halfway, and so that a later run only asks for the
+Tweets that are newer than the ones we already have.
+
+The checkpoint file is an append-only log with tab-separated lines:
+
+run       <run ID>                    a run starts
+segment   <file name> <length>        the bytes of a segment file of the
+                                      current run that are committed
+user      <user ID> <newest ID> <ok>  a user is done in the current run,
+                                      'ok' or 'failed'
+finished  <run ID>                    the run has finished
+
+The Tweets go to gzip segment files in a directory. The Tweets of finished
+users are kept in memory and written out together as a single gzip member.
+Then the new length of the segment and the checkpoints of the users are
+written in one go to the log. A resumed run first cuts its segments back to
+their committed lengths, which drops the Tweets written after the last
+checkpoint, and any partly written member. So after a crash every user is
+either in the output and the checkpoints, or in neither and fetched again.
+The users whose fetch failed are fetched again when the run is resumed.
+
+The segment files of a run are named after its ID, the UTC time it started
+at. Only a resumed run touches segment files that already exist, and only
+its own; a new run does not start in the same second as the last one.
+'''
+
+import gzip, os, re, time
+
+
+# The number of finished users whose Tweets are written out together.
+COMMIT_USERS = 100
+# A new segment file is started when the current one reaches this size.
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+
+class CheckpointStore():
+    '''The newest collected Tweet ID of every user, and the users finished
+       in the current run.'''
+
+    def __init__(self, path):
+        self._path = path
+        # user ID -> the ID of the newest Tweet we have of the user
+        self.newest = dict()
+        # user ID -> the ID of the last run in which the user was finished
+        self._finished_in = dict()
+        # segment file name -> its committed length, in the current run
+        self.segments = dict()
+        self.run_id = None
+        self.finished = True
+        if os.path.exists(path):
+            self._load()
+        self._file = None
+
+    def _load(self):
+        with open(self._path, 'r') as checkpoint_file:
+            for line in checkpoint_file:
+                if not line.endswith('\n'):
+                    # A partly written line of a crashed run
+                    break
+                fields = line.rstrip('\n').split('\t')
+                if fields[0] == 'run':
+                    self.run_id = fields[1]
+                    self.finished = False
+                    self.segments = dict()
+                elif fields[0] == 'segment':
+                    self.segments[fields[1]] = int(fields[2])
+                elif fields[0] == 'user':
+                    user_id, newest = fields[1], fields[2]
+                    if newest:
+                        self.newest[user_id] = int(newest)
+                    if fields[3] == 'ok':
+                        self._finished_in[user_id] = self.run_id
+                elif fields[0] == 'finished':
+                    self.finished = True
+
+    def start_run(self):
+        '''Resume the last run if it did not finish, or start a new one.
+
+        Returns whether the last run is resumed.
+        '''
+        if not self.finished:
+            self._file = open(self._path, 'a')
+            return True
+        self._compact()
+        # The segments of the last run are named after its ID, so a new
+        # run must not get the same one.
+        last_run_id = self.run_id
+        while True:
+            self.run_id = time.strftime('%Y%m%d%H%M%S', time.gmtime())
+            if self.run_id != last_run_id:
+                break
+            time.sleep(1)
+        self.finished = False
+        self._file = open(self._path, 'a')
+        self._write(['run\t%s\n' % self.run_id])
+        return False
+
+    def _compact(self):
+        '''Rewrite the log with only the newest Tweet ID of every user, and
+           the ID of the last run.'''
+        if not os.path.exists(self._path):
+            return
+        temp_path = self._path + '.tmp'
+        with open(temp_path, 'w') as checkpoint_file:
+            for user_id, newest in self.newest.iteritems():
+                checkpoint_file.write('user\t%s\t%d\tok\n' % (user_id, newest))
+            if self.run_id is not None:
+                checkpoint_file.write('run\t%s\nfinished\t%s\n' %
+                                      (self.run_id, self.run_id))
+        os.rename(temp_path, self._path)
+        self._finished_in = dict()
+        self.segments = dict()
+
+    def is_done(self, user_id):
+        '''Whether the user has been finished in the current run.'''
+        return self.run_id is not None and \
+            self._finished_in.get(user_id) == self.run_id
+
+    def since_id(self, user_id):
+        return self.newest.get(user_id)
+
+    def record(self, users, segment=None):
+        '''Record the (user ID, newest Tweet ID, succeeded) of finished
+           users, and the (file name, length) of the segment their Tweets
+           were written to.'''
+        lines = []
+        if segment is not None:
+            self.segments[segment[0]] = segment[1]
+            lines.append('segment\t%s\t%d\n' % segment)
+        for user_id, newest, succeeded in users:
+            if newest is None:
+                # No new Tweets, so we keep what we had.
+                newest = self.newest.get(user_id)
+            if newest is not None:
+                self.newest[user_id] = newest
+            if succeeded:
+                self._finished_in[user_id] = self.run_id
+            lines.append('user\t%s\t%s\t%s\n' % (
+                user_id, '' if newest is None else newest,
+                'ok' if succeeded else 'failed'))
+        self._write(lines)
+
+    def finish_run(self):
+        self._write(['finished\t%s\n' % self.run_id])
+        self.finished = True
+        self._file.close()
+        self._file = None
+
+    def _write(self, lines):
+        self._file.write(''.join(lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+class SegmentWriter():
+    '''Write batches of lines as gzip members to files that are rotated by
+       size.'''
+
+    def __init__(self, directory, prefix, committed=None,
+                 segment_size=SEGMENT_SIZE):
+        '''committed holds the committed lengths of the segments of a
+           resumed run, as in CheckpointStore.segments, and is None for a
+           new run.'''
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._directory = directory
+        self._prefix = prefix
+        self._segment_size = segment_size
+        # A resumed run continues after the segments it already wrote, cut
+        # back to what was committed.
+        pattern = re.compile('^%s-(\\d+)\\.tsv\\.gz$' % re.escape(prefix))
+        numbers = []
+        for name in os.listdir(directory):
+            m = pattern.match(name)
+            if not m:
+                continue
+            path = os.path.join(directory, name)
+            if committed is None:
+                # These are the Tweets of another run.
+                raise IOError('%s already exists, the run ID %s is in use'
+                              % (path, prefix))
+            if name in committed:
+                with open(path, 'r+b') as f:
+                    f.truncate(committed[name])
+                numbers.append(int(m.group(1)))
+            else:
+                os.remove(path)
+        self._number = max(numbers) if numbers else 0
+        self._file = None
+
+    def write(self, data):
+        if self._file is None or self._file.tell() >= self._segment_size:
+            self._rotate()
+        member = gzip.GzipFile(fileobj=self._file, mode='wb')
+        member.write(data)
+        member.close()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def position(self):
+        '''The file name and the length of the current segment, or None.'''
+        if self._file is None:
+            return None
+        return os.path.basename(self._file.name), self._file.tell()
+
+    def _rotate(self):
+        self.close()
+        self._number += 1
+        self._file = open(os.path.join(
+            self._directory, '%s-%05d.tsv.gz' % (self._prefix, self._number)),
+            'wb')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CheckpointedOutput():
+    '''Collect the Tweets of the users, and write them out together with
+       their checkpoints every `commit_users` finished users.
+
+    Use write as the output and done as the done callback of
+    TimelineCollector.collect.
+    '''
+
+    def __init__(self, segments, checkpoints, commit_users=COMMIT_USERS):
+        self._segments = segments
+        self._checkpoints = checkpoints
+        self._commit_users = commit_users
+        # user ID -> the lines of the user not finished yet
+        self._pending = dict()
+        self._finished_lines = []
+        self._finished_users = []
+
+    def write(self, user_id, tweet):
+        self._pending.setdefault(user_id, []).append('\t'.join(
+            [str(f) for f in [user_id, tweet.id, tweet.created_at]]) + '\n')
+
+    def done(self, user_id, newest_tweet_id, succeeded):
+        lines = self._pending.pop(user_id, [])
+        if succeeded:
+            self._finished_lines.extend(lines)
+        self._finished_users.append((user_id, newest_tweet_id, succeeded))
+        if len(self._finished_users) >= self._commit_users:
+            self.commit()
+
+    def commit(self):
+        '''Write the Tweets of the finished users, then their checkpoints
+           with the new length of the segment.'''
+        segment = None
+        if self._finished_lines:
+            self._segments.write(''.join(self._finished_lines))
+            segment = self._segments.position()
+        self._checkpoints.record(self._finished_users, segment)
+        self._finished_lines = []
+        self._finished_users = []
+
+    def close(self):
+        self.commit()
+        self._segments.close()
@@ -0,0 +1,354 @@
+'''
+Collect the recent Tweets of many users concurrently while staying within
+the rate limits of the Twitter API.
+
+The requests go through a token bucket that refills at the rate allowed by
+the API, and that is corrected by the rate limit headers of the responses.
+A bounded number of worker threads fetch the timelines, and failed requests
+are retried with jittered exponential backoff.
+
+The API is accessed through a client object, so that the collector can also
+be run offline against src/chapter1/mock_timeline_server.py:
+TweepyClient uses tweepy, and HttpTimelineClient talks to any server that
+speaks the JSON API of statuses/user_timeline.
+'''
+
+import json, random, sys, threading, time, urllib, urllib2
+import Queue
+from datetime import datetime
+# The first use of strptime is not thread-safe unless this is imported.
+import _strptime
+
+
+# The maximum number of Tweets we can ask for in one request
+# See https://developer.twitter.com/en/docs/tweets/timelines/api-reference/get-statuses-user_timeline.html
+MAX_ITEMS_PER_REQUEST = 200
+
+# The number of requests allowed in a rate limit window, and its length in
+# seconds, for user_timeline with user authentication.
+RATE_LIMIT = 900
+RATE_LIMIT_WINDOW = 15 * 60
+
+# The number of timelines fetched at the same time.
+CONCURRENCY = 8
+# The number of times a failed request is retried, and the base of the
+# exponential backoff in seconds.
+MAX_RETRIES = 5
+BACKOFF = 1.0
+# The number of times a request waits for the rate limit to be reset before
+# the user is given up on.
+MAX_RATE_LIMIT_WAITS = 3
+
+# The format of the created_at field in the JSON API.
+CREATED_AT_FORMAT = '%a %b %d %H:%M:%S +0000 %Y'
+
+
+class TimelineError(Exception):
+    '''A request for a timeline failed, and it should not be retried.'''
+
+
+class TransientTimelineError(TimelineError):
+    '''A request failed, but it may succeed if retried.'''
+
+
+class RateLimitError(TransientTimelineError):
+    '''We hit the rate limit, and it is reset at the epoch time `reset`.'''
+
+    def __init__(self, reset):
+        TransientTimelineError.__init__(self, 'Rate limited until %s' % reset)
+        self.reset = reset
+
+
+class Tweet():
+    '''The fields of a Tweet we keep.'''
+
+    def __init__(self, id, created_at):
+        self.id = id
+        self.created_at = created_at
+
+
+class RateLimiter():
+    '''A token bucket for the API requests.
+
+    The bucket holds at most `limit` tokens and refills at limit / window
+    tokens per second. The rate limit headers of the responses tell us how
+    many requests we have left until the window is reset, so we never use
+    more tokens than that, and wait for the reset when there are none left.
+    '''
+
+    def __init__(self, limit=RATE_LIMIT, window=RATE_LIMIT_WINDOW,
+                 clock=time.time, sleep=time.sleep):
+        self._limit = limit
+        self._window = window
+        self._rate = float(limit) / window
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(limit)
+        self._last_refill = clock()
+        # The end of the window when the server told us we have no requests
+        # left.
+        self._blocked_until = None
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if self._blocked_until is not None:
+            if now < self._blocked_until:
+                self._last_refill = now
+                return
+            # A new window has begun.
+            self._blocked_until = None
+            self._tokens = float(self._limit)
+        self._tokens = min(self._limit,
+                           self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+    def acquire(self):
+        '''Wait until we can make a request.'''
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                if self._blocked_until is not None:
+                    wait = self._blocked_until - now
+                else:
+                    wait = (1 - self._tokens) / self._rate
+            self._sleep(max(wait, 0.01))
+
+    def update(self, limit=None, remaining=None, reset=None):
+        '''Correct the bucket with the rate limit headers of a response.'''
+        with self._lock:
+            if limit is not None and limit != self._limit:
+                self._limit = limit
+                self._rate = float(limit) / self._window
+            if remaining is not None:
+                self._tokens = min(self._tokens, remaining)
+                if remaining == 0 and reset is not None:
+                    self._blocked_until = reset
+
+    def update_from_headers(self, headers):
+        '''Take the x-rate-limit-* headers, given as a dict with lower case
+           keys, into account.'''
+        values = []
+        for name in ['limit', 'remaining', 'reset']:
+            value = headers.get('x-rate-limit-' + name)
+            values.append(int(value) if value is not None else None)
+        self.update(*values)
+
+
+class HttpTimelineClient():
+    '''Fetch the timelines from a server with the JSON API of Twitter, such
+       as the mock timeline server.'''
+
+    def __init__(self, base_url, timeout=30):
+        self._base_url = base_url.rstrip('/')
+        self._timeout = timeout
+
+    def user_timeline(self, user_id, count, max_id=None, since_id=None):
+        '''Return the list of Tweets and the response headers.'''
+        parameters = {'user_id': user_id, 'count': count, 'include_rts': 1}
+        if max_id is not None:
+            parameters['max_id'] = max_id
+        if since_id is not None:
+            parameters['since_id'] = since_id
+        url = '%s/1.1/statuses/user_timeline.json?%s' % (
+            self._base_url, urllib.urlencode(parameters))
+        try:
+            response = urllib2.urlopen(url, timeout=self._timeout)
+        except urllib2.HTTPError as e:
+            headers = dict((k.lower(), v) for k, v in e.headers.items())
+            if e.code == 429:
+                raise RateLimitError(int(headers.get('x-rate-limit-reset',
+                                                     time.time() + 60)))
+            elif e.code >= 500:
+                raise TransientTimelineError('HTTP %d' % e.code)
+            raise TimelineError('HTTP %d' % e.code)
+        except (urllib2.URLError, IOError) as e:
+            raise TransientTimelineError(str(e))
+        headers = dict((k.lower(), v) for k, v in response.info().items())
+        tweets = [Tweet(status['id'],
+                        datetime.strptime(status['created_at'],
+                                          CREATED_AT_FORMAT))
+                  for status in json.load(response)]
+        return tweets, headers
+
+
+class TweepyClient():
+    '''Fetch the timelines through tweepy, with a separate API object for
+       every thread so that their responses do not get mixed up.'''
+
+    def __init__(self, auth):
+        self._auth = auth
+        self._local = threading.local()
+
+    def _api(self):
+        if not hasattr(self._local, 'api'):
+            import tweepy
+            self._local.api = tweepy.API(self._auth)
+        return self._local.api
+
+    def user_timeline(self, user_id, count, max_id=None, since_id=None):
+        api = self._api()
+        parameters = {'id': user_id, 'include_rts': True, 'count': count}
+        if max_id is not None:
+            parameters['max_id'] = max_id
+        if since_id is not None:
+            parameters['since_id'] = since_id
+        try:
+            timeline = api.user_timeline(**parameters)
+        except Exception as e:
+            response = getattr(e, 'response', None)
+            status = getattr(response, 'status_code',
+                             getattr(response, 'status', None))
+            if status == 429:
+                reset = response.headers.get('x-rate-limit-reset')
+                raise RateLimitError(int(reset) if reset is not None
+                                     else int(time.time()) + 60)
+            elif status is None or status >= 500:
+                raise TransientTimelineError(str(e))
+            raise TimelineError(str(e))
+        headers = dict()
+        if getattr(api, 'last_response', None) is not None:
+            headers = dict((k.lower(), v)
+                           for k, v in api.last_response.headers.items())
+        return [Tweet(tweet.id, tweet.created_at) for tweet in timeline], headers
+
+
+class TimelineCollector():
+    '''Fetch the timelines of many users with a pool of threads.'''
+
+    def __init__(self, client, rate_limiter=None, concurrency=CONCURRENCY,
+                 max_retries=MAX_RETRIES, backoff=BACKOFF, sleep=time.sleep,
+                 max_rate_limit_waits=MAX_RATE_LIMIT_WAITS):
+        self._client = client
+        self._rate_limiter = rate_limiter or RateLimiter()
+        self._concurrency = concurrency
+        self._max_retries = max_retries
+        self._max_rate_limit_waits = max_rate_limit_waits
+        self._backoff = backoff
+        self._sleep = sleep
+        self._output_lock = threading.Lock()
+
+    def _request(self, user_id, max_id, since_id):
+        '''Make a request, retrying it if it fails temporarily.'''
+        failures = 0
+        rate_limit_waits = 0
+        while True:
+            self._rate_limiter.acquire()
+            try:
+                tweets, headers = self._client.user_timeline(
+                    user_id, MAX_ITEMS_PER_REQUEST, max_id, since_id)
+            except RateLimitError as e:
+                # Wait for the reset, this does not count as a failure, but
+                # a server that keeps limiting us would keep us here.
+                rate_limit_waits += 1
+                if rate_limit_waits > self._max_rate_limit_waits:
+                    raise
+                self._rate_limiter.update(remaining=0, reset=e.reset)
+                continue
+            except TransientTimelineError:
+                failures += 1
+                if failures > self._max_retries:
+                    raise
+                # Exponential backoff with full jitter.
+                self._sleep(random.uniform(0, self._backoff * 2 ** failures))
+                continue
+            self._rate_limiter.update_from_headers(headers)
+            return tweets
+
+    def collect_user(self, user_id, start_time, output, since_id=None):
+        '''Fetch the Tweets of a user since start_time, or newer than the
+           Tweet since_id, and call output(user_id, tweet) with them.
+
+        Returns the ID of the newest Tweet seen, or None.
+        '''
+        # The ID of the earliest Tweet in the result batch
+        earliest_tweet_id = None
+        newest_tweet_id = None
+        while True:
+            if earliest_tweet_id is None:
+                timeline = self._request(user_id, None, since_id)
+            else:
+                # There are possibly more Tweets than MAX_ITEMS_PER_REQUEST
+                timeline = self._request(user_id, earliest_tweet_id - 1,
+                                         since_id)
+            found_early_tweets = False
+            with self._output_lock:
+                for tweet in timeline:
+                    if tweet.created_at >= start_time:
+                        output(user_id, tweet)
+                    else:
+                        found_early_tweets = True
+                    if earliest_tweet_id is None or \
+                    tweet.id < earliest_tweet_id:
+                        earliest_tweet_id = tweet.id
+                    if newest_tweet_id is None or tweet.id > newest_tweet_id:
+                        newest_tweet_id = tweet.id
+            if len(timeline) < MAX_ITEMS_PER_REQUEST or found_early_tweets:
+                # Finished with this user's Tweets if no more to download or
+                # we got back before start_time
+                return newest_tweet_id
+
+    def _work(self, users, start_time, output, done, errors):
+        while True:
+            item = users.get()
+            if item is None:
+                break
+            if errors:
+                # Another worker failed, only empty the queue.
+                continue
+            user_id, since_id = item
+            try:
+                try:
+                    newest = self.collect_user(user_id, start_time, output,
+                                               since_id)
+                except TimelineError:
+                    # The API did not give us the timeline, do not retry to
+                    # load user data
+                    done(user_id, None, False)
+                else:
+                    done(user_id, newest, True)
+            except Exception:
+                # Writing the output failed, or a bug; collect raises it.
+                errors.append(sys.exc_info())
+
+    def collect(self, user_ids, start_time, output, done=None):
+        '''Collect the timelines of the users in parallel.
+
+        user_ids may also yield (user_id, since_id) pairs. done(user_id,
+        newest_tweet_id, succeeded) is called when a user is finished. An
+        error other than a failed request, such as one writing the output,
+        stops the collection and is raised here.
+        '''
+        def report(user_id, newest_tweet_id, succeeded):
+            with self._output_lock:
+                if not succeeded:
+                    print 'Could not access', user_id
+                if done is not None:
+                    done(user_id, newest_tweet_id, succeeded)
+
+        # The queue is bounded so that we do not read all users at once.
+        users = Queue.Queue(2 * self._concurrency)
+        errors = []
+        workers = [threading.Thread(target=self._work,
+                                    args=(users, start_time, output, report,
+                                          errors))
+                   for i in xrange(self._concurrency)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for user_id in user_ids:
+            if errors:
+                break
+            if not isinstance(user_id, tuple):
+                user_id = (user_id, None)
+            users.put(user_id)
+        for worker in workers:
+            users.put(None)
+        for worker in workers:
+            worker.join()
+        if errors:
+            error_type, error, stack = errors[0]
+            raise error_type, error, stack
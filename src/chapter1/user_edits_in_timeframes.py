@@ -1,41 +1,53 @@
 '''
 Count the number of times particular users made edit in the given time frames.
+
+The edit times of all users are indexed once and saved into INDEX_DIRECTORY,
+so counting the edits in a new set of time frames does not need to read the
+revisions again.
 '''
 
-import gzip
-from collections import defaultdict
+import sys
+import numpy as np
+
+sys.path.append('src/python')
+from parallel_gzip import GzipWriter
+from revision_store import open_revisions
+from timestamps import parse_timestamp
+from user_edit_index import UserEditIndex
 
 
 INPUT_FILE = 'data/wikipedia/revisions.tsv.gz'
 OUTPUT_FILE = 'data/wikipedia/user_edits_in_timeframes.tsv.gz'
+INDEX_DIRECTORY = 'data/wikipedia/user_edit_index'
 
 DATE_RANGES = [('2013-01-01T00:00:00', '2013-02-01T00:00:00'),
                ('2013-01-01T00:00:00', '2013-03-01T00:00:00'),
                ('2013-01-01T00:00:00', '2013-04-01T00:00:00')]
 
-
-# The number of times a user made a revision in a given date range.
-user_frequencies = defaultdict(lambda: defaultdict(int))
-
-user_names = dict()
-with gzip.open(INPUT_FILE, 'r') as input_file:
-    for line in input_file:
-        title, namespace, page_id, rev_id, timestamp, user_id, user_name, ip = \
-            line[:-1].split('\t')
-        # We only keep registered users, and need to strip user ID 0 due to
-        # an early logging bug (http://en.wikipedia.org/wiki/User:0).
-        if user_id != '' and user_id != '0':
-            for range_id in xrange(0, len(DATE_RANGES)):
-                if timestamp >= DATE_RANGES[range_id][0] and \
-                timestamp < DATE_RANGES[range_id][1]:
-                    user_frequencies[user_id][range_id] += 1
-                    user_names[user_id] = user_name
-
-with gzip.open(OUTPUT_FILE, 'w') as output_file:
-    for user_id in user_frequencies.iterkeys():
-        output_file.write('\t'.join(
-            [user_names[user_id]] + \
-            [str(user_frequencies[user_id].get(range_id, 0)) \
-             for range_id in xrange(0, len(DATE_RANGES))
-             ]))
-        output_file.write('\n')
+# The number of users whose counts we calculate at once.
+USERS_PER_BATCH = 100000
+
+
+# The index is rebuilt if the input file has changed since it was saved.
+index = UserEditIndex.load(INDEX_DIRECTORY, INPUT_FILE)
+if index is None:
+    # Read the columnar store of the input file if it has been built.
+    index = UserEditIndex.from_revisions(open_revisions(INPUT_FILE))
+    index.save(INDEX_DIRECTORY, INPUT_FILE)
+
+# The date ranges in epoch seconds.
+date_ranges = [(parse_timestamp(begin), parse_timestamp(end))
+               for begin, end in DATE_RANGES]
+
+with GzipWriter(OUTPUT_FILE) as output_file:
+    for first in xrange(0, len(index), USERS_PER_BATCH):
+        users = np.arange(first, min(first + USERS_PER_BATCH, len(index)))
+        # The number of times the users made a revision in the date ranges.
+        counts = index.counts(date_ranges, users)
+        # We only write out the users who edited in any of the ranges, with
+        # the name of their last edit in them.
+        active = counts.sum(axis=1) > 0
+        names = index.names_in_ranges(date_ranges, users[active])
+        for name, user_counts in zip(names, counts[active]):
+            output_file.write('\t'.join([name] + map(str, user_counts)))
+            output_file.write('\n')
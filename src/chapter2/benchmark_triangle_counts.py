@@ -0,0 +1,80 @@
+'''
+Compare the set-based triangle counting that triangle_counts.py used to do
+with the triangle engine in src/python/triangles.py, on synthetic directed
+graphs with power-law degrees like the LiveJournal network.
+
+Run as
+python src/chapter2/benchmark_triangle_counts.py
+'''
+
+import sys, time
+from collections import defaultdict
+import numpy as np
+
+sys.path.append('src/python')
+from csr_graph import CSRGraph
+from triangles import link_counts, PROCESSES
+
+
+# The (nodes, edges) of the synthetic graphs
+SIZES = [(10000, 50000), (20000, 100000), (40000, 200000)]
+# The exponent of the power-law degree distribution
+EXPONENT = 2.2
+
+
+def power_law_edges(nodes, edges, exponent=EXPONENT, seed=0):
+    '''Random edges between nodes with Pareto distributed weights, so that
+       the degrees follow a power law (the Chung-Lu model).'''
+    generator = np.random.RandomState(seed)
+    weights = generator.pareto(exponent - 1, nodes) + 1
+    probabilities = weights / weights.sum()
+    sources = generator.choice(nodes, edges, p=probabilities)
+    destinations = generator.choice(nodes, edges, p=probabilities)
+    return sources.astype('int32'), destinations.astype('int32')
+
+
+def set_link_counts(sources, destinations):
+    '''The link counts as triangle_counts.py computed them with sets.'''
+    outgoing = defaultdict(set)
+    incoming = defaultdict(set)
+    users = set()
+    for source, destination in zip(sources.tolist(), destinations.tolist()):
+        outgoing[source].add(destination)
+        incoming[destination].add(source)
+        users.add(source)
+        users.add(destination)
+    counts = []
+    for u in sorted(users):
+        triangle_links = 0
+        neighbors = incoming[u].copy()
+        neighbors.update(outgoing[u])
+        for v in neighbors:
+            if v in outgoing:
+                for e in outgoing[v]:
+                    if e != u and e in neighbors:
+                        triangle_links += 1
+        counts.append([len(outgoing[u]), len(incoming[u]), len(neighbors),
+                       triangle_links])
+    return np.array(counts)
+
+
+def timed(function, *args):
+    begin = time.time()
+    result = function(*args)
+    return time.time() - begin, result
+
+
+if __name__ == '__main__':
+    print '%8s %8s %10s %10s %10s %8s' % ('nodes', 'edges', 'sets',
+                                          'engine', 'engine xN', 'speedup')
+    for nodes, edges in SIZES:
+        sources, destinations = power_law_edges(nodes, edges)
+        graph = CSRGraph.from_edges(sources, destinations, nodes)
+        set_time, expected = timed(set_link_counts, sources, destinations)
+        serial_time, (_, counts) = timed(link_counts, graph, 1)
+        assert (counts == expected).all()
+        parallel_time, (_, counts) = timed(link_counts, graph, PROCESSES)
+        assert (counts == expected).all()
+        print '%8d %8d %9.2fs %9.2fs %9.2fs %7.0fx' % (
+            nodes, edges, set_time, serial_time, parallel_time,
+            set_time / min(serial_time, parallel_time))
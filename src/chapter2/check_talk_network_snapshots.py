@@ -0,0 +1,111 @@
+'''
+Check that TalkNetworkSnapshots writes the same networks as a TalkNetwork
+built over each window on its own, for nested and overlapping windows of
+synthetic talk page edits.
+
+Run as
+python src/chapter2/check_talk_network_snapshots.py
+'''
+
+import gzip, os, random, shutil, sys, tempfile
+
+sys.path.append('src/python')
+from create_network import TalkNetwork, TalkNetworkSnapshots, \
+    sliding_windows
+from timestamps import parse_timestamp, format_timestamp
+from user_dictionary import UserDictionary
+
+
+# The edits are spread over the time range, a few per day on average,
+# between the talk pages of USERS users.
+TIME_RANGE = ['2012-12-20T00:00:00', '2013-03-10T00:00:00']
+EDITS = 400
+USERS = 12
+
+# Windows that are nested in, overlap, and end after each other, and
+# windows that begin before the ones that end earlier
+WINDOWS = [['2013-01-15T00:00:00', '2013-02-01T00:00:00'],
+           ['2013-01-01T00:00:00', '2013-03-01T00:00:00'],
+           ['2013-01-10T00:00:00', '2013-01-20T00:00:00'],
+           ['2013-01-25T00:00:00', '2013-02-20T00:00:00'],
+           ['2013-01-20T00:00:00', '2013-01-21T00:00:00'],
+           ['2013-02-25T00:00:00', '2013-03-20T00:00:00']]
+SLIDING_RANGE = ['2013-01-01T00:00:00', '2013-03-01T00:00:00']
+
+
+def synthetic_edits(seed):
+    '''The time-sorted (time, title, namespace, user ID, user name) rows of
+       random edits of the users on each other's talk pages.'''
+    rng = random.Random(seed)
+    begin, end = [parse_timestamp(t) for t in TIME_RANGE]
+    rows = []
+    for i in xrange(EDITS):
+        commenter, target_user = rng.randrange(USERS), rng.randrange(USERS)
+        rows.append((rng.randrange(begin, end), 'User talk:User %d' %
+                     target_user, 3, commenter + 1, 'User %d' % commenter))
+    # An edit at the very beginning and one at the end of a window
+    rows.append((parse_timestamp(WINDOWS[0][0]), 'User talk:User 1', 3, 3,
+                 'User 2'))
+    rows.append((parse_timestamp(WINDOWS[0][1]), 'User talk:User 1', 3, 3,
+                 'User 2'))
+    rows.sort()
+    return rows
+
+
+def format_day(time):
+    return format_timestamp(time)[:10]
+
+
+def read_network(file_name):
+    with gzip.open(file_name, 'r') as f:
+        return sorted(tuple(int(x) for x in line.split('\t')) for line in f)
+
+
+def expected_network(rows, begin, end, users):
+    network = TalkNetwork(users)
+    for row in rows:
+        if begin <= row[0] < end:
+            network.add(*row[1:])
+    return sorted((commenter, target_user, times)
+                  for commenter, target_users in network.edges.iteritems()
+                  for target_user, times in target_users.iteritems())
+
+
+def check(rows, windows, directory, users):
+    '''The number of windows whose snapshot differs from the network.'''
+    pattern = os.path.join(directory, 'talk_network_%s_%s.tsv.gz')
+    snapshots = TalkNetworkSnapshots(windows, users, pattern)
+    for row in rows:
+        if snapshots.begin() <= row[0] < snapshots.end():
+            snapshots.add(*row)
+    snapshots.close()
+    failures = 0
+    for begin, end in windows:
+        file_name = pattern % (format_day(begin), format_day(end))
+        if read_network(file_name) != expected_network(rows, begin, end,
+                                                       users):
+            print 'The snapshot of', format_day(begin), format_day(end), \
+                'differs'
+            failures += 1
+    return failures
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp()
+    try:
+        users = UserDictionary(os.path.join(directory, 'users.dictionary'),
+                               os.path.join(directory, 'no_robots.txt.gz'))
+        rows = synthetic_edits(1)
+        failures = check(rows, [(parse_timestamp(begin),
+                                 parse_timestamp(end))
+                                for begin, end in WINDOWS],
+                         directory, users)
+        for window_days, step_days in [(28, 7), (7, 10), (1, 1)]:
+            failures += check(rows, sliding_windows(SLIDING_RANGE,
+                                                    window_days, step_days),
+                              directory, users)
+    finally:
+        shutil.rmtree(directory)
+    if failures:
+        sys.exit('%d snapshots differ from their networks' % failures)
+    print 'All snapshots match the networks of their windows'
@@ -1,65 +1,224 @@
 '''
 Create a weighted, directed network from Wikipedia user talk page interactions.
+
+Run as
+python src/chapter2/create_network.py
+for the network of DATE_RANGE, or
+python src/chapter2/create_network.py windows
+for a network for each of WINDOWS, or
+python src/chapter2/create_network.py sliding [window days] [step days]
+for the networks of windows of the given length every step days in
+SLIDING_RANGE. The snapshots are all made in one pass over the revisions.
+
+The users are numbered by the UserDictionary in
+data/wikipedia/users.dictionary, so a user has the same index in all the
+networks, and bots are left out.
 '''
 
-import gzip, re
+import sys, re
+from bisect import bisect_left
 from collections import defaultdict
 
+sys.path.append('src/python')
+from parallel_gzip import GzipWriter
+from revision_store import open_revisions
+from timestamps import parse_timestamp, format_timestamp
+from user_dictionary import UserDictionary
+
 
 INPUT_FILE = 'data/wikipedia/revisions_time_sorted.tsv.gz'
 OUTPUT_FILE = 'data/wikipedia/talk_network.tsv.gz'
 
 DATE_RANGE = ['2013-01-01T00:00:00', '2013-02-01T00:00:00']
 
-# `edges` is a doubly-keyed dictionary to keep the number of times when
-# an edit happened.
-edges = defaultdict(lambda: defaultdict(int))
-# The mapping between the user name and the arbitrary user integer index.
-user_name_to_index = dict()
+# The [begin, end) windows of the snapshots in the 'windows' mode
+WINDOWS = [['2013-01-01T00:00:00', '2013-02-01T00:00:00'],
+           ['2013-02-01T00:00:00', '2013-03-01T00:00:00'],
+           ['2013-01-15T00:00:00', '2013-02-15T00:00:00']]
+# The time range and the default window length and step in days of the
+# 'sliding' mode
+SLIDING_RANGE = ['2013-01-01T00:00:00', '2014-01-01T00:00:00']
+WINDOW_DAYS = 28
+STEP_DAYS = 7
+# The snapshot of the window from the first date to the second
+SNAPSHOT_FILE_PATTERN = 'data/wikipedia/talk_network_%s_%s.tsv.gz'
 
+# The columns of the revisions that TalkNetwork.add needs.
+COLUMNS = ['title', 'namespace', 'user_id', 'user_name']
+# The columns that TalkNetworkSnapshots.add needs
+SNAPSHOT_COLUMNS = ['timestamp'] + COLUMNS
 
-def map_string_to_index(mapping, string):
-    '''Return the 0-based index for the user name, or a new user ID if we
-       have not seen the user before.'''
-    if string in mapping:
-        index = mapping[string]
-    else:
-        index = len(mapping)
-        mapping[string] = index
-    return index
+DAY = 24 * 3600
 
 
 # The regexp pattern to parse out the user name from the page title
 pattern_user_name = re.compile('^User talk:([^/]*)/*.*')
-# The pattern to identify a bot (any user name that contains a word that ends
-# on 'bot')
-pattern_bot = re.compile('.*[Bb][Oo][Tt]\\b')
-input_file = gzip.open(INPUT_FILE, 'r')
-for line in input_file:
-    title, namespace, page_id, rev_id, timestamp, user_id, user_name, ip = \
-        line[:-1].split('\t')
-    if timestamp >= DATE_RANGE[1]:
-        # The input file is sorted by time so we can finish the loop
-        # in this case.
-        break
-    if namespace == '3' and user_id != '' and user_id != '0' and \
-    timestamp >= DATE_RANGE[0] and timestamp < DATE_RANGE[1]:
+
+
+def interaction(title, namespace, user_id, user_name, users):
+    '''The (commenter, target user) indices in the UserDictionary `users`
+       of an edit on a user talk page, or None if it is not an interaction
+       between two users.'''
+    if namespace == 3 and user_id > 0:
         m = pattern_user_name.match(title)
         if m:
             commenter, target_user = (user_name, m.group(1))
-            if pattern_bot.match(commenter) or \
-            pattern_bot.match(target_user) or commenter == target_user:
+            if users.is_bot_name(commenter) or \
+            users.is_bot_name(target_user) or commenter == target_user:
                 # A bot is making or creating the edit, or a self-edit.
-                continue
-            commenter = map_string_to_index(user_name_to_index, commenter)
-            target_user = map_string_to_index(user_name_to_index, target_user)
-            edges[commenter][target_user] += 1
-input_file.close()
-
-output_file = gzip.open(OUTPUT_FILE, 'w')
-for commenter, target_users in edges.iteritems():
-    for target_user, times in target_users.iteritems():
-        output_file.write(
-            '\t'.join(map(str, [commenter, target_user, times])) + \
-            '\n')
-output_file.close()
+                return None
+            # Only the users that interact are added to the dictionary.
+            return users.index(commenter), users.index(target_user)
+    return None
+
+
+class TalkNetwork():
+    '''Count the edits of users on each other's talk pages.'''
+
+    def __init__(self, users):
+        # `edges` is a doubly-keyed dictionary to keep the number of times
+        # when an edit happened.
+        self.edges = defaultdict(lambda: defaultdict(int))
+        # The user indices, shared by the networks of all runs
+        self.users = users
+
+    def add(self, title, namespace, user_id, user_name):
+        edge = interaction(title, namespace, user_id, user_name, self.users)
+        if edge is not None:
+            commenter, target_user = edge
+            self.edges[commenter][target_user] += 1
+
+    def write(self, output_file_name):
+        output_file = GzipWriter(output_file_name)
+        for commenter, target_users in self.edges.iteritems():
+            for target_user, times in target_users.iteritems():
+                output_file.write(
+                    '\t'.join(map(str, [commenter, target_user, times])) + \
+                    '\n')
+        output_file.close()
+
+
+def sliding_windows(date_range, window_days, step_days):
+    '''The [begin, end) epoch times of the windows of window_days days that
+       start every step_days days within the date range.'''
+    begin, end = [parse_timestamp(t) for t in date_range]
+    return [(start, start + window_days * DAY) for start in
+            xrange(begin, end - window_days * DAY + 1, step_days * DAY)]
+
+
+class TalkNetworkSnapshots():
+    '''The talk networks of several time windows from one pass over the
+       time-sorted revisions.
+
+    The edge weights are kept for one time range at a time, and moved from
+    window to window by adding and subtracting the interactions in between,
+    so only the interactions of the windows not written yet are in memory.
+    '''
+
+    def __init__(self, windows, users,
+                 output_file_pattern=SNAPSHOT_FILE_PATTERN):
+        # The windows not written yet, by their end
+        self._windows = sorted(windows, key=lambda window: window[1])
+        self._output_file_pattern = output_file_pattern
+        self.users = users
+        # The times and (commenter, target user) of the interactions since
+        # the earliest beginning of the windows left, from _first on
+        self._times = []
+        self._interactions = []
+        self._first = 0
+        # The edge weights of the interactions since the time _begin
+        self._begin = min(window[0] for window in windows) if windows else 0
+        self._weights = dict()
+
+    def begin(self):
+        '''The beginning of the earliest window.'''
+        return self._begin
+
+    def end(self):
+        '''The end of the last window, or the beginning if there are no
+           windows.'''
+        return max([window[1] for window in self._windows] + [self._begin])
+
+    def add(self, time, title, namespace, user_id, user_name):
+        while self._windows and self._windows[0][1] <= time:
+            self._write(*self._windows.pop(0))
+        edge = interaction(title, namespace, user_id, user_name, self.users)
+        if edge is not None and self._windows:
+            self._times.append(time)
+            self._interactions.append(edge)
+            if time >= self._begin:
+                self._weights[edge] = self._weights.get(edge, 0) + 1
+
+    def close(self):
+        '''Write the windows that are left.'''
+        while self._windows:
+            self._write(*self._windows.pop(0))
+
+    def _move_begin(self, begin):
+        '''Add or subtract the interactions between the old and the new
+           beginning of the weights.'''
+        old = bisect_left(self._times, self._begin, self._first)
+        new = bisect_left(self._times, begin, self._first)
+        sign = 1 if new < old else -1
+        for i in xrange(min(old, new), max(old, new)):
+            edge = self._interactions[i]
+            weight = self._weights.get(edge, 0) + sign
+            if weight == 0:
+                del self._weights[edge]
+            else:
+                self._weights[edge] = weight
+        self._begin = begin
+
+    def _write(self, begin, end):
+        self._move_begin(begin)
+        output_file = GzipWriter(self._output_file_pattern % (
+            format_timestamp(begin)[:10], format_timestamp(end)[:10]))
+        for (commenter, target_user), times in self._weights.iteritems():
+            output_file.write(
+                '\t'.join(map(str, [commenter, target_user, times])) + '\n')
+        output_file.close()
+        if self._windows:
+            # The interactions before the windows left are not needed. A
+            # window left may begin before the one just written, so its
+            # interactions are kept even if the weights begin later.
+            earliest = min(window[0] for window in self._windows)
+            self._move_begin(max(self._begin, earliest))
+            self._first = bisect_left(self._times, earliest, self._first)
+            if self._first > len(self._times) / 2:
+                del self._times[:self._first]
+                del self._interactions[:self._first]
+                self._first = 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] not in ['windows', 'sliding']:
+        sys.exit('Unknown mode %s, use windows or sliding' % sys.argv[1])
+    # The input file is sorted by time so the reader can stop at the end of
+    # the date range. We read the columnar store of it if it has been built.
+    revisions = open_revisions(INPUT_FILE, sorted_by_time=True)
+    # The user indices are kept in data/wikipedia/users.dictionary, so that
+    # they are the same in all the networks.
+    users = UserDictionary()
+    if len(sys.argv) > 1:
+        if sys.argv[1] == 'windows':
+            windows = [(parse_timestamp(begin), parse_timestamp(end))
+                       for begin, end in WINDOWS]
+        elif sys.argv[1] == 'sliding':
+            windows = sliding_windows(
+                SLIDING_RANGE,
+                int(sys.argv[2]) if len(sys.argv) > 2 else WINDOW_DAYS,
+                int(sys.argv[3]) if len(sys.argv) > 3 else STEP_DAYS)
+        if not windows:
+            print >> sys.stderr, 'No window fits in', SLIDING_RANGE
+        snapshots = TalkNetworkSnapshots(windows, users)
+        for row in revisions.rows(SNAPSHOT_COLUMNS, snapshots.begin(),
+                                  snapshots.end()):
+            snapshots.add(*row)
+        snapshots.close()
+    else:
+        network = TalkNetwork(users)
+        for row in revisions.rows(COLUMNS, parse_timestamp(DATE_RANGE[0]),
+                                  parse_timestamp(DATE_RANGE[1])):
+            network.add(*row)
+        network.write(OUTPUT_FILE)
+    users.close()
@@ -1,13 +1,33 @@
 '''
 Calculate the degree-dependent assortativity in the LiveJournal social network.
+
+Run as
+python src/chapter2/degree_correlations.py [processes]
+
+The edges are processed in chunks, in parallel by default, and the
+statistics of the chunks are merged.
 '''
 
 INPUT = 'data/livejournal/livejournal-links.txt.gz'
 OUTPUT = 'data/livejournal/degree_correlations-log.tsv.gz'
 
-import gzip
+import sys
 from collections import defaultdict
-import math
+import multiprocessing
+import numpy as np
+
+sys.path.append('src/python')
+from csr_graph import load_graph
+from parallel_gzip import GzipWriter
+
+
+PROCESSES = multiprocessing.cpu_count()
+# The number of edges in a chunk.
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# The degree of the node under consideration and the degree of its neighbor
+# that we collect the statistics for.
+DIRECTIONS = [('in', 'in'), ('in', 'out'), ('out', 'in'), ('out', 'out')]
 
 
 class OnlineMeanVariance():
@@ -15,11 +35,12 @@ class OnlineMeanVariance():
 
     For the details see for instance
     https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Online_algorithm
+    and the parallel algorithm on the same page for merge.
     '''
-    def __init__(self):
-        self.mean = 0.0             # The running mean, make this a float.
-        self.count = 0              # Number of items added so far.
-        self._M2 = 0.0              # The sum of squares of differences from the
+    def __init__(self, count=0, mean=0.0, M2=0.0):
+        self.mean = mean            # The running mean, make this a float.
+        self.count = count          # Number of items added so far.
+        self._M2 = M2               # The sum of squares of differences from the
                                     # running mean, float.
     def add(self, x):
         '''Register a new item.'''
@@ -29,6 +50,16 @@ class OnlineMeanVariance():
             self.mean += delta / self.count     # online algorithm.
             self._M2 += delta * (x - self.mean)
 
+    def merge(self, other):
+        '''Add the items registered in another OnlineMeanVariance.'''
+        count = self.count + other.count
+        if other.count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._M2 += other._M2 + delta * delta * self.count * other.count / count
+        self.count = count
+
     def variance(self):
         '''Calculate the unbiased sample variance.'''
         if self.count <= 1:
@@ -37,39 +68,73 @@ class OnlineMeanVariance():
             return self._M2 / (self.count - 1)
 
 
-# First pass: count the in- and out-degrees of every node.
-outdegrees = defaultdict(int)       # The out-degree for every node.
-indegrees = defaultdict(int)        # The in-degree for every node.
-with gzip.open(INPUT) as f:
-    for line in f:
-        source, destination = map(int, line.rstrip().split('\t'))
-        outdegrees[source] += 1
-        indegrees[destination] += 1
-
-# Second pass: calculate the means and variances of the neighbor degree
-# distributions.
-# stats is a dict of dicts, the first level is for the in- & out-degrees,
-# the second level is for the degree of the node under consideration.
-stats = defaultdict(lambda: defaultdict(OnlineMeanVariance))
-with gzip.open(INPUT) as f:
-    for line in f:
-        source, destination = map(int, line.rstrip().split('\t'))
-
-        # Update the statistics for the four in- and out-degree combinations,
-        # and two end points.
-        stats[('in', 'in')][indegrees[source]].add(indegrees[destination])
-        stats[('in', 'out')][indegrees[source]].add(outdegrees[destination])
-        stats[('out', 'in')][outdegrees[source]].add(indegrees[destination])
-        stats[('out', 'out')][outdegrees[source]].add(outdegrees[destination])
-
-        stats[('in', 'in')][indegrees[destination]].add(indegrees[source])
-        stats[('in', 'out')][indegrees[destination]].add(outdegrees[source])
-        stats[('out', 'in')][outdegrees[destination]].add(indegrees[source])
-        stats[('out', 'out')][outdegrees[destination]].add(outdegrees[source])
-
-# Write the results to a file.
-with gzip.open(OUTPUT, 'w') as out:
-    for direction, dir_stats in stats.iteritems():
-        for deg, stat in dir_stats.iteritems():
-            out.write('\t'.join(map(str, [direction[0], deg, direction[1],
-                                          stat.mean, stat.variance()])) + '\n')
+def grouped_moments(keys, values):
+    '''The keys that occur, and the count, mean and sum of squared
+       differences from the mean of the positive values of each.'''
+    present = np.flatnonzero(np.bincount(keys))
+    valid = values > 0
+    keys, values = keys[valid], values[valid].astype('float64')
+    length = present[-1] + 1 if len(present) > 0 else 0
+    counts = np.bincount(keys, minlength=length)
+    means = np.bincount(keys, values, minlength=length) / \
+        np.maximum(counts, 1)
+    M2s = np.bincount(keys, (values - means[keys]) ** 2, minlength=length)
+    return present, counts[present], means[present], M2s[present]
+
+
+def chunk_statistics(edge_range):
+    '''The grouped moments for every direction for a range of edges.'''
+    sources, destinations = graph.edge_range(*edge_range)
+    statistics = []
+    for direction in DIRECTIONS:
+        node_degrees = degrees[direction[0]]
+        neighbor_degrees = degrees[direction[1]]
+        # Both end points of the edges are considered, with the other end as
+        # the neighbor.
+        keys = np.concatenate([node_degrees[sources],
+                               node_degrees[destinations]])
+        values = np.concatenate([neighbor_degrees[destinations],
+                                 neighbor_degrees[sources]])
+        statistics.append((direction, grouped_moments(keys, values)))
+    return statistics
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        processes = int(sys.argv[1])
+    else:
+        processes = PROCESSES
+
+    # The in- and out-degrees of every node, from the cached graph after the
+    # first run. The worker processes share these.
+    graph = load_graph(INPUT)
+    degrees = {'in': graph.in_degrees(), 'out': graph.out_degrees()}
+
+    edge_ranges = [(begin, min(begin + CHUNK_SIZE, graph.edge_count))
+                   for begin in xrange(0, graph.edge_count, CHUNK_SIZE)]
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        # The chunks are merged in order, so that the rounding of the merged
+        # moments is the same in every run.
+        results = pool.imap(chunk_statistics, edge_ranges)
+    else:
+        results = (chunk_statistics(r) for r in edge_ranges)
+
+    # stats is a dict of dicts, the first level is for the in- & out-degrees,
+    # the second level is for the degree of the node under consideration.
+    stats = defaultdict(lambda: defaultdict(OnlineMeanVariance))
+    for statistics in results:
+        for direction, moments in statistics:
+            for degree, count, mean, M2 in zip(*[m.tolist() for m in moments]):
+                stats[direction][degree].merge(
+                    OnlineMeanVariance(count, mean, M2))
+    if processes > 1:
+        pool.close()
+        pool.join()
+
+    # Write the results to a file.
+    with GzipWriter(OUTPUT) as out:
+        for direction, dir_stats in stats.iteritems():
+            for deg, stat in dir_stats.iteritems():
+                out.write('\t'.join(map(str, [direction[0], deg, direction[1],
+                                              stat.mean, stat.variance()])) + '\n')
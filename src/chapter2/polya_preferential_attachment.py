@@ -1,5 +1,13 @@
 '''
 Simulate Polya's generalized urn model.
+
+Run as
+python src/chapter2/polya_preferential_attachment.py [rounds] [replicates] [processes] [seed]
+
+Every replicate is simulated independently with its own seed, seed + i, and
+the replicates are run in parallel. The distribution of the balls across
+the bins of every replicate is written to OUTPUT, or to OUTPUT_PATTERN for
+several replicates, and plotted.
 '''
 
 # The number of total draws (time steps).
@@ -8,37 +16,62 @@ ROUNDS = 10000
 # The parameter p of the model.
 P = 0.2
 
-import random
-from collections import defaultdict
+# The ball count and the number of bins with that many balls
+OUTPUT = 'data/polya_ball_dist.tsv'
+# The output of replicate i when there are several
+OUTPUT_PATTERN = 'data/polya_ball_dist_%03d.tsv'
+
+import sys
+import multiprocessing
+import numpy as np
 import matplotlib.pyplot as plt
 
-# The number of balls in each of the bins; bins are indexed by integers.
-bin_balls = defaultdict(int)
+sys.path.append('src/python')
+from polya_urn import simulate, ball_distribution
+
+PROCESSES = multiprocessing.cpu_count()
+SEED = 0
+
 
-# Start with one bin having one ball only.
-bin_balls[0] = 1
+def simulate_replicate(args):
+    '''Simulate the urn with the seed, and write its ball distribution to
+       the output file.'''
+    rounds, seed, output_file = args
+    bin_balls = simulate(rounds, P, np.random.RandomState(seed))
+    # Calculate the ball distribution across the bins.
+    ball_dist = ball_distribution(bin_balls)
+    with open(output_file, 'w') as f:
+        for k in np.flatnonzero(ball_dist):
+            f.write('%d\t%d\n' % (k, ball_dist[k]))
+    return seed, output_file, len(bin_balls)
 
-for round in xrange(0, ROUNDS):
-    if random.random() < P:
-        # Create a new bin with probability P.
-        bin_balls[len(bin_balls)] = 1
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else ROUNDS
+    replicates = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else PROCESSES
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else SEED
+
+    if replicates == 1:
+        jobs = [(rounds, seed, OUTPUT)]
     else:
-        # Otherwise add a ball to a bin based on preferential attachment.
-        threshold = random.randint(1, round + 1)
-        s = 0
-        for b, balls in bin_balls.iteritems():
-            s += balls
-            if s >= threshold:
-                # Choose this bin for the ball.
-                bin_balls[b] += 1
-                break
-
-# Calculate the ball distribution across the bins.
-ball_dist = defaultdict(int)
-for k in bin_balls.itervalues():
-    ball_dist[k] += 1
-
-plt.xscale('log'); plt.yscale('log')
-plt.xlabel('Ball count'); plt.ylabel('Bin count')
-plt.scatter(ball_dist.keys(), ball_dist.values())
-plt.show()
+        jobs = [(rounds, seed + i, OUTPUT_PATTERN % i)
+                for i in xrange(replicates)]
+    if processes > 1 and replicates > 1:
+        pool = multiprocessing.Pool(min(processes, replicates))
+        results = pool.imap_unordered(simulate_replicate, jobs)
+    else:
+        pool = None
+        results = (simulate_replicate(job) for job in jobs)
+    for seed, output_file, bins in results:
+        print 'Seed %d: %d bins, written to %s' % (seed, bins, output_file)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    plt.xscale('log'); plt.yscale('log')
+    plt.xlabel('Ball count'); plt.ylabel('Bin count')
+    for rounds, seed, output_file in jobs:
+        ball_dist = np.loadtxt(output_file, dtype='int64', ndmin=2)
+        plt.scatter(ball_dist[:, 0], ball_dist[:, 1])
+    plt.show()
@@ -1,60 +1,127 @@
 '''
 Randomize where the network links point to so as to destroy clustering among
 the nodes, if any.
+
+Run as
+python src/chapter2/rewire.py [replicates] [processes] [seed]
+
+Every replicate is rewired independently with its own seed, seed + i, and
+the replicates are run in parallel. The swaps that would create self-loops
+or duplicate links are rejected, so every node keeps its in- and
+out-degree.
+
+With TRACK_CLUSTERING the global clustering coefficient is also written
+after every batch of swaps, kept up to date as the edges change. This
+holds the whole graph in Python dictionaries, which takes a lot of memory
+for LiveJournal.
 '''
 
 INPUT = 'data/livejournal/livejournal-links.txt.gz'
 OUTPUT = 'data/livejournal/link_counts_rewired_10x.tsv.gz'
+# The output of replicate i when there are several
+OUTPUT_PATTERN = 'data/livejournal/link_counts_rewired_10x_%03d.tsv.gz'
+# The global clustering coefficients during the rewiring of a replicate
+CLUSTERING_PATTERN = 'data/livejournal/clustering_rewired_%03d.tsv.gz'
 
-import gzip, random
-from collections import defaultdict
 import sys
+import multiprocessing
+import numpy as np
+
+sys.path.append('src/python')
+from csr_graph import CSRGraph, load_graph
+from parallel_gzip import GzipWriter
+from rewiring import rewire
+from dynamic_triangles import DynamicTriangles
+from triangle_counts import triangle_counts
+
+
+# The number of swaps per edge
+SWAPS_PER_EDGE = 10
+PROCESSES = multiprocessing.cpu_count()
+SEED = 0
+TRACK_CLUSTERING = False
+
+
+class ClusteringTracker():
+    '''Write the global clustering coefficient after every batch of swaps.'''
+
+    def __init__(self, sources, destinations, output_file):
+        self.triangles = DynamicTriangles()
+        for source, destination in zip(sources.tolist(),
+                                       destinations.tolist()):
+            self.triangles.add_edge(source, destination)
+        self.out = GzipWriter(output_file)
+        self.write(0, 0)
+
+    def write(self, attempted, accepted):
+        # The number of swaps attempted and accepted so far, and the global
+        # clustering coefficient.
+        self.out.write('\t'.join(map(str, [
+            attempted, accepted, self.triangles.global_clustering()])) + '\n')
+
+    def update(self, removed_sources, removed_destinations, added_sources,
+               added_destinations, statistics):
+        for source, destination in zip(removed_sources.tolist(),
+                                       removed_destinations.tolist()):
+            self.triangles.remove_edge(source, destination)
+        for source, destination in zip(added_sources.tolist(),
+                                       added_destinations.tolist()):
+            self.triangles.add_edge(source, destination)
+        self.write(statistics.attempted, statistics.accepted)
+
+    def close(self):
+        self.out.close()
+
+
+def rewire_replicate(args):
+    '''Rewire a copy of the graph with the seed, and write its triangle
+       counts to the output file.'''
+    seed, output_file, clustering_file = args
+    graph = load_graph(INPUT)
+    # The edges as arrays of sources and destinations. The sources do not
+    # change, only the destinations are swapped.
+    sources, destinations = graph.edge_range(0, graph.edge_count)
+    destinations = np.array(destinations)
+    tracker = None
+    if clustering_file is not None:
+        tracker = ClusteringTracker(sources, destinations, clustering_file)
+    statistics = rewire(sources, destinations,
+                        SWAPS_PER_EDGE * graph.edge_count,
+                        np.random.RandomState(seed),
+                        on_batch=tracker.update if tracker else None)
+    if tracker is not None:
+        tracker.close()
+    triangle_counts(output_file,
+                    CSRGraph.from_edges(sources, destinations,
+                                        graph.node_count),
+                    processes=1)
+    return seed, output_file, statistics
+
+
+if __name__ == '__main__':
+    replicates = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else PROCESSES
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else SEED
 
+    # Build the cached graph once before the workers map it.
+    print 'The number of edges:', load_graph(INPUT).edge_count
 
-def triangle_counts(output_file, users, incoming, outgoing):
-    with gzip.open(output_file, 'w') as out:
-        done = 0
-        for u in users:
-            triangle_links = 0
-            neighbors = incoming[u].copy()
-            neighbors.update(outgoing[u])
-            for v in neighbors:
-                if v in outgoing:
-                    for e in outgoing[v]:
-                        if e != u and e in neighbors:
-                            triangle_links += 1
-            out.write('\t'.join(map(str, [len(outgoing[u]), len(incoming[u]),
-                                          len(neighbors), triangle_links]))
-                      + '\n')
-            done += 1
-            if done % 1000 == 0:
-                sys.stderr.write(str(done / 1e6) + 'M    \r')
-
-
-edges = list()                  # The list of all edges with (from, to) tuples.
-with gzip.open(INPUT) as f:
-    for line in f:
-        # Convert node IDs to integers to save space.
-        source, destination = map(int, line.rstrip().split('\t'))
-        edges.append([source, destination])
-
-print 'The number of edges:', len(edges)
-
-rewire_rounds = 10 * len(edges)             # The number of randomization steps.
-for rewire_round in xrange(0, rewire_rounds):
-    e1 = random.randint(0, len(edges) - 1)  # Choose the first edge randomly.
-    e2 = random.randint(0, len(edges) - 1)  # Choose the second edge randomly.
-    e2_dest = edges[e2][1]                  # Swap the edges (we don't need to
-    edges[e2][1] = edges[e1][1]             # watch out for the case when
-    edges[e1][1] = e2_dest                  # e1 == e2, it just won't do anything).
-
-outgoing = defaultdict(set)
-incoming = defaultdict(set)
-users = set()
-for (source, destination) in edges:
-    outgoing[source].add(destination)
-    incoming[destination].add(source)
-    users.add(source)
-    users.add(destination)
-
-triangle_counts(OUTPUT, users, incoming, outgoing)
+    if replicates == 1:
+        jobs = [(seed, OUTPUT)]
+    else:
+        jobs = [(seed + i, OUTPUT_PATTERN % i) for i in xrange(replicates)]
+    if TRACK_CLUSTERING:
+        jobs = [job + (CLUSTERING_PATTERN % i,) for i, job in enumerate(jobs)]
+    else:
+        jobs = [job + (None,) for job in jobs]
+    if processes > 1 and replicates > 1:
+        pool = multiprocessing.Pool(min(processes, replicates))
+        results = pool.imap_unordered(rewire_replicate, jobs)
+    else:
+        pool = None
+        results = (rewire_replicate(job) for job in jobs)
+    for seed, output_file, statistics in results:
+        print 'Seed %d: %s, written to %s' % (seed, statistics, output_file)
+    if pool is not None:
+        pool.close()
+        pool.join()
@@ -0,0 +1,100 @@
+'''
+Follow the clustering of the Wikipedia talk network day by day: for every
+day, the network of the user talk page interactions of the last WINDOW_DAYS
+days, as in create_network.py. The window of a day is [the end of the day -
+WINDOW_DAYS, the end of the day), like the windows of create_network.py.
+
+The triangles are kept up to date as interactions enter and leave the
+window, instead of being recounted for every day.
+'''
+
+import sys
+from collections import defaultdict, deque
+
+sys.path.append('src/python')
+from parallel_gzip import GzipWriter
+from revision_store import open_revisions
+from timestamps import parse_timestamp, format_timestamp
+from dynamic_triangles import DynamicTriangles
+from user_dictionary import UserDictionary
+
+import create_network
+
+
+INPUT_FILE = 'data/wikipedia/revisions_time_sorted.tsv.gz'
+OUTPUT_FILE = 'data/wikipedia/talk_network_clustering.tsv.gz'
+
+DATE_RANGE = ['2013-01-01T00:00:00', '2013-07-01T00:00:00']
+WINDOW_DAYS = 28
+
+COLUMNS = ['timestamp'] + create_network.COLUMNS
+
+DAY = 24 * 3600
+
+
+class SlidingTalkNetwork():
+    '''The talk network of the interactions in a sliding time window.'''
+
+    def __init__(self, window):
+        self.window = window
+        self.triangles = DynamicTriangles()
+        # The (time, commenter, target user) of the interactions in the
+        # window, oldest first
+        self._interactions = deque()
+        # The number of interactions in the window per edge
+        self._weights = defaultdict(int)
+
+    def add(self, time, commenter, target_user):
+        self._interactions.append((time, commenter, target_user))
+        edge = (commenter, target_user)
+        self._weights[edge] += 1
+        if self._weights[edge] == 1:
+            self.triangles.add_edge(commenter, target_user)
+
+    def expire(self, now):
+        '''Drop the interactions before the window [now - window, now).'''
+        while self._interactions and \
+        self._interactions[0][0] < now - self.window:
+            time, commenter, target_user = self._interactions.popleft()
+            edge = (commenter, target_user)
+            self._weights[edge] -= 1
+            if self._weights[edge] == 0:
+                del self._weights[edge]
+                self.triangles.remove_edge(commenter, target_user)
+
+    def statistics(self):
+        '''The number of users and edges, the number of triangles, and the
+           global clustering coefficient.'''
+        triangles = self.triangles
+        return [len(triangles), triangles.edge_count,
+                triangles.triangle_count, triangles.global_clustering()]
+
+
+def write_day(output_file, network, day_end):
+    network.expire(day_end)
+    day = format_timestamp(day_end - DAY)[:10]
+    output_file.write('\t'.join(map(str, [day] + network.statistics())) +
+                      '\n')
+
+
+if __name__ == '__main__':
+    begin, end = [parse_timestamp(t) for t in DATE_RANGE]
+    network = SlidingTalkNetwork(WINDOW_DAYS * DAY)
+    revisions = open_revisions(INPUT_FILE, sorted_by_time=True)
+    users = UserDictionary()
+    with GzipWriter(OUTPUT_FILE) as output_file:
+        # The end of the day we are in
+        day_end = begin + DAY
+        # The window starts WINDOW_DAYS before the first day.
+        for row in revisions.rows(COLUMNS, begin - WINDOW_DAYS * DAY, end):
+            time = row[0]
+            while day_end <= time:
+                write_day(output_file, network, day_end)
+                day_end += DAY
+            edge = create_network.interaction(*row[1:] + (users,))
+            if edge is not None:
+                network.add(time, *edge)
+        while day_end <= end:
+            write_day(output_file, network, day_end)
+            day_end += DAY
+    users.close()
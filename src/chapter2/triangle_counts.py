@@ -1,44 +1,87 @@
 '''
 For the Livejournal social network, output the degrees of all nodes, and their
 local clustering coefficients.
+
+Run as
+python src/chapter2/triangle_counts.py [processes]
+
+or, to estimate the clustering coefficients from a sample of the wedges
+instead, within +-error at 95% confidence or as close as the time budget in
+seconds allows,
+python src/chapter2/triangle_counts.py sample [error] [seconds]
+for the average clustering coefficient of the nodes by degree, or
+python src/chapter2/triangle_counts.py sample-nodes [error] [seconds]
+for the clustering coefficient of every node.
 '''
 
-import gzip
-from collections import defaultdict
 import sys
+import numpy as np
+
+sys.path.append('src/python')
+from csr_graph import load_graph
+from parallel_gzip import GzipWriter
+from triangles import link_counts, PROCESSES
+from wedge_sampling import WedgeSampler, estimate_by_degree, \
+    estimate_per_node, ERROR
 
 
 INPUT = 'data/livejournal/livejournal-links.txt.gz'
 OUTPUT = 'data/livejournal/link_counts.tsv.gz'
+SAMPLED_BY_DEGREE_OUTPUT = \
+    'data/livejournal/clustering_by_degree_sampled.tsv.gz'
+SAMPLED_OUTPUT = 'data/livejournal/clustering_sampled.tsv.gz'
+
+
+def triangle_counts(output_file, graph, processes=PROCESSES):
+    # Just so we have all the data we store the out- and in-degree, the
+    # number of distinct neighbors, and the number of directed edges between
+    # the neighbors for all the users.
+    nodes, counts = link_counts(graph, processes)
+    with GzipWriter(output_file) as out:
+        np.savetxt(out, counts, fmt='%d', delimiter='\t')
+
+
+def sampled_clustering_by_degree(output_file, graph, error, time_budget):
+    # The degree bin, the number of nodes and samples in it, and the
+    # estimate of the average clustering coefficient with its interval.
+    rows = estimate_by_degree(WedgeSampler(graph), error=error,
+                              time_budget=time_budget)
+    with GzipWriter(output_file) as out:
+        for row in rows:
+            out.write('\t'.join(map(str, row)) + '\n')
+
+
+def sampled_clustering(output_file, graph, error, time_budget):
+    # The out- and in-degree, the number of distinct neighbors, the number
+    # of wedges looked at, and the estimate of the clustering coefficient
+    # with its interval for the users with at least two neighbors.
+    sampler = WedgeSampler(graph)
+    nodes = sampler.nodes()
+    estimates, lows, highs, samples = estimate_per_node(
+        sampler, nodes, error=error, time_budget=time_budget)
+    with GzipWriter(output_file) as out:
+        np.savetxt(out, np.column_stack([
+            graph.out_degrees()[nodes], graph.in_degrees()[nodes],
+            sampler.degrees[nodes], samples, estimates, lows, highs]),
+            fmt=['%d'] * 4 + ['%.6f'] * 3, delimiter='\t')
 
 
-# The graph is a directed graph.
-outgoing = defaultdict(set)     # The nodes at the ends of outgoing links.
-incoming = defaultdict(set)     # The nodes at the other ends of incoming links.
-users = set()                   # All the users.
-with gzip.open(INPUT) as f:
-    for line in f:
-        # Convert node IDs to integers to save space.
-        source, destination = map(int, line.rstrip().split('\t'))
-        outgoing[source].add(destination)
-        incoming[destination].add(source)
-        users.add(source)
-        users.add(destination)
-
-with gzip.open(OUTPUT, 'w') as out:
-    for u in users:             # Need to iterate through all the users.
-        triangle_links = 0      # The number of links among neighbors.
-        neighbors = incoming[u].copy()
-        neighbors.update(outgoing[u])           # Holds all the neighbors.
-        for v in neighbors:
-            if v in outgoing:
-                # For all outgoing edges of v if it has any.
-                for e in outgoing[v]:
-                    if e != u and e in neighbors:
-                        triangle_links += 1
-        # Just so we have all the data we store the out- and in-degree,
-        # the number of distinct neighbors, and the number of directed edges
-        # between the neighbors.
-        out.write('\t'.join(map(str, [len(outgoing[u]), len(incoming[u]),
-                                      len(neighbors), triangle_links]))
-                  + '\n')
+if __name__ == '__main__':
+    # The graph is a directed graph, and it is read from the cached arrays
+    # after the first run.
+    if len(sys.argv) > 1 and sys.argv[1].startswith('sample'):
+        error = float(sys.argv[2]) if len(sys.argv) > 2 else ERROR
+        time_budget = float(sys.argv[3]) if len(sys.argv) > 3 else None
+        if sys.argv[1] == 'sample-nodes':
+            sampled_clustering(SAMPLED_OUTPUT, load_graph(INPUT), error,
+                               time_budget)
+        else:
+            sampled_clustering_by_degree(SAMPLED_BY_DEGREE_OUTPUT,
+                                         load_graph(INPUT), error,
+                                         time_budget)
+    else:
+        if len(sys.argv) > 1:
+            processes = int(sys.argv[1])
+        else:
+            processes = PROCESSES
+        triangle_counts(OUTPUT, load_graph(INPUT), processes)
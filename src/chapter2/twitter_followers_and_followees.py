@@ -1,21 +1,109 @@
 '''
-Python script to be called from R to create aggregate statistics from
-a large file.
+Create aggregate statistics from a large file for R: how many users have
+each number of followers and of followees.
+
+Run as
+python src/chapter2/twitter_followers_and_followees.py
+to write the statistics to OUTPUT, which src/chapter2/twitter_graph.R
+reads. The file holds little-endian float64 numbers: the number of
+follower counts and of followee counts, and then the columns of the
+follower counts, the number of users with each, the followee counts, and
+the number of users with each. It is only rebuilt when FILE changes.
+
+followers_followees_stat() returns the same four columns as lists, for
+calling from R through rPython.
 '''
 
-from collections import defaultdict
-import gzip
+import os, sys, json
+import numpy as np
+
+sys.path.append('src/python')
+from parallel_gzip import read_blocks
 
 FILE = 'data/twitter/followers_followees.tsv.gz'
+OUTPUT = 'data/twitter/followers_followees_stat.bin'
+
+# The bytes of the file parsed at a time.
+READ_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def source_signature(path):
+    '''The size and modification time of a file.'''
+    return [os.path.getsize(path), int(os.path.getmtime(path))]
+
+
+def count_values(chunks):
+    '''The distinct values of the arrays, and how many times each occurs in
+       all of them.'''
+    values = np.concatenate([c[0] for c in chunks] + [np.zeros(0, 'int64')])
+    counts = np.concatenate([c[1] for c in chunks] + [np.zeros(0, 'int64')])
+    values, inverse = np.unique(values, return_inverse=True)
+    return values, np.bincount(inverse, counts).astype('int64')
+
+
+def read_stat(path, chunk_size=READ_CHUNK_SIZE):
+    '''The follower counts and the number of users with each, and the same
+       for the followee counts, from a file with the two counts of a user
+       on every line.'''
+    followers, followees = [], []
+    for data in read_blocks(path, size=chunk_size):
+        values = np.fromstring(data, dtype='int64', sep=' ')
+        # fromstring stops at the first token that is not an integer
+        # without saying so.
+        lines = data.count('\n') + (data[-1:] not in ('', '\n'))
+        if len(values) != lines * 2:
+            raise ValueError('%s has a line without two counts' % path)
+        pairs = values.reshape(-1, 2)
+        # Keep only the distinct counts of every chunk.
+        followers.append(np.unique(pairs[:, 0], return_counts=True))
+        followees.append(np.unique(pairs[:, 1], return_counts=True))
+    return count_values(followers) + count_values(followees)
+
+
+def write_stat(output_file, columns, source=None):
+    '''Write the four columns, with the size and modification time of the
+       file they were counted from, if given, next to them.'''
+    followers, followees = len(columns[0]), len(columns[2])
+    np.concatenate([[followers, followees]] + list(columns)) \
+        .astype('<f8').tofile(output_file)
+    # The metadata is written last, so that a partly written file is not
+    # used.
+    with open(output_file + '.json', 'w') as f:
+        json.dump({'source': source_signature(source)
+                   if source is not None else None}, f)
+
+
+def load_stat(output_file, source=None):
+    '''The four columns, or None if they have not been written yet, or were
+       counted from a different version of the source file.'''
+    try:
+        with open(output_file + '.json') as f:
+            meta = json.load(f)
+    except IOError:
+        return None
+    if source is not None and meta['source'] != source_signature(source):
+        return None
+    numbers = np.fromfile(output_file, dtype='<f8').astype('int64')
+    followers, followees = numbers[:2]
+    ends = np.cumsum([2, followers, followers, followees, followees])
+    return [numbers[begin:end] for begin, end in zip(ends[:-1], ends[1:])]
+
+
+def followers_followees_columns():
+    '''The columns from OUTPUT, counting them first if it is out of date.'''
+    columns = load_stat(OUTPUT, FILE)
+    if columns is None:
+        columns = read_stat(FILE)
+        write_stat(OUTPUT, columns, FILE)
+    return columns
+
 
 def followers_followees_stat():
-    followers_stat = defaultdict(int)
-    followees_stat = defaultdict(int)
-    with gzip.open(FILE) as f:
-        for line in f:
-            followers, followees = map(int, line.split('\t'))
-            followers_stat[followers] += 1
-            followees_stat[followees] += 1
     # We can only return vectors to R, no data frames.
-    return [followers_stat.keys(), followers_stat.values(),
-            followees_stat.keys(), followees_stat.values()]
+    return [column.tolist() for column in followers_followees_columns()]
+
+
+if __name__ == '__main__':
+    columns = followers_followees_columns()
+    sys.stderr.write('%d follower counts and %d followee counts in %s\n' %
+                     (len(columns[0]), len(columns[2]), OUTPUT))
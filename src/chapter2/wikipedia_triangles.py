@@ -1,48 +1,130 @@
 '''
 From the Wikipedia talk network, output the degrees of all nodes, and their
-local clustering coefficients.
+local clustering coefficients, in the network of the mutual interactions:
+two users are friends if both have edited the talk page of the other.
+
+Run as
+python src/chapter2/wikipedia_triangles.py [processes]
+
+or, to estimate the clustering coefficients from a sample of the wedges
+within +-error at 95% confidence, or as close as the time budget in seconds
+allows,
+python src/chapter2/wikipedia_triangles.py sample [error] [seconds]
+for the average clustering coefficient of the nodes by degree, or
+python src/chapter2/wikipedia_triangles.py sample-nodes [error] [seconds]
+for the clustering coefficient of every node, with the intervals.
+
+The exact coefficients go to OUTPUT, one tab-separated line per user with
+at least two friends: the index of the user in the UserDictionary of the
+talk network, the number of friends, and the local clustering coefficient
+as a decimal number. This replaces the lines of the number of friends and
+the coefficient that the script used to print, where the coefficient was an
+integer division and so 0 for all but the users whose friends are all
+friends. The sampled estimates go to SAMPLED_OUTPUT, with the low and high
+bounds of the interval after the estimate, and to SAMPLED_BY_DEGREE_OUTPUT,
+with the degree bin, its number of users and samples, and the estimate and
+its bounds on every line.
 '''
 
 INPUT = 'data/wikipedia/talk_network.tsv.gz'
+OUTPUT = 'data/wikipedia/talk_network_friend_clustering.tsv.gz'
+SAMPLED_BY_DEGREE_OUTPUT = \
+    'data/wikipedia/talk_network_friend_clustering_by_degree_sampled.tsv.gz'
+SAMPLED_OUTPUT = \
+    'data/wikipedia/talk_network_friend_clustering_sampled.tsv.gz'
+
+import sys
+import numpy as np
+
+sys.path.append('src/python')
+from csr_graph import CSRGraph, load_graph
+from parallel_gzip import GzipWriter
+from triangles import link_counts, PROCESSES
+from wedge_sampling import WedgeSampler, estimate_by_degree, \
+    estimate_per_node, ERROR
+
+
+def friend_graph(graph):
+    '''The undirected graph of the reciprocated edges of a CSRGraph, with
+       the edges in both directions.'''
+    n = graph.node_count
+    sources, destinations = graph.edge_range(0, graph.edge_count)
+    sources = sources.astype('int64')
+    destinations = destinations.astype('int64')
+    keep = sources != destinations
+    sources, destinations = sources[keep], destinations[keep]
+    # Every edge is in the graph once, so a pair of users is there twice
+    # exactly when the edge goes both ways.
+    pairs = np.sort(np.minimum(sources, destinations) * n +
+                    np.maximum(sources, destinations))
+    mutual = pairs[:-1][pairs[1:] == pairs[:-1]]
+    lower, higher = mutual // n, mutual % n
+    return CSRGraph.from_edges(np.concatenate([lower, higher]),
+                               np.concatenate([higher, lower]), n)
+
+
+def clustering(output_file, friends, processes=PROCESSES):
+    # The user, the number of friends, and the local clustering coefficient
+    # of the users with at least two friends. Each of the links among the
+    # friends is counted in both directions.
+    nodes, counts = link_counts(friends, processes)
+    neighbors, links = counts[:, 2], counts[:, 3]
+    selected = neighbors > 1
+    nodes, neighbors, links = \
+        nodes[selected], neighbors[selected], links[selected]
+    with GzipWriter(output_file) as out:
+        np.savetxt(out, np.column_stack([
+            nodes, neighbors,
+            links / (neighbors * (neighbors - 1)).astype('float64')]),
+            fmt=['%d', '%d', '%.6f'], delimiter='\t')
+
+
+def sampled_clustering_by_degree(output_file, friends, error, time_budget):
+    # The degree bin, the number of nodes and samples in it, and the
+    # estimate of the average clustering coefficient with its interval.
+    rows = estimate_by_degree(WedgeSampler(friends), error=error,
+                              time_budget=time_budget)
+    with GzipWriter(output_file) as out:
+        for row in rows:
+            out.write('\t'.join(map(str, row)) + '\n')
+
+
+def sampled_clustering(output_file, friends, error, time_budget):
+    # The user, the number of friends, and the estimate of the clustering
+    # coefficient with its interval.
+    sampler = WedgeSampler(friends)
+    nodes = sampler.nodes()
+    estimates, lows, highs, samples = estimate_per_node(
+        sampler, nodes, error=error, time_budget=time_budget)
+    with GzipWriter(output_file) as out:
+        np.savetxt(out, np.column_stack([
+            nodes, sampler.degrees[nodes], estimates, lows, highs]),
+            fmt=['%d'] * 2 + ['%.6f'] * 3, delimiter='\t')
+
+
+if __name__ == '__main__':
+    # The network has the commenter, target user and times in every line,
+    # and it is read from the cached arrays after the first run.
+    graph = load_graph(INPUT, columns=3)
+    print 'Directed edge count:', graph.edge_count
+    print 'Node count:', len(graph.nodes())
+
+    friends = friend_graph(graph)
+    # The friendships are in friends in both directions.
+    print 'Undirected edge count:', friends.edge_count
+    print 'Node count:', len(friends.nodes())
 
-import gzip
-from collections import defaultdict
-
-edges = defaultdict(set)
-edge_count = 0
-nodes = set()
-with gzip.open(INPUT) as f:
-    for line in f:
-        commenter, target_user, times = line.rstrip().split('\t')
-        edges[commenter].add(target_user)
-        edge_count += 1
-        nodes.add(commenter)
-        nodes.add(target_user)
-
-print 'Directed edge count:', edge_count
-print 'Node count:', len(nodes)
-
-friends = defaultdict(set)
-edge_count = 0
-nodes = set()
-for u, links in edges.iteritems():
-    for v in links:
-        if v in edges and u in edges[v]:
-            friends[u].add(v)
-            edge_count += 1
-            nodes.add(u)
-
-print 'Undirected edge count:', edge_count
-print 'Node count:', len(nodes)
-
-for u in friends.iterkeys():
-    u_neighbors = 0
-    triangle_links = 0
-    for v in friends[u]:
-        u_neighbors += 1
-        for w in friends[v]:
-            if w != u and w in friends[u]:
-                triangle_links += 1
-    if u_neighbors > 1:
-        clustering_coefficient = triangle_links / (u_neighbors * (u_neighbors - 1))
-        print '\t'.join(map(str, [u_neighbors, clustering_coefficient]))
+    if len(sys.argv) > 1 and sys.argv[1].startswith('sample'):
+        error = float(sys.argv[2]) if len(sys.argv) > 2 else ERROR
+        time_budget = float(sys.argv[3]) if len(sys.argv) > 3 else None
+        if sys.argv[1] == 'sample-nodes':
+            sampled_clustering(SAMPLED_OUTPUT, friends, error, time_budget)
+        else:
+            sampled_clustering_by_degree(SAMPLED_BY_DEGREE_OUTPUT, friends,
+                                         error, time_budget)
+    else:
+        if len(sys.argv) > 1:
+            processes = int(sys.argv[1])
+        else:
+            processes = PROCESSES
+        clustering(OUTPUT, friends, processes)
@@ -0,0 +1,102 @@
+'''
+Check that EditIntereventTimes, which counts the histograms on chunks of
+key and time arrays, gives the same histograms as IntereventTimes, which
+adds one event at a time, on a synthetic stream of edits that is cut into
+chunks of random sizes.
+
+Run as
+python src/chapter3/check_interevent_histograms.py
+'''
+
+import random, sys
+import numpy as np
+
+from wikipedia_edit_interevent_times import IntereventTimes, \
+    EditIntereventTimes, DATE_RANGE
+from interevent_histograms import histogram_items
+from timestamps import parse_timestamp
+
+
+# The number of edits, users and pages of the synthetic stream
+EDITS = 200000
+USERS = 3000
+PAGES = 20000
+# The largest chunk of rows added at a time
+MAX_CHUNK = 5000
+
+
+def synthetic_edits(seed):
+    '''The (timestamp, user ID, page ID) arrays of time-sorted edits in
+       DATE_RANGE, with some edits in the same second, some at its
+       beginning, and some by the unregistered user 0.'''
+    generator = np.random.RandomState(seed)
+    begin, end = [parse_timestamp(t) for t in DATE_RANGE]
+    timestamps = np.sort(generator.randint(begin, end, EDITS))
+    timestamps[:10] = begin
+    # Busy users and pages edit much more often than the others.
+    user_ids = (generator.pareto(1.0, EDITS) * 10).astype('int64') % USERS
+    page_ids = generator.randint(1, PAGES, EDITS).astype('int64')
+    return timestamps.astype('int64'), user_ids, page_ids
+
+
+def reference_histograms(timestamps, user_ids, page_ids):
+    '''The histograms of IntereventTimes for the users and the pages.'''
+    begin, end = [parse_timestamp(t) for t in DATE_RANGE]
+    histograms = dict()
+    for entity, keys in [('users', user_ids), ('pages', page_ids)]:
+        interevent_times = IntereventTimes(begin, end)
+        for time, user_id, key in zip(timestamps.tolist(), user_ids.tolist(),
+                                      keys.tolist()):
+            if user_id > 0:
+                interevent_times.add(key, time)
+        interevent_times.finish()
+        histograms[entity] = [
+            sorted((dt, count) for dt, count in counts.iteritems() if count)
+            for counts in [interevent_times.first_time_seen,
+                           interevent_times.interevent_times,
+                           interevent_times.last_time_seen]]
+    return histograms
+
+
+def chunked_histograms(timestamps, user_ids, page_ids, seed):
+    '''The histograms of EditIntereventTimes, with the edits added in
+       chunks of random sizes, some of them one row at a time.'''
+    generator = random.Random(seed)
+    edit_interevent_times = EditIntereventTimes()
+    position = 0
+    while position < len(timestamps):
+        size = generator.randint(1, MAX_CHUNK)
+        chunk = slice(position, position + size)
+        if generator.random() < 0.2:
+            for row in zip(timestamps[chunk].tolist(),
+                           user_ids[chunk].tolist(),
+                           page_ids[chunk].tolist()):
+                edit_interevent_times.add(*row)
+        else:
+            edit_interevent_times.add_columns(
+                timestamps[chunk], user_ids[chunk], page_ids[chunk])
+        position += size
+    edit_interevent_times._flush()
+    histograms = dict()
+    for entity in ['users', 'pages']:
+        interevent_times = edit_interevent_times.interevent_times[entity]
+        interevent_times.finish()
+        histograms[entity] = [
+            [(int(dt), int(count)) for dt, count in histogram_items(counts)]
+            for counts in [interevent_times.first_time_seen,
+                           interevent_times.interevent_times,
+                           interevent_times.last_time_seen]]
+    return histograms
+
+
+if __name__ == '__main__':
+    edits = synthetic_edits(1)
+    expected = reference_histograms(*edits)
+    failures = 0
+    for seed in xrange(3):
+        if chunked_histograms(*(edits + (seed,))) != expected:
+            print 'The histograms of the chunks of seed', seed, 'differ'
+            failures += 1
+    if failures:
+        sys.exit('The chunked histograms differ from IntereventTimes')
+    print 'The chunked histograms match IntereventTimes'
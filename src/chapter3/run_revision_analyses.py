@@ -0,0 +1,69 @@
+'''
+Run the analyses of the time-sorted Wikipedia revisions from a single pass
+over the data: the talk network of create_network.py, and the outputs of
+wikipedia_edit_interevent_times.py, wikipedia_edit_times_for_conditional_probs.py
+and wikipedia_select_bursty_users.py, each for its own date range.
+
+Run as
+python src/chapter3/run_revision_analyses.py [serial|thread|process]
+
+With 'thread' or 'process' the revisions are read and parsed in parallel
+with the analyses.
+'''
+
+import sys
+
+sys.path.append('src/python')
+sys.path.append('src/chapter2')
+from revision_store import open_revisions
+from timestamps import parse_timestamp
+from revision_pipeline import RevisionPipeline, THREAD
+from user_dictionary import UserDictionary
+
+import create_network
+import wikipedia_edit_interevent_times as interevent_times
+import wikipedia_edit_times_for_conditional_probs as conditional_probs
+import wikipedia_select_bursty_users as bursty_users
+
+
+INPUT_FILE = 'data/wikipedia/revisions_time_sorted.tsv.gz'
+
+
+def time_range(date_range):
+    return parse_timestamp(date_range[0]), parse_timestamp(date_range[1])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        mode = sys.argv[1]
+    else:
+        mode = THREAD
+
+    pipeline = RevisionPipeline(open_revisions(INPUT_FILE,
+                                               sorted_by_time=True))
+
+    # The user indices are the same as in the networks of create_network.py.
+    users = UserDictionary()
+    network = create_network.TalkNetwork(users)
+    pipeline.add_consumer(network.add, create_network.COLUMNS,
+                          *time_range(create_network.DATE_RANGE))
+
+    edit_interevent_times = interevent_times.EditIntereventTimes()
+    pipeline.add_consumer(edit_interevent_times.add, interevent_times.COLUMNS,
+                          *time_range(interevent_times.DATE_RANGE))
+
+    interevent_time_pairs = conditional_probs.EditIntereventTimePairs()
+    pipeline.add_consumer(interevent_time_pairs.add, conditional_probs.COLUMNS,
+                          *time_range(conditional_probs.DATE_RANGE))
+
+    one_week_revisions = bursty_users.OneWeekRevisions(bursty_users.OUTPUT_FILE)
+    pipeline.add_consumer(one_week_revisions.add, bursty_users.COLUMNS,
+                          *time_range(bursty_users.DATE_RANGE))
+
+    pipeline.run(mode)
+
+    network.write(create_network.OUTPUT_FILE)
+    edit_interevent_times.write(interevent_times.OUTPUT_FILE_PATTERN)
+    interevent_time_pairs.write(conditional_probs.OUTPUT_FILE_PATTERN)
+    one_week_revisions.close()
+    users.close()
@@ -6,21 +6,31 @@ end of the sampling period; however we do this to see very large
 interevent times only for infrequent events. 
 '''
 
-import sys, gzip, math
+import sys, math
 from collections import defaultdict
-from datetime import datetime
+import numpy as np
+
+sys.path.append('src/python')
+from interevent_histograms import IntereventHistograms, histogram_items
+from parallel_gzip import GzipWriter
+from revision_store import open_revisions, CHUNK_SIZE
+from timestamps import parse_timestamp
 
 
 INPUT_FILE = 'data/wikipedia/revisions_time_sorted.tsv.gz'
 OUTPUT_FILE_PATTERN = 'data/wikipedia/interedit_times_%s.tsv.gz'
 
 DATE_RANGE = ('2013-01-01T00:00:00Z', '2013-04-01T00:00:00Z')
-DATE_RANGE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 
 
 class IntereventTimes():
     '''A class to keep track of interevent times between arrivals of
-       certain events, such as for user edits and page changes.'''
+       certain events, such as for user edits and page changes.
+
+       The times are integer epoch seconds. This adds one event at a time,
+       and is kept as the reference for IntereventHistograms, which
+       EditIntereventTimes uses; src/chapter3/check_interevent_histograms.py
+       compares the two.'''
 
     LOG_BUCKET = math.log10(1e4) / 50
 
@@ -40,52 +50,80 @@ class IntereventTimes():
     def add(self, key, time):
         try:
             last_time = self.last_seen[key]
-            dt = self.discretize((time - last_time).total_seconds())
+            dt = self.discretize(time - last_time)
             self.interevent_times[dt] += 1
         except KeyError:
-            dt = self.discretize((time - self.sampling_begin_time).total_seconds())
+            dt = self.discretize(time - self.sampling_begin_time)
             self.first_time_seen[dt] += 1
         self.last_seen[key] = time
 
     def finish(self):
         for key, time in self.last_seen.iteritems():
-            dt = self.discretize((self.sampling_end_time - time).total_seconds())
+            dt = self.discretize(self.sampling_end_time - time)
             self.last_time_seen[dt] += 1
 
-# We want to calculate the interevent time distribution both for users'
-# actions and page edits, therefore we create a dictionary to hold these
-# histograms
-interevent_times = dict()
-for entity in ['users', 'pages']:
-    interevent_times[entity] = IntereventTimes(
-        datetime.strptime(DATE_RANGE[0], DATE_RANGE_FORMAT),
-        datetime.strptime(DATE_RANGE[1], DATE_RANGE_FORMAT))
-
-input_file = gzip.open(INPUT_FILE, 'r')
-for line in input_file:
-    title, namespace, page_id, rev_id, timestamp, user_id, user_name, ip = \
-        line[:-1].split('\t')
-    if timestamp < DATE_RANGE[0]:
-        continue
-    if timestamp >= DATE_RANGE[1]:
-        break
-    # We only keep registered users, and need to strip user ID 0 due to
-    # a logging bug (http://en.wikipedia.org/wiki/User:0)
-    if user_id != '' and user_id != '0':
-        user_id = int(user_id)
-        page_id = int(page_id)
-        timestamp = datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ')
-        interevent_times['users'].add(user_id, timestamp)
-        interevent_times['pages'].add(page_id, timestamp)
-input_file.close()
-
-for entity in ['users', 'pages']:
-    interevent_times[entity].finish()
-    output_file = gzip.open(OUTPUT_FILE_PATTERN % entity, 'w')
-    for dt, count in interevent_times[entity].first_time_seen.iteritems():
-        output_file.write('\t'.join(map(str, ['before_first', dt, count])) + '\n')
-    for dt, count in interevent_times[entity].interevent_times.iteritems():
-        output_file.write('\t'.join(map(str, ['interevent', dt, count])) + '\n')
-    for dt, count in interevent_times[entity].last_time_seen.iteritems():
-        output_file.write('\t'.join(map(str, ['after_last', dt, count])) + '\n')
-    output_file.close()
+
+# The columns of the revisions that EditIntereventTimes.add needs.
+COLUMNS = ['timestamp', 'user_id', 'page_id']
+
+
+class EditIntereventTimes():
+    '''The interevent times of the edits both for users and pages.'''
+
+    def __init__(self):
+        # We want to calculate the interevent time distribution both for
+        # users' actions and page edits, therefore we create a dictionary to
+        # hold these histograms
+        self.interevent_times = dict()
+        for entity in ['users', 'pages']:
+            self.interevent_times[entity] = IntereventHistograms(
+                parse_timestamp(DATE_RANGE[0]), parse_timestamp(DATE_RANGE[1]))
+        # The rows added one at a time, until there are CHUNK_SIZE of them
+        self._rows = []
+
+    def add(self, timestamp, user_id, page_id):
+        self._rows.append((timestamp, user_id, page_id))
+        if len(self._rows) >= CHUNK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            columns = [np.array(column, dtype='int64')
+                       for column in zip(*self._rows)]
+            self._rows = []
+            self.add_columns(*columns)
+
+    def add_columns(self, timestamps, user_ids, page_ids):
+        '''Add the arrays of the columns of a chunk of rows.'''
+        self._flush()
+        # We only keep registered users, and need to strip user ID 0 due to
+        # a logging bug (http://en.wikipedia.org/wiki/User:0)
+        registered = user_ids > 0
+        timestamps = timestamps[registered]
+        self.interevent_times['users'].add(user_ids[registered], timestamps)
+        self.interevent_times['pages'].add(page_ids[registered], timestamps)
+
+    def write(self, output_file_pattern):
+        self._flush()
+        for entity in ['users', 'pages']:
+            interevent_times = self.interevent_times[entity]
+            interevent_times.finish()
+            output_file = GzipWriter(output_file_pattern % entity)
+            for name, counts in [
+                    ('before_first', interevent_times.first_time_seen),
+                    ('interevent', interevent_times.interevent_times),
+                    ('after_last', interevent_times.last_time_seen)]:
+                for dt, count in histogram_items(counts):
+                    output_file.write('%s\t%d\t%d\n' % (name, dt, count))
+            output_file.close()
+
+
+if __name__ == '__main__':
+    edit_interevent_times = EditIntereventTimes()
+    # We read the columnar store of the input file if it has been built.
+    revisions = open_revisions(INPUT_FILE, sorted_by_time=True)
+    for columns in revisions.column_chunks(
+            COLUMNS, parse_timestamp(DATE_RANGE[0]),
+            parse_timestamp(DATE_RANGE[1])):
+        edit_interevent_times.add_columns(*columns)
+    edit_interevent_times.write(OUTPUT_FILE_PATTERN)
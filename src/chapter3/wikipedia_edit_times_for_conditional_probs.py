@@ -2,9 +2,13 @@
 The conditional time differences between edits of any user.
 '''
 
-import sys, gzip, math, random
+import sys, math, random
 from collections import defaultdict
-from datetime import datetime
+
+sys.path.append('src/python')
+from parallel_gzip import GzipWriter
+from revision_store import open_revisions
+from timestamps import parse_timestamp, format_timestamp
 
 
 INPUT_FILE = 'data/wikipedia/revisions_time_sorted.tsv.gz'
@@ -13,7 +17,6 @@ OUTPUT_FILE_PATTERN = 'data/wikipedia/interedit_times_pairs_sample_%s.tsv.gz'
 NUMBER_OF_SAMPLES = 1e7
 
 DATE_RANGE = ('2013-01-01T00:00:00Z', '2013-04-01T00:00:00Z')
-DATE_RANGE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 
 
 class ReservoirSample():
@@ -34,7 +37,7 @@ class ReservoirSample():
 
 class IntereventTimePairsSample():
     '''A class to print out the interarrival times so that we can run a
-    correlation test on them.'''
+    correlation test on them. The times are integer epoch seconds.'''
 
     def __init__(self, number_of_samples):
         self.reservoir = ReservoirSample(number_of_samples)
@@ -45,13 +48,13 @@ class IntereventTimePairsSample():
     def add(self, key, time):
         if key in self.last_seen:
             last_time = self.last_seen[key]
-            dt = int((time - last_time).total_seconds())
+            dt = time - last_time
             if key in self.last_dt:
                 last_dt = self.last_dt[key]
                 self.reservoir.add_item((last_dt, dt))
                 self.items_added += 1
                 if self.items_added == 1e6:
-                    print time
+                    print format_timestamp(time)
             self.last_dt[key] = dt
         self.last_seen[key] = time
 
@@ -60,27 +63,34 @@ class IntereventTimePairsSample():
             outstream.write('\t'.join(map(str, items)) + '\n')
 
 
-interevent_times = dict()
-for entity in ['users', 'pages']:
-    outstream = gzip.open(OUTPUT_FILE_PATTERN % entity, 'w')
-    interevent_times[entity] = IntereventTimePairsSample(NUMBER_OF_SAMPLES)
-
-input_file = gzip.open(INPUT_FILE, 'r')
-for line in input_file:
-    title, namespace, page_id, rev_id, timestamp, user_id, user_name, ip = \
-        line[:-1].split('\t')
-    if timestamp < DATE_RANGE[0]:
-        continue
-    if timestamp >= DATE_RANGE[1]:
-        break
-    if user_id != '' and user_id != '0':
-        user_id = int(user_id)
-        page_id = int(page_id)
-        timestamp = datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ')
-        interevent_times['users'].add(user_id, timestamp)
-        interevent_times['pages'].add(page_id, timestamp)
-input_file.close()
-
-for entity in ['users', 'pages']:
-    with gzip.open(OUTPUT_FILE_PATTERN % entity, 'w') as outstream:
-        interevent_times[entity].write_results(outstream)
+# The columns of the revisions that EditIntereventTimePairs.add needs.
+COLUMNS = ['timestamp', 'user_id', 'page_id']
+
+
+class EditIntereventTimePairs():
+    '''The samples of consecutive interevent times for users and pages.'''
+
+    def __init__(self):
+        self.interevent_times = dict()
+        for entity in ['users', 'pages']:
+            self.interevent_times[entity] = \
+                IntereventTimePairsSample(NUMBER_OF_SAMPLES)
+
+    def add(self, timestamp, user_id, page_id):
+        if user_id > 0:
+            self.interevent_times['users'].add(user_id, timestamp)
+            self.interevent_times['pages'].add(page_id, timestamp)
+
+    def write(self, output_file_pattern):
+        for entity in ['users', 'pages']:
+            with GzipWriter(output_file_pattern % entity) as outstream:
+                self.interevent_times[entity].write_results(outstream)
+
+
+if __name__ == '__main__':
+    interevent_time_pairs = EditIntereventTimePairs()
+    revisions = open_revisions(INPUT_FILE, sorted_by_time=True)
+    for row in revisions.rows(COLUMNS, parse_timestamp(DATE_RANGE[0]),
+                              parse_timestamp(DATE_RANGE[1])):
+        interevent_time_pairs.add(*row)
+    interevent_time_pairs.write(OUTPUT_FILE_PATTERN)
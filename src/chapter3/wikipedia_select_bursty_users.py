@@ -2,28 +2,46 @@
 The time differences between edits for any user for one week.
 '''
 
-import sys, gzip
+import sys
 from collections import defaultdict
 from datetime import datetime
 
+sys.path.append('src/python')
+from parallel_gzip import GzipWriter
+from revision_store import open_revisions
+from timestamps import parse_timestamp, format_timestamp
+
 
 INPUT_FILE = 'data/wikipedia/revisions_time_sorted.tsv.gz'
 OUTPUT_FILE = 'data/wikipedia/revisions_only_for_one_week.tsv.gz'
 
 DATE_RANGE = ('2013-01-01T00:00:00Z', '2013-01-08T00:00:00Z')
 
-input_file = gzip.open(INPUT_FILE, 'r')
-output_file = gzip.open(OUTPUT_FILE, 'w')
-for line in input_file:
-    title, namespace, page_id, rev_id, timestamp, user_id, user_name, ip = \
-        line[:-1].split('\t')
-    if timestamp < DATE_RANGE[0]:
-        continue
-    if timestamp >= DATE_RANGE[1]:
-        break
-    # We only keep registered users, and need to strip user ID 0 due to
-    # a logging bug (http://en.wikipedia.org/wiki/User:0)
-    if user_id != '' and user_id != '0':
-        output_file.write('\t'.join([user_id, page_id, timestamp]) + '\n')
-input_file.close()
-output_file.close()
+# The columns of the revisions that OneWeekRevisions.add needs.
+COLUMNS = ['timestamp', 'user_id', 'page_id']
+
+
+class OneWeekRevisions():
+    '''Write out the user, page and time of the revisions.'''
+
+    def __init__(self, output_file_name):
+        self.output_file = GzipWriter(output_file_name)
+
+    def add(self, timestamp, user_id, page_id):
+        # We only keep registered users, and need to strip user ID 0 due to
+        # a logging bug (http://en.wikipedia.org/wiki/User:0)
+        if user_id > 0:
+            self.output_file.write('\t'.join(
+                [str(user_id), str(page_id), format_timestamp(timestamp)]) + '\n')
+
+    def close(self):
+        self.output_file.close()
+
+
+if __name__ == '__main__':
+    one_week_revisions = OneWeekRevisions(OUTPUT_FILE)
+    revisions = open_revisions(INPUT_FILE, sorted_by_time=True)
+    for row in revisions.rows(COLUMNS, parse_timestamp(DATE_RANGE[0]),
+                              parse_timestamp(DATE_RANGE[1])):
+        one_week_revisions.add(*row)
+    one_week_revisions.close()
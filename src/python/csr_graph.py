@@ -0,0 +1,201 @@
+'''
+A directed graph in compressed sparse row (CSR) form, for edge lists that
+are too large for Python sets and lists, such as the LiveJournal links.
+
+The nodes are the integer IDs of the edge list, and the edges of node u are
+indices[indptr[u]:indptr[u + 1]], sorted, for both the outgoing and the
+incoming edges. Duplicate edges are kept only once.
+
+Parsing the edge list takes most of the time, so load_graph keeps the
+arrays in .npy files next to it, and later runs map those into memory
+instead. The cache is rebuilt when the size or modification time of the
+edge list changes.
+'''
+
+import os, sys, json
+import numpy as np
+
+from parallel_gzip import read_blocks
+
+
+# The bytes of the edge list parsed at a time.
+READ_CHUNK_SIZE = 64 * 1024 * 1024
+# The number of edges returned at a time by CSRGraph.edges.
+EDGE_CHUNK_SIZE = 1024 * 1024
+
+ARRAYS = ['out_indptr', 'out_indices', 'in_indptr', 'in_indices']
+
+
+def read_edge_list(path, chunk_size=READ_CHUNK_SIZE, columns=2):
+    '''Read the source and destination int32 arrays of a gzipped edge list
+       with a whitespace-separated pair of node IDs on every line, followed
+       by columns - 2 other integers, such as the weights, which are
+       dropped.'''
+    chunks = []
+    for data in read_blocks(path, size=chunk_size):
+        values = np.fromstring(data, dtype='int64', sep=' ')
+        # fromstring stops at the first token that is not an integer
+        # without saying so.
+        lines = data.count('\n') + (data[-1:] not in ('', '\n'))
+        if len(values) != lines * columns:
+            raise ValueError('%s has a line without %d integers'
+                             % (path, columns))
+        chunks.append(values.astype('int32'))
+        sys.stderr.write('%d M edges read    \r' %
+                         (sum(len(c) for c in chunks) / 2 / 1000000))
+    sys.stderr.write('\n')
+    pairs = np.concatenate(chunks) if chunks else np.zeros(0, dtype='int32')
+    pairs = pairs.reshape(-1, columns)
+    return pairs[:, 0].copy(), pairs[:, 1].copy()
+
+
+def _indptr(nodes, node_count):
+    '''The row pointers for the sorted row indices `nodes`.'''
+    indptr = np.zeros(node_count + 1, dtype='int64')
+    np.cumsum(np.bincount(nodes, minlength=node_count), out=indptr[1:])
+    return indptr
+
+
+def _gather(indptr, indices, nodes):
+    '''The concatenated rows of the nodes.'''
+    starts = indptr[nodes]
+    lengths = indptr[np.asarray(nodes) + 1] - starts
+    # The position of every item of the result in `indices`
+    positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + \
+        np.arange(lengths.sum())
+    return indices[positions]
+
+
+class CSRGraph():
+    '''The outgoing and incoming edges of a directed graph in CSR form.'''
+
+    def __init__(self, out_indptr, out_indices, in_indptr, in_indices):
+        self.out_indptr = out_indptr
+        self.out_indices = out_indices
+        self.in_indptr = in_indptr
+        self.in_indices = in_indices
+        self.node_count = len(out_indptr) - 1
+        self.edge_count = len(out_indices)
+
+    @classmethod
+    def from_edges(cls, sources, destinations, node_count=None):
+        '''Build the graph from arrays of edge sources and destinations.'''
+        sources = np.asarray(sources, dtype='int64')
+        destinations = np.asarray(destinations, dtype='int64')
+        if node_count is None:
+            node_count = int(max(sources.max(), destinations.max())) + 1 \
+                if len(sources) > 0 else 0
+        # Sort the edges by source and then by destination, and drop the
+        # duplicates.
+        keys = np.unique(sources * node_count + destinations)
+        sources = (keys // node_count).astype('int32')
+        destinations = (keys % node_count).astype('int32')
+        del keys
+        # The edges are sorted by source, so a stable sort by destination
+        # leaves the sources of every destination sorted.
+        order = np.argsort(destinations, kind='mergesort')
+        return cls(_indptr(sources, node_count), destinations,
+                   _indptr(destinations[order], node_count), sources[order])
+
+    def out_degrees(self):
+        return np.diff(self.out_indptr)
+
+    def in_degrees(self):
+        return np.diff(self.in_indptr)
+
+    def nodes(self):
+        '''The nodes with at least one edge.'''
+        return np.flatnonzero((self.out_degrees() > 0) |
+                              (self.in_degrees() > 0))
+
+    def successors(self, node):
+        return self.out_indices[self.out_indptr[node]:self.out_indptr[node + 1]]
+
+    def predecessors(self, node):
+        return self.in_indices[self.in_indptr[node]:self.in_indptr[node + 1]]
+
+    def neighbors(self, node):
+        '''The sorted nodes linked to or from the node.'''
+        return np.union1d(self.successors(node), self.predecessors(node))
+
+    def successors_of(self, nodes):
+        '''The concatenated successors of the nodes.'''
+        return _gather(self.out_indptr, self.out_indices, nodes)
+
+    def predecessors_of(self, nodes):
+        '''The concatenated predecessors of the nodes.'''
+        return _gather(self.in_indptr, self.in_indices, nodes)
+
+    def edges(self, chunk_size=EDGE_CHUNK_SIZE):
+        '''Yield the (sources, destinations) arrays of the edges in chunks,
+           ordered by source.'''
+        for begin in xrange(0, self.edge_count, chunk_size):
+            yield self.edge_range(begin, min(begin + chunk_size,
+                                             self.edge_count))
+
+    def edge_range(self, begin, end):
+        '''The (sources, destinations) arrays of the edges from the begin-th
+           to the end-th in the order of edges().'''
+        # The sources are the rows in which the edges fall.
+        sources = np.searchsorted(self.out_indptr, np.arange(begin, end),
+                                  side='right') - 1
+        return sources.astype('int32'), self.out_indices[begin:end]
+
+    def save(self, directory, source=None):
+        '''Save the arrays, with the size and modification time of the file
+           the graph was built from, if given.'''
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+        # The metadata is written last, so that a partly written cache is not
+        # used.
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'source': source_signature(source),
+                       'nodes': self.node_count, 'edges': self.edge_count}, f)
+
+    @classmethod
+    def load(cls, directory, source=None):
+        '''Map a saved graph into memory, or return None if there is none,
+           or it was built from a different version of the source file.'''
+        try:
+            with open(os.path.join(directory, 'meta.json')) as f:
+                meta = json.load(f)
+        except IOError:
+            return None
+        if source is not None and meta['source'] != source_signature(source):
+            return None
+        return cls(*[np.load(os.path.join(directory, name + '.npy'),
+                             mmap_mode='r') for name in ARRAYS])
+
+
+def source_signature(path):
+    '''The size and modification time of a file.'''
+    if path is None:
+        return None
+    return [os.path.getsize(path), int(os.path.getmtime(path))]
+
+
+def cache_path(edge_file):
+    '''The directory of the cached arrays of an edge list file, e.g.
+       data/livejournal/livejournal-links.csr for
+       data/livejournal/livejournal-links.txt.gz.'''
+    base = edge_file
+    for suffix in ['.gz', '.txt', '.tsv']:
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+    return base + '.csr'
+
+
+def load_graph(edge_file, cache_directory=None, columns=2):
+    '''Load the graph of an edge list file from its cache, and build the
+       cache first if it is missing or out of date. columns is the number
+       of columns of the edge list.'''
+    if cache_directory is None:
+        cache_directory = cache_path(edge_file)
+    graph = CSRGraph.load(cache_directory, edge_file)
+    if graph is None:
+        graph = CSRGraph.from_edges(*read_edge_list(edge_file,
+                                                    columns=columns))
+        graph.save(cache_directory, edge_file)
+    return graph
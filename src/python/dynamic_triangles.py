@@ -0,0 +1,154 @@
+'''
+Keep the triangle counts and clustering coefficients of a changing graph up
+to date as edges are added and removed, instead of recounting them all.
+
+The graph is directed, and the counts are those of triangle_counts.py: the
+neighbors of a node are the nodes it links to or from, and the links of a
+node are the directed edges among its neighbors. The local clustering
+coefficient is links / (k (k - 1)) for k neighbors. An undirected graph
+is kept as a directed graph with the edges in both directions, so its
+clustering coefficients are the usual ones.
+
+When the edge u -> v is added or removed only the triangles through u and
+v change, so an update walks the neighbors of the endpoint with fewer of
+them, and costs time proportional to the smaller degree. Self-loops are
+ignored.
+'''
+
+
+# The bits of the link between a node and its neighbor
+OUT = 1             # from the node to the neighbor
+IN = 2              # from the neighbor to the node
+# The number of directed edges for the bits
+EDGES = [0, 1, 1, 2]
+
+
+class DynamicTriangles():
+    '''The triangles of a graph that changes one edge at a time.'''
+
+    def __init__(self, directed=True):
+        self.directed = directed
+        # node -> {neighbor: the OUT and IN bits of the links between them}
+        self._neighbors = dict()
+        self._triangles = dict()    # node -> the triangles through it
+        self._links = dict()        # node -> the links among its neighbors
+        self.edge_count = 0         # The directed edges
+        self.triangle_count = 0     # The triangles of the undirected graph
+        # The pairs of neighbors of the nodes, the number of triangles the
+        # nodes could be in
+        self.wedge_count = 0
+
+    def __contains__(self, edge):
+        u, v = edge
+        return self._neighbors.get(u, {}).get(v, 0) & OUT != 0
+
+    def __len__(self):
+        '''The number of nodes with neighbors.'''
+        return len(self._neighbors)
+
+    def nodes(self):
+        return self._neighbors.iterkeys()
+
+    def degree(self, node):
+        '''The number of distinct neighbors of the node.'''
+        return len(self._neighbors.get(node, ()))
+
+    def triangles(self, node):
+        return self._triangles.get(node, 0)
+
+    def links(self, node):
+        '''The number of directed edges among the neighbors of the node.'''
+        return self._links.get(node, 0)
+
+    def clustering(self, node):
+        '''The local clustering coefficient, or None with fewer than two
+           neighbors.'''
+        k = self.degree(node)
+        if k < 2:
+            return None
+        return float(self.links(node)) / (k * (k - 1))
+
+    def global_clustering(self):
+        '''The fraction of the pairs of neighbors that are linked, in the
+           undirected graph.'''
+        if self.wedge_count == 0:
+            return None
+        return 3.0 * self.triangle_count / self.wedge_count
+
+    def add_edge(self, u, v):
+        '''Add the edge u -> v, and v -> u for an undirected graph. Returns
+           whether the graph changed.'''
+        changed = self._update(u, v, True)
+        if not self.directed:
+            changed = self._update(v, u, True) or changed
+        return changed
+
+    def remove_edge(self, u, v):
+        '''Remove the edge u -> v, and v -> u for an undirected graph.
+           Returns whether the graph changed.'''
+        changed = self._update(u, v, False)
+        if not self.directed:
+            changed = self._update(v, u, False) or changed
+        return changed
+
+    def _update(self, u, v, add):
+        if u == v:
+            return False
+        u_neighbors = self._neighbors.setdefault(u, dict())
+        v_neighbors = self._neighbors.setdefault(v, dict())
+        bits = u_neighbors.get(v, 0)
+        if add == (bits & OUT != 0):
+            # Nothing to add or remove
+            self._forget(u)
+            self._forget(v)
+            return False
+        new_bits = bits ^ OUT
+        sign = 1 if add else -1
+        # The change in the number of directed edges between u and v
+        weight_change = EDGES[new_bits] - EDGES[bits]
+        if bits == 0 or new_bits == 0:
+            # u and v become neighbors, or stop being neighbors.
+            for w in self._common_neighbors(u_neighbors, v_neighbors):
+                self.triangle_count += sign
+                for node in (u, v, w):
+                    self._triangles[node] = \
+                        self._triangles.get(node, 0) + sign
+                # The links between v and w are among the neighbors of u
+                # now, or not any more, and likewise for v.
+                self._add_links(u, sign * EDGES[v_neighbors[w]])
+                self._add_links(v, sign * EDGES[u_neighbors[w]])
+                self._add_links(w, weight_change)
+            for neighbors in (u_neighbors, v_neighbors):
+                # k (k - 1) / 2 pairs of neighbors for k neighbors
+                self.wedge_count += sign * (len(neighbors) -
+                                            (0 if add else 1))
+        else:
+            # Only the number of links between the neighbors changes.
+            for w in self._common_neighbors(u_neighbors, v_neighbors):
+                self._add_links(w, weight_change)
+        if new_bits == 0:
+            del u_neighbors[v]
+            del v_neighbors[u]
+        else:
+            u_neighbors[v] = new_bits
+            # OUT and IN swap when seen from v.
+            v_neighbors[u] = ((new_bits & OUT) << 1) | ((new_bits & IN) >> 1)
+        self.edge_count += sign
+        self._forget(u)
+        self._forget(v)
+        return True
+
+    def _common_neighbors(self, u_neighbors, v_neighbors):
+        if len(u_neighbors) > len(v_neighbors):
+            u_neighbors, v_neighbors = v_neighbors, u_neighbors
+        return [w for w in u_neighbors if w in v_neighbors]
+
+    def _add_links(self, node, change):
+        self._links[node] = self._links.get(node, 0) + change
+
+    def _forget(self, node):
+        '''Drop a node without neighbors.'''
+        if not self._neighbors.get(node, True):
+            del self._neighbors[node]
+            self._triangles.pop(node, None)
+            self._links.pop(node, None)
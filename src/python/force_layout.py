@@ -0,0 +1,189 @@
+'''
+A force-directed graph layout for large neighborhoods, with the forces of
+the Fruchterman-Reingold algorithm of networkx.spring_layout: every pair of
+nodes at distance d repels with k^2 / d and every edge attracts with
+d^2 / k, where k is the optimal distance between the nodes.
+
+networkx computes the repulsion of all pairs of nodes in every iteration.
+Here the plane is divided into a grid of square cells. The repulsion
+between the nodes in neighboring cells is computed exactly. The nodes of
+the other cells repel as if they were at the center of their cell, which
+is a convolution of the number of nodes per cell with the force between
+the cells, done with an FFT. An iteration thus takes about
+O(n + m + c log c) time for n nodes, m edges and c cells.
+'''
+
+import numpy as np
+
+
+ITERATIONS = 50
+# The iterations stop when the nodes move less than this on average.
+THRESHOLD = 1e-4
+# The most cells of the grid along each axis
+MAX_GRID = 256
+# The closest two nodes are taken to be.
+MIN_DISTANCE = 0.01
+
+
+def _repulsion_kernel(size, cell_size, k):
+    '''The x and y of the force that a node exerts on a node the given
+       number of cells away, for the offsets -size...size in both axes,
+       except for the neighboring cells, which are zero.'''
+    offsets = np.arange(-size, size + 1) * cell_size
+    x, y = np.meshgrid(offsets, offsets, indexing='ij')
+    distance2 = np.maximum(x * x + y * y, MIN_DISTANCE ** 2)
+    strength = k * k / distance2
+    strength[size - 1:size + 2, size - 1:size + 2] = 0
+    return x * strength, y * strength
+
+
+def _far_repulsion(counts, cell_size, k):
+    '''The x and y of the force on a node in every cell from the nodes in
+       the cells that are not next to it, given the number of nodes per
+       cell.'''
+    m = counts.shape[0]
+    # A circular convolution of a power of two size at least 2m - 1 does
+    # not wrap the offsets -(m - 1)...m - 1 around.
+    size = 1
+    while size < 2 * m - 1:
+        size *= 2
+    transform = np.fft.rfft2(counts, (size, size))
+    forces = []
+    for kernel in _repulsion_kernel(m - 1, cell_size, k):
+        # The kernel with the offset 0 at [0, 0] and the negative offsets
+        # at the end
+        wrapped = np.zeros((size, size))
+        wrapped[:2 * m - 1, :2 * m - 1] = kernel
+        wrapped = np.roll(np.roll(wrapped, 1 - m, axis=0), 1 - m, axis=1)
+        forces.append(np.fft.irfft2(transform * np.fft.rfft2(wrapped),
+                                    (size, size))[:m, :m])
+    return forces
+
+
+def _near_pairs(cells, grid_size):
+    '''The pairs (i, j) of distinct nodes in the same or neighboring cells,
+       given the (x, y) cells of the nodes, every pair once.'''
+    cell_ids = cells[:, 0] * grid_size + cells[:, 1]
+    order = np.argsort(cell_ids, kind='mergesort')
+    counts = np.bincount(cell_ids, minlength=grid_size * grid_size)
+    starts = np.cumsum(counts) - counts
+    first, second = [], []
+    # Half of the neighboring cells, so that every pair of cells is looked
+    # at once
+    for dx, dy in [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]:
+        x, y = cells[:, 0] + dx, cells[:, 1] + dy
+        valid = np.flatnonzero((x >= 0) & (x < grid_size) &
+                               (y >= 0) & (y < grid_size))
+        neighbor_cells = x[valid] * grid_size + y[valid]
+        lengths = counts[neighbor_cells]
+        # The positions in `order` of the nodes of the neighbor cells
+        positions = np.repeat(starts[neighbor_cells] -
+                              (np.cumsum(lengths) - lengths), lengths) + \
+            np.arange(lengths.sum())
+        i = np.repeat(valid, lengths)
+        j = order[positions]
+        if dx == dy == 0:
+            pairs = i < j
+            i, j = i[pairs], j[pairs]
+        first.append(i)
+        second.append(j)
+    return np.concatenate(first), np.concatenate(second)
+
+
+def layout(node_count, sources, destinations, positions=None,
+           iterations=ITERATIONS, k=None, threshold=THRESHOLD, seed=None):
+    '''The positions of the nodes 0...node_count - 1 of the graph with the
+       given edges, as a node_count x 2 array scaled to [-1, 1].
+
+    positions, if given, are the initial positions, e.g. of an earlier
+    layout of the graph, as an array with rows of NaN for the nodes that
+    should start at random.
+    '''
+    n = node_count
+    random = np.random.RandomState(seed)
+    sources = np.asarray(sources, dtype='int64')
+    destinations = np.asarray(destinations, dtype='int64')
+    keep = sources != destinations
+    sources, destinations = sources[keep], destinations[keep]
+    if positions is None:
+        positions = random.random_sample((n, 2))
+    else:
+        positions = np.array(positions, dtype='float64')
+        missing = np.isnan(positions).any(axis=1)
+        known = positions[~missing]
+        low, high = (known.min(axis=0), known.max(axis=0)) \
+            if len(known) > 0 else (np.zeros(2), np.ones(2))
+        positions[missing] = low + random.random_sample(
+            (np.count_nonzero(missing), 2)) * np.maximum(high - low, 1e-3)
+    if n <= 1:
+        return np.zeros((n, 2))
+    if k is None:
+        k = np.sqrt(1.0 / n)
+    # The largest move, cooling down linearly
+    step = (positions.max(axis=0) - positions.min(axis=0)).max() * 0.1
+    cooling = step / (iterations + 1)
+    for iteration in xrange(iterations):
+        low = positions.min(axis=0)
+        extent = (positions.max(axis=0) - low).max()
+        cell_size = max(k, extent / (MAX_GRID - 1))
+        grid_size = int(extent / cell_size) + 1
+        cells = np.minimum(((positions - low) / cell_size).astype('int64'),
+                           grid_size - 1)
+        displacement = np.zeros((n, 2))
+        # The repulsion of the nodes in the cells further away
+        if grid_size > 2:
+            counts = np.bincount(cells[:, 0] * grid_size + cells[:, 1],
+                                 minlength=grid_size * grid_size) \
+                .reshape(grid_size, grid_size).astype('float64')
+            for axis, force in enumerate(_far_repulsion(counts, cell_size,
+                                                        k)):
+                displacement[:, axis] += force[cells[:, 0], cells[:, 1]]
+        # The repulsion of the nodes in the same and neighboring cells
+        i, j = _near_pairs(cells, grid_size)
+        delta = positions[i] - positions[j]
+        distance2 = np.maximum((delta * delta).sum(axis=1),
+                               MIN_DISTANCE ** 2)
+        for axis in (0, 1):
+            push = delta[:, axis] * k * k / distance2
+            displacement[:, axis] += np.bincount(i, push, minlength=n) - \
+                np.bincount(j, push, minlength=n)
+        # The attraction of the edges
+        delta = positions[sources] - positions[destinations]
+        distance = np.maximum(np.sqrt((delta * delta).sum(axis=1)),
+                              MIN_DISTANCE)
+        for axis in (0, 1):
+            pull = delta[:, axis] * distance / k
+            displacement[:, axis] += np.bincount(destinations, pull,
+                                                 minlength=n) - \
+                np.bincount(sources, pull, minlength=n)
+        length = np.sqrt((displacement * displacement).sum(axis=1))
+        length[length < MIN_DISTANCE] = 0.1
+        moves = displacement * (step / length)[:, np.newaxis]
+        positions += moves
+        step -= cooling
+        if np.sqrt((moves * moves).sum()) / n < threshold:
+            break
+    positions -= positions.mean(axis=0)
+    return positions / max(np.abs(positions).max(), 1e-12)
+
+
+def spring_layout(graph, pos=None, iterations=ITERATIONS, k=None,
+                  threshold=THRESHOLD, seed=None):
+    '''Lay out a networkx graph, like networkx.spring_layout.
+
+    pos is an optional dictionary of initial positions for some of the
+    nodes. Returns a dictionary of the positions by node, which the
+    networkx drawing functions take.
+    '''
+    nodes = list(graph.nodes())
+    index = dict((node, i) for i, node in enumerate(nodes))
+    edges = np.array([(index[u], index[v]) for u, v in graph.edges()],
+                     dtype='int64').reshape(-1, 2)
+    positions = None
+    if pos is not None:
+        positions = np.array([pos.get(node, (np.nan, np.nan))
+                              for node in nodes], dtype='float64') \
+            .reshape(-1, 2)
+    positions = layout(len(nodes), edges[:, 0], edges[:, 1], positions,
+                       iterations, k, threshold, seed)
+    return dict(zip(nodes, positions))
@@ -0,0 +1,104 @@
+'''
+Histograms of the times between the events of every key, such as the edits
+of every user or of every page, in logarithmic buckets.
+
+The events are added in chunks of integer key and time arrays, in the order
+they happened. A chunk is stably sorted by key, so the events of a key stay
+in order and the times between them are the differences of neighbors. The
+time of the last event of every key seen so far is kept for the next chunk,
+in arrays sorted by key.
+
+IntereventTimes in src/chapter3/wikipedia_edit_interevent_times.py counts
+the same histograms one event at a time.
+'''
+
+import math
+import numpy as np
+
+
+# The width of the buckets in log10 seconds, 50 buckets up to 10^4 seconds.
+LOG_BUCKET = math.log10(1e4) / 50
+
+
+def discretize(values):
+    '''The buckets of an array of times in seconds; 0 is in bucket -1.'''
+    values = np.asarray(values, dtype='int64')
+    buckets = np.full(len(values), -1, dtype='int64')
+    positive = values > 0
+    buckets[positive] = (np.log10(values[positive].astype('float64')) /
+                         LOG_BUCKET).astype('int64')
+    return buckets
+
+
+def add_counts(counts, buckets):
+    '''Add the buckets to the histogram counts, which holds the number of
+       times bucket - 1 occurs at index bucket.'''
+    added = np.bincount(buckets + 1)
+    if len(added) > len(counts):
+        counts = np.concatenate([counts, np.zeros(len(added) - len(counts),
+                                                  dtype='int64')])
+    counts[:len(added)] += added
+    return counts
+
+
+def histogram_items(counts):
+    '''The (bucket, count) pairs of the nonempty buckets of the counts.'''
+    return [(bucket - 1, counts[bucket]) for bucket in np.flatnonzero(counts)]
+
+
+class IntereventHistograms():
+    '''The histograms of the times from the beginning of the sampling period
+       to the first event of every key, between the events of a key, and
+       from the last event of every key to the end of the period. The times
+       are integer epoch seconds.'''
+
+    def __init__(self, sampling_begin_time, sampling_end_time):
+        self.sampling_begin_time, self.sampling_end_time = \
+            (sampling_begin_time, sampling_end_time)
+        self.first_time_seen = np.zeros(0, dtype='int64')
+        self.interevent_times = np.zeros(0, dtype='int64')
+        self.last_time_seen = np.zeros(0, dtype='int64')
+        # The keys seen so far, sorted, and the time of their last event
+        self._keys = np.zeros(0, dtype='int64')
+        self._last_times = np.zeros(0, dtype='int64')
+
+    def add(self, keys, times):
+        '''Add a chunk of events, which happened after the ones added
+           before.'''
+        keys = np.asarray(keys, dtype='int64')
+        times = np.asarray(times, dtype='int64')
+        if len(keys) == 0:
+            return
+        order = np.argsort(keys, kind='mergesort')
+        keys, times = keys[order], times[order]
+        starts = np.ones(len(keys), dtype=bool)
+        starts[1:] = keys[1:] != keys[:-1]
+        self.interevent_times = add_counts(
+            self.interevent_times,
+            discretize((times[1:] - times[:-1])[~starts[1:]]))
+
+        # The first event of a key in the chunk follows its last one in the
+        # chunks before, if it has been seen.
+        first_keys, first_times = keys[starts], times[starts]
+        positions = np.searchsorted(self._keys, first_keys)
+        seen = positions < len(self._keys)
+        seen[seen] = self._keys[positions[seen]] == first_keys[seen]
+        self.interevent_times = add_counts(
+            self.interevent_times,
+            discretize(first_times[seen] - self._last_times[positions[seen]]))
+        self.first_time_seen = add_counts(
+            self.first_time_seen,
+            discretize(first_times[~seen] - self.sampling_begin_time))
+
+        last_times = times[np.append(np.flatnonzero(starts)[1:],
+                                     len(keys)) - 1]
+        self._last_times[positions[seen]] = last_times[seen]
+        # The new keys are sorted, so inserting them keeps the order.
+        new = positions[~seen]
+        self._keys = np.insert(self._keys, new, first_keys[~seen])
+        self._last_times = np.insert(self._last_times, new, last_times[~seen])
+
+    def finish(self):
+        self.last_time_seen = add_counts(
+            np.zeros(0, dtype='int64'),
+            discretize(self.sampling_end_time - self._last_times))
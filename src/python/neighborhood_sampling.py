@@ -0,0 +1,193 @@
+'''
+Find the neighborhoods of random nodes of a large graph that meet limits on
+their size and density, for plotting, without a networkx graph of the whole
+network.
+
+The neighborhood of a center is the subgraph induced by the nodes within
+max_distance hops of it in the undirected graph. The neighborhoods of many
+centers are walked at once with a breadth first search on the CSR arrays,
+one hop at a time, and a center is dropped as soon as its neighborhood is
+too large, or reaches a node closer than max_distance hops with too many
+neighbors: all the neighbors of such a node are in the neighborhood, so it
+breaks the degree limit. The search thus never walks through the hubs. The
+edges among the nodes found are looked up from the endpoint with the lower
+degree, so the hubs at the last hop cost little as well.
+'''
+
+import numpy as np
+
+from csr_graph import CSRGraph
+
+
+MAX_DISTANCE = 3
+# The neighborhoods have fewer edges than MAX_EDGES, more than
+# EDGE_FRACTION[0] and fewer than EDGE_FRACTION[1] edges per node, and no
+# node with MAX_DEGREE or more neighbors.
+MAX_EDGES = 3000
+EDGE_FRACTION = (2, 4)
+MAX_DEGREE = 200
+# The number of centers walked at once.
+BATCH_SIZE = 16
+
+
+def _contains(sorted_keys, keys):
+    '''Whether each of the keys is in the sorted array.'''
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype='bool')
+    positions = np.searchsorted(sorted_keys, keys)
+    positions[positions == len(sorted_keys)] = 0
+    return sorted_keys[positions] == keys
+
+
+def _rows(graph, nodes):
+    '''The concatenated successors of the nodes, and the position in `nodes`
+       of the node of every successor.'''
+    lengths = graph.out_indptr[nodes + 1] - graph.out_indptr[nodes]
+    return graph.successors_of(nodes), \
+        np.repeat(np.arange(len(nodes)), lengths)
+
+
+class Neighborhood():
+    '''The nodes within some hops of a center, and the edges among them.'''
+
+    def __init__(self, center, nodes, hops, sources, destinations):
+        self.center = center
+        self.nodes = nodes
+        self.hops = hops                # The distances from the center
+        self.sources = sources
+        self.destinations = destinations
+
+    def distances(self):
+        return dict(zip(self.nodes.tolist(), self.hops.tolist()))
+
+    def graph(self):
+        '''The neighborhood as an undirected networkx graph.'''
+        # networkx is only needed by the scripts that draw the graphs.
+        import networkx as nx
+        graph = nx.Graph()
+        graph.add_edges_from(zip(self.sources.tolist(),
+                                 self.destinations.tolist()))
+        return graph
+
+
+class NeighborhoodSampler():
+    '''Draw the neighborhoods of random centers until one meets the limits.
+
+    graph is a CSRGraph; the directions of its edges and its self-loops are
+    ignored.
+    '''
+
+    def __init__(self, graph, max_distance=MAX_DISTANCE, max_edges=MAX_EDGES,
+                 edge_fraction=EDGE_FRACTION, max_degree=MAX_DEGREE,
+                 seed=None):
+        self.max_distance = max_distance
+        self.max_edges = max_edges
+        self.edge_fraction = edge_fraction
+        self.max_degree = max_degree
+        self.random = np.random.RandomState(seed)
+        n = graph.node_count
+        self._node_count = n
+        sources, destinations = [], []
+        for s, d in graph.edges():
+            keep = s != d
+            sources.append(s[keep])
+            destinations.append(d[keep])
+        sources = np.concatenate(sources + [np.zeros(0, dtype='int32')])
+        destinations = np.concatenate(destinations +
+                                      [np.zeros(0, dtype='int32')])
+        # The undirected graph, with the neighbors of u in its out lists
+        undirected = CSRGraph.from_edges(
+            np.concatenate([sources, destinations]),
+            np.concatenate([destinations, sources]), n)
+        self._undirected = undirected
+        self.degrees = undirected.out_degrees()
+        self.nodes = np.flatnonzero(self.degrees > 0)
+        self.edge_count = undirected.edge_count // 2
+        # Every edge once, from the endpoint of the lower (degree, node)
+        # rank
+        rank = np.empty(n, dtype='int64')
+        rank[np.lexsort((np.arange(n), self.degrees))] = np.arange(n)
+        sources, destinations = undirected.edge_range(0, undirected.edge_count)
+        forward = rank[sources] < rank[destinations]
+        self._oriented = CSRGraph.from_edges(sources[forward],
+                                             destinations[forward], n)
+
+    def max_nodes(self):
+        '''A neighborhood with this many nodes would need at least
+           max_edges edges to be dense enough.'''
+        return int(np.ceil(float(self.max_edges) / self.edge_fraction[0]))
+
+    def neighborhoods(self, centers):
+        '''The neighborhoods of the centers that meet the limits, in the
+           order of the centers.'''
+        n = self._node_count
+        count = len(centers)
+        alive = np.ones(count, dtype='bool')
+        # The (center position * n + node) keys of the nodes found, and the
+        # hops to them
+        keys = np.arange(count, dtype='int64') * n + centers
+        hops = np.zeros(count, dtype='int64')
+        order = np.argsort(keys)
+        keys, hops = keys[order], hops[order]
+        frontier = keys
+        for hop in xrange(1, self.max_distance + 1):
+            owners, nodes = frontier // n, frontier % n
+            # All the neighbors of the nodes of the frontier are in the
+            # neighborhood.
+            alive[owners[self.degrees[nodes] >= self.max_degree]] = False
+            walking = alive[owners]
+            owners, nodes = owners[walking], nodes[walking]
+            if len(nodes) == 0:
+                break
+            neighbors, rows = _rows(self._undirected, nodes)
+            found = np.unique(owners[rows] * n + neighbors)
+            found = found[~_contains(keys, found)]
+            keys = np.concatenate([keys, found])
+            hops = np.concatenate([hops, np.full(len(found), hop,
+                                                 dtype='int64')])
+            order = np.argsort(keys)
+            keys, hops = keys[order], hops[order]
+            sizes = np.bincount(keys // n, minlength=count)
+            alive[sizes >= self.max_nodes()] = False
+            frontier = found
+        # The edges among the nodes of the neighborhoods left
+        selected = alive[keys // n]
+        keys, hops = keys[selected], hops[selected]
+        owners, nodes = keys // n, keys % n
+        neighbors, rows = _rows(self._oriented, nodes)
+        edge_keys = owners[rows] * n + neighbors
+        inside = _contains(keys, edge_keys)
+        rows, edge_keys = rows[inside], edge_keys[inside]
+        ends = np.searchsorted(keys, edge_keys)
+        edges = np.bincount(owners[rows], minlength=count)
+        nodes_degrees = np.bincount(np.concatenate([rows, ends]),
+                                    minlength=len(keys))
+        max_degrees = np.zeros(count, dtype='int64')
+        np.maximum.at(max_degrees, owners, nodes_degrees)
+        sizes = np.bincount(owners, minlength=count)
+        fractions = edges / np.maximum(sizes, 1).astype('float64')
+        alive &= (edges < self.max_edges) & \
+            (fractions > self.edge_fraction[0]) & \
+            (fractions < self.edge_fraction[1]) & \
+            (max_degrees < self.max_degree)
+        result = []
+        for position in np.flatnonzero(alive):
+            members = owners == position
+            member_edges = owners[rows] == position
+            result.append(Neighborhood(
+                int(centers[position]), nodes[members], hops[members],
+                nodes[rows[member_edges]], edge_keys[member_edges] % n))
+        return result
+
+    def sample(self, batch_size=BATCH_SIZE):
+        '''The neighborhood of a random center that meets the limits.
+
+        Keeps drawing batches of centers until one does.
+        '''
+        while True:
+            centers = self.nodes[self.random.randint(0, len(self.nodes),
+                                                     batch_size)]
+            found = self.neighborhoods(centers)
+            if found:
+                return found[0]
+
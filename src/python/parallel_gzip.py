@@ -0,0 +1,497 @@
+'''
+Read and write gzip files with several threads. zlib lets go of the
+interpreter lock while it compresses and decompresses, so the threads run
+on several cores.
+
+A deflate stream can only be decompressed from its start, or from a point
+for which the 32 KB of text before it are known, as zran.c does, which the
+zlib module of Python 2 cannot be given. The access points are therefore
+the starts of the gzip members of a file: a gzip file may be a series of
+independent members, and every tool reads it as one file.
+
+GzipWriter compresses blocks of about BLOCK_SIZE bytes of whole lines as
+separate members in a pool of threads, like pigz. For a file that is read
+again through this module, it can also write an index next to the file (the
+name of the file with '.gzi' appended) with the compressed and uncompressed
+offsets of the members; time_index.py and process_revisions_xml.py do. The
+members of a file with an index are decompressed by a pool of threads ahead
+of the reader. A file without one is decompressed by one thread ahead of
+the reader. Reading never writes an index; build_index does, for a file
+that is read many times.
+
+GzipReader is a file object for reading that gzip.open can be replaced
+with, read_blocks yields the text in blocks of whole lines for parsing with
+NumPy, and line_chunks splits a file into chunks of lines that can be read
+independently, e.g. by a pool of processes.
+'''
+
+import os, zlib, threading, Queue
+import multiprocessing
+from bisect import bisect_left
+from collections import deque
+from cStringIO import StringIO
+from multiprocessing.pool import ThreadPool
+
+
+THREADS = multiprocessing.cpu_count()
+# The uncompressed size of the members written.
+BLOCK_SIZE = 1024 * 1024
+# The compressed bytes read at a time from a file without an index.
+READ_SIZE = 1024 * 1024
+COMPRESS_LEVEL = 6
+# The window bits for zlib to read and write the gzip format.
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def index_path(path):
+    return path + '.gzi'
+
+
+def source_signature(path):
+    '''The size and modification time of a file.'''
+    return [os.path.getsize(path), int(os.path.getmtime(path))]
+
+
+class GzipIndex():
+    '''The members of a gzip file: their compressed offsets, the offsets of
+       their text in the uncompressed file, and whether a line starts at
+       their beginning, with the compressed and uncompressed sizes of the
+       file at the end.'''
+
+    def __init__(self, offsets, positions, line_starts):
+        self.offsets = offsets
+        self.positions = positions
+        self.line_starts = line_starts
+
+    def __len__(self):
+        '''The number of members.'''
+        return len(self.offsets) - 1
+
+    def member_at(self, offset):
+        '''The member that starts at the compressed offset, or None.'''
+        member = bisect_left(self.offsets, offset)
+        if member < len(self) and self.offsets[member] == offset:
+            return member
+        return None
+
+    def save(self, path):
+        # The index is written to a temporary file and renamed, so that a
+        # reader never sees a partly written one.
+        temporary = '%s.%d.tmp' % (index_path(path), os.getpid())
+        try:
+            with open(temporary, 'w') as f:
+                f.write('%d\t%d\n' % tuple(source_signature(path)))
+                for row in zip(self.offsets, self.positions,
+                               self.line_starts):
+                    f.write('%d\t%d\t%d\n' % row)
+            os.rename(temporary, index_path(path))
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+
+def load_index(path):
+    '''Load the index of a file, or return None if it has none or it is
+       out of date.'''
+    try:
+        with open(index_path(path)) as f:
+            signature = map(int, f.readline().split('\t'))
+            if signature != source_signature(path):
+                return None
+            rows = [map(int, line.split('\t')) for line in f]
+    except (IOError, ValueError):
+        return None
+    offsets, positions, line_starts = zip(*rows) if rows else ([], [], [])
+    return GzipIndex(list(offsets), list(positions),
+                     [bool(start) for start in line_starts])
+
+
+def _decompress(data):
+    return zlib.decompress(data, GZIP_WBITS)
+
+
+def _compress(data, compresslevel):
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _indexed_pieces(path, index, first, threads):
+    '''The text of the members from the first one on, decompressed by a
+       pool of threads, or by the calling one.'''
+    threads = min(threads, len(index) - first)
+    if threads <= 1:
+        with open(path, 'rb') as raw:
+            raw.seek(index.offsets[first])
+            for member in xrange(first, len(index)):
+                yield _decompress(raw.read(index.offsets[member + 1] -
+                                           index.offsets[member]))
+        return
+    pool = ThreadPool(threads)
+    in_flight = deque()
+    try:
+        with open(path, 'rb') as raw:
+            raw.seek(index.offsets[first])
+            for member in xrange(first, len(index)):
+                data = raw.read(index.offsets[member + 1] -
+                                index.offsets[member])
+                in_flight.append(pool.apply_async(_decompress, (data,)))
+                if len(in_flight) >= 2 * threads:
+                    yield in_flight.popleft().get()
+        while in_flight:
+            yield in_flight.popleft().get()
+    finally:
+        pool.terminate()
+
+
+def _ended(decompressor):
+    '''Whether the stream of the decompressor has ended: after its end, it
+       leaves any more input unused.'''
+    if decompressor.unused_data:
+        return True
+    try:
+        decompressor.decompress('\0')
+    except zlib.error:
+        return False
+    return decompressor.unused_data != ''
+
+
+def _scanned_pieces(path, offset, members):
+    '''The text of the members from the compressed offset on, decompressed
+       in order. Appends the (offset, position, line start) of every member
+       to `members`, and at the end the sizes of the file.'''
+    with open(path, 'rb') as raw:
+        raw.seek(offset)
+        decompressor = zlib.decompressobj(GZIP_WBITS)
+        fed = offset
+        position = 0
+        last = '\n'
+        members.append((offset, 0, True))
+        while True:
+            data = raw.read(READ_SIZE)
+            if not data:
+                break
+            fed += len(data)
+            while data:
+                text = decompressor.decompress(data)
+                if text:
+                    position += len(text)
+                    last = text[-1]
+                    yield text
+                data = decompressor.unused_data
+                if data:
+                    if not data.strip('\0'):
+                        # Padding after the last member
+                        break
+                    # The member ended, and the next one starts.
+                    members.append((fed - len(data), position, last == '\n'))
+                    decompressor = zlib.decompressobj(GZIP_WBITS)
+        if fed > offset and not _ended(decompressor):
+            raise IOError('%s ended before the end of its last gzip member'
+                          % path)
+        members.append((fed, position, True))
+
+
+def _read_ahead(pieces, size=4):
+    '''Iterate over the pieces, produced by a thread up to `size` pieces
+       ahead.'''
+    queue = Queue.Queue(size)
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for piece in pieces:
+                while not stop.is_set():
+                    try:
+                        queue.put((piece, None), timeout=0.1)
+                        break
+                    except Queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+            queue.put((done, None))
+        except Exception as e:
+            queue.put((done, e))
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            piece, error = queue.get()
+            if piece is done:
+                if error is not None:
+                    raise error
+                break
+            yield piece
+    finally:
+        stop.set()
+
+
+def _pieces(path, threads, offset=0):
+    '''The decompressed text of the file from the member at the compressed
+       offset on, in pieces.'''
+    index = load_index(path)
+    first = index.member_at(offset) if index is not None else None
+    if first is not None:
+        for piece in _indexed_pieces(path, index, first, threads):
+            yield piece
+        return
+    for piece in _read_ahead(_scanned_pieces(path, offset, [])):
+        yield piece
+
+
+def _line_blocks(pieces, size=1):
+    '''Regroup the pieces of text into blocks of whole lines of at least
+       `size` bytes; only the last block may be shorter or not end with a
+       newline.'''
+    pending, pending_size = [], 0
+    for piece in pieces:
+        pending.append(piece)
+        pending_size += len(piece)
+        if pending_size < size or '\n' not in piece:
+            continue
+        text = ''.join(pending)
+        end = text.rfind('\n') + 1
+        yield text[:end]
+        pending = [text[end:]]
+        pending_size = len(pending[0])
+    text = ''.join(pending)
+    if text:
+        yield text
+
+
+def read_blocks(path, threads=THREADS, offset=0, size=1):
+    '''Iterate over the text of a gzip file in blocks of whole lines of at
+       least `size` bytes, starting from the member at the compressed
+       offset.'''
+    return _line_blocks(_pieces(path, threads, offset), size)
+
+
+def read_lines(path, threads=THREADS, offset=0):
+    '''Iterate over the lines of a gzip file, starting from the member at
+       the compressed offset.'''
+    for block in read_blocks(path, threads, offset):
+        for line in StringIO(block):
+            yield line
+
+
+class GzipReader():
+    '''A file object that reads the text of a gzip file.'''
+
+    def __init__(self, path, threads=THREADS, offset=0):
+        self._blocks = read_blocks(path, threads, offset)
+        # The block being read, and the position in it
+        self._block = ''
+        self._position = 0
+
+    def read(self, size=-1):
+        available = len(self._block) - self._position
+        if 0 <= size <= available:
+            data = self._block[self._position:self._position + size]
+            self._position += size
+            return data
+        pieces = [self._block[self._position:]]
+        while size < 0 or available < size:
+            block = next(self._blocks, None)
+            if block is None:
+                break
+            pieces.append(block)
+            available += len(block)
+        self._block = ''.join(pieces)
+        self._position = 0
+        return self.read(min(size, available) if size >= 0 else available)
+
+    def __iter__(self):
+        rest = self._block[self._position:]
+        self._block, self._position = '', 0
+        for line in StringIO(rest):
+            yield line
+        for block in self._blocks:
+            for line in StringIO(block):
+                yield line
+
+    def close(self):
+        self._blocks.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class GzipWriter():
+    '''A file object that writes a gzip file of members compressed by a
+       pool of threads, and the index of the members if `index` is set. A
+       file of a single member is compressed without starting the pool.'''
+
+    def __init__(self, path, threads=THREADS, block_size=BLOCK_SIZE,
+                 compresslevel=COMPRESS_LEVEL, index=False):
+        self._path = path
+        self._index = index
+        self._file = open(path, 'wb')
+        self._threads = threads
+        self._pool = None
+        self._block_size = block_size
+        self._compresslevel = compresslevel
+        self._in_flight = deque()
+        self._pieces = []
+        self._size = 0
+        # The index of the members written, and the uncompressed size and
+        # the last character of the text so far
+        self._offsets, self._positions, self._line_starts = [], [], []
+        self._position = 0
+        self._last = '\n'
+
+    def write(self, data):
+        self._pieces.append(data)
+        self._size += len(data)
+        if self._size >= self._block_size:
+            self._flush(whole_lines=True)
+
+    def end_member(self):
+        '''End the current member, so that the next write starts a new
+           one.'''
+        self._flush(whole_lines=False)
+
+    def _flush(self, whole_lines, final=False):
+        data = ''.join(self._pieces)
+        rest = ''
+        if whole_lines:
+            # Members of whole lines let line_chunks split the file there.
+            end = data.rfind('\n') + 1
+            if end > 0:
+                data, rest = data[:end], data[end:]
+        self._pieces = [rest] if rest else []
+        self._size = len(rest)
+        if not data:
+            return
+        self._positions.append(self._position)
+        self._line_starts.append(self._last == '\n')
+        self._position += len(data)
+        self._last = data[-1]
+        self._submit(data, final)
+
+    def _submit(self, data, final):
+        if self._pool is None and (self._threads == 1 or final):
+            self._in_flight.append(_compress(data, self._compresslevel))
+        else:
+            if self._pool is None:
+                self._pool = ThreadPool(self._threads)
+            self._in_flight.append(self._pool.apply_async(
+                _compress, (data, self._compresslevel)))
+        while len(self._in_flight) >= 2 * self._threads:
+            self._write_member()
+
+    def _write_member(self):
+        member = self._in_flight.popleft()
+        self._offsets.append(self._file.tell())
+        self._file.write(member if isinstance(member, str) else member.get())
+
+    def close(self):
+        self._flush(whole_lines=False, final=True)
+        if not self._positions:
+            # An empty file is still a gzip file.
+            self._positions.append(0)
+            self._line_starts.append(True)
+            self._submit('', final=True)
+        while self._in_flight:
+            self._write_member()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+        self._offsets.append(self._file.tell())
+        self._file.close()
+        if self._index:
+            GzipIndex(self._offsets, self._positions + [self._position],
+                      self._line_starts + [True]).save(self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def scan_index(path):
+    '''Decompress a gzip file to find its members, and return its index.'''
+    members = []
+    for piece in _scanned_pieces(path, 0, members):
+        pass
+    offsets, positions, line_starts = zip(*members)
+    return GzipIndex(list(offsets), list(positions), list(line_starts))
+
+
+def build_index(path):
+    '''Find the members of a gzip file, and save and return its index.'''
+    index = scan_index(path)
+    index.save(path)
+    return index
+
+
+class LineChunk():
+    '''The lines that start in a range of the members of a gzip file, with
+       the index of the file.'''
+
+    def __init__(self, path, first, last, index):
+        self.path = path
+        self.first = first
+        self.last = last
+        self.index = index
+
+    def blocks(self, threads=1):
+        '''Iterate over the text of the lines of the chunk in pieces.'''
+        index = self.index
+        pieces = _indexed_pieces(self.path, index, self.first, threads)
+        # The text of the members of the chunk left to read
+        size = index.positions[self.last] - index.positions[self.first]
+        # Whether the first line started in the chunk before, and whether
+        # the last one goes on into the chunk after
+        skip = not index.line_starts[self.first]
+        tail = self.last < len(index) and not index.line_starts[self.last]
+        try:
+            for piece in pieces:
+                text, rest = piece[:size], piece[size:]
+                size -= len(text)
+                if skip:
+                    end = text.find('\n') + 1
+                    if end == 0:
+                        if size == 0:
+                            # The chunk is inside a line of the one before.
+                            return
+                        continue
+                    text, skip = text[end:], False
+                if text:
+                    yield text
+                if size == 0:
+                    if not tail:
+                        return
+                    end = rest.find('\n') + 1
+                    if end > 0:
+                        yield rest[:end]
+                        return
+                    if rest:
+                        yield rest
+        finally:
+            pieces.close()
+
+    def lines(self, threads=1):
+        for block in _line_blocks(self.blocks(threads)):
+            for line in StringIO(block):
+                yield line
+
+
+def line_chunks(path, count):
+    '''Split a gzip file into up to `count` LineChunks of about the same
+       size, at the starts of its members. A file without an index is
+       decompressed first to find them.'''
+    index = load_index(path)
+    if index is None:
+        index = scan_index(path)
+    total = index.positions[-1]
+    bounds = sorted(set([0, len(index)] + [
+        bisect_left(index.positions, total * i // count, 0, len(index))
+        for i in xrange(1, count)]))
+    return [LineChunk(path, first, last, index)
+            for first, last in zip(bounds[:-1], bounds[1:])]
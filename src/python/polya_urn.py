@@ -0,0 +1,71 @@
+'''
+Simulate Polya's generalized urn model: in every round a ball is added,
+either to a new bin with probability p, or otherwise to a bin chosen with
+probability proportional to the number of balls in it.
+
+Choosing a bin in proportion to its balls is choosing a ball uniformly at
+random and taking its bin, so the simulation keeps the list of the bins of
+all the balls, and a draw takes constant time. The draws are made in
+chunks with NumPy: every new ball picks a random earlier ball, and the
+picks of earlier balls in the same chunk are followed, a few steps at a
+time, to a ball whose bin is known.
+'''
+
+import numpy as np
+
+
+# The number of balls added at a time.
+CHUNK_SIZE = 1024 * 1024
+# The number of balls counted at a time.
+COUNT_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def simulate(rounds, p, random, chunk_size=CHUNK_SIZE):
+    '''The number of balls in each bin after the rounds, starting from one
+       bin with one ball. random is a numpy.random.RandomState.'''
+    # The bin of every ball
+    bins = np.empty(rounds + 1, dtype='int32')
+    bins[0] = 0
+    bin_count = 1
+    for begin in xrange(1, rounds + 1, chunk_size):
+        end = min(begin + chunk_size, rounds + 1)
+        balls = np.arange(begin, end)
+        new = random.random_sample(len(balls)) < p
+        # Ball t picks one of the balls 0...t - 1.
+        picks = np.minimum((random.random_sample(len(balls)) *
+                            balls).astype('int64'), balls - 1)
+        labels = np.empty(len(balls), dtype='int64')
+        created = np.count_nonzero(new)
+        labels[new] = bin_count + np.arange(created)
+        bin_count += created
+        known = ~new & (picks < begin)
+        labels[known] = bins[picks[known]]
+        # The balls that picked a ball of the chunk point to it, and the
+        # others to themselves.
+        links = np.arange(len(balls))
+        pending = np.flatnonzero(~new & (picks >= begin))
+        links[pending] = picks[pending] - begin
+        resolved = np.ones(len(balls), dtype='bool')
+        resolved[pending] = False
+        while len(pending) > 0:
+            targets = links[pending]
+            done = resolved[targets]
+            labels[pending[done]] = labels[targets[done]]
+            resolved[pending[done]] = True
+            pending = pending[~done]
+            # Skip ahead to the pick of the pick.
+            links[pending] = links[links[pending]]
+        bins[begin:end] = labels
+    # Count the balls of the bins a part at a time, as bincount makes an
+    # int64 copy of its input.
+    bin_balls = np.zeros(bin_count, dtype='int64')
+    for begin in xrange(0, rounds + 1, COUNT_CHUNK_SIZE):
+        bin_balls += np.bincount(bins[begin:begin + COUNT_CHUNK_SIZE],
+                                 minlength=bin_count)
+    return bin_balls
+
+
+def ball_distribution(bin_balls):
+    '''The number of bins with k balls, for k = 0, 1, ..., the largest
+       number of balls in a bin.'''
+    return np.bincount(bin_balls)
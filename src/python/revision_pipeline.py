@@ -0,0 +1,126 @@
+'''
+Feed the revisions to several analyses from a single pass over the data.
+
+Every consumer is registered with the columns it needs and its own time
+range. The pipeline reads the union of the columns for the union of the
+time ranges once, and calls every consumer with its columns for the
+revisions in its range.
+
+Reading, including decompression and parsing, can overlap with the
+consumers in a separate thread or process; the rows are passed over in
+batches through a bounded queue.
+'''
+
+import threading, traceback, Queue
+import multiprocessing
+from itertools import islice
+from operator import itemgetter
+
+
+# The number of rows passed over between the reader and the consumers at
+# once, and the number of batches that may wait in the queue.
+BATCH_SIZE = 10000
+QUEUE_SIZE = 16
+
+# The ways the reading can be run.
+SERIAL, THREAD, PROCESS = 'serial', 'thread', 'process'
+
+
+class ReaderError(Exception):
+    '''The reader thread or process failed; the message has its
+       traceback.'''
+
+
+def _produce(rows, queue):
+    '''Put the rows into the queue in batches, with None at the end, or the
+       traceback of the error if reading them failed.'''
+    try:
+        while True:
+            batch = list(islice(rows, BATCH_SIZE))
+            if not batch:
+                break
+            queue.put(batch)
+    except Exception:
+        queue.put(traceback.format_exc())
+    else:
+        queue.put(None)
+
+
+def _consume(queue):
+    while True:
+        batch = queue.get()
+        if batch is None:
+            break
+        if isinstance(batch, str):
+            raise ReaderError('Reading the revisions failed:\n' + batch)
+        for row in batch:
+            yield row
+
+
+class RevisionPipeline():
+    '''Read the revisions once and fan them out to several consumers.'''
+
+    def __init__(self, revisions):
+        '''revisions is a RevisionStore or RevisionFile.'''
+        self._revisions = revisions
+        self._consumers = []
+
+    def add_consumer(self, consumer, columns, begin=None, end=None):
+        '''Register a function to be called with the given columns of every
+           revision in the time range [begin, end), in epoch seconds.'''
+        self._consumers.append((consumer, list(columns), begin, end))
+
+    def _columns(self):
+        columns = ['timestamp']
+        for consumer, consumer_columns, begin, end in self._consumers:
+            for column in consumer_columns:
+                if column not in columns:
+                    columns.append(column)
+        return columns
+
+    def _time_range(self):
+        '''The union of the time ranges of the consumers.'''
+        begins = [begin for consumer, columns, begin, end in self._consumers]
+        ends = [end for consumer, columns, begin, end in self._consumers]
+        begin = None if None in begins else min(begins)
+        end = None if None in ends else max(ends)
+        return begin, end
+
+    def _rows(self, mode):
+        columns = self._columns()
+        begin, end = self._time_range()
+        rows = self._revisions.rows(columns, begin, end)
+        if mode == SERIAL:
+            return rows
+        elif mode == THREAD:
+            queue = Queue.Queue(QUEUE_SIZE)
+            reader = threading.Thread(target=_produce, args=(rows, queue))
+        elif mode == PROCESS:
+            queue = multiprocessing.Queue(QUEUE_SIZE)
+            reader = multiprocessing.Process(target=_produce,
+                                             args=(rows, queue))
+        else:
+            raise ValueError('Unknown mode: %s' % mode)
+        reader.daemon = True
+        reader.start()
+        return _consume(queue)
+
+    def run(self, mode=SERIAL):
+        '''Read the revisions and call the consumers.'''
+        columns = self._columns()
+        # For every consumer, a function that selects its columns from a row.
+        dispatch = []
+        for consumer, consumer_columns, begin, end in self._consumers:
+            positions = [columns.index(column) for column in consumer_columns]
+            if len(positions) == 1:
+                position = positions[0]
+                select = lambda row, position=position: (row[position],)
+            else:
+                select = itemgetter(*positions)
+            dispatch.append((consumer, select, begin, end))
+        for row in self._rows(mode):
+            timestamp = row[0]
+            for consumer, select, begin, end in dispatch:
+                if (begin is None or timestamp >= begin) and \
+                (end is None or timestamp < end):
+                    consumer(*select(row))
@@ -0,0 +1,341 @@
+'''
+A columnar, memory-mapped store of the Wikipedia revision table.
+
+A revision file such as data/wikipedia/revisions_time_sorted.tsv.gz is
+converted once, by src/chapter1/convert_revisions_to_columns.py, into a
+directory next to it (revisions_time_sorted.columns) that holds one binary
+file per column: the timestamps as int64 epoch seconds, the numeric IDs as
+integers, and the titles, user names and IP addresses dictionary-encoded as
+int32 indices.
+
+The scripts read the revisions through `open_revisions`, which memory-maps
+only the columns they ask for, or falls back to reading the TSV file when
+there is no store built for it, or the store was built from a different
+version of the file (the store keeps the size and modification time of the
+file); a time-sorted TSV file is read through its time index if it has one
+(see time_index.py). The rows are returned with the same types in both
+cases:
+
+    title, user_name, ip                strings (UTF-8 encoded)
+    namespace, page_id, rev_id,
+    timestamp, user_id                  integers, -1 when empty
+'''
+
+import json, os, sys
+from itertools import izip, islice
+import numpy as np
+
+from parallel_gzip import read_lines as read_all_lines
+from time_index import read_lines
+from timestamps import parse_timestamp, parse_timestamps, format_timestamp
+
+
+# The columns of the revision files in order, with their types in the store.
+# The string columns are stored as int32 indices into their dictionaries.
+COLUMNS = [('title', 'int32'),
+           ('namespace', 'int32'),
+           ('page_id', 'int32'),
+           ('rev_id', 'int64'),
+           ('timestamp', 'int64'),
+           ('user_id', 'int32'),
+           ('user_name', 'int32'),
+           ('ip', 'int32')]
+COLUMN_NAMES = [name for name, dtype in COLUMNS]
+STRING_COLUMNS = set(['title', 'user_name', 'ip'])
+
+# The value of the empty numeric fields, e.g. the user ID of anonymous edits.
+MISSING = -1
+
+# The number of rows we buffer or read at once.
+CHUNK_SIZE = 1000000
+
+
+def store_path(revisions_file):
+    '''The directory of the columnar store built for a revision file.'''
+    if revisions_file.endswith('.tsv.gz'):
+        revisions_file = revisions_file[:-len('.tsv.gz')]
+    return revisions_file + '.columns'
+
+
+def source_signature(path):
+    '''The size and modification time of a file.'''
+    return [os.path.getsize(path), int(os.path.getmtime(path))]
+
+
+class StringDictionary():
+    '''A memory-mapped list of strings, stored as the concatenated UTF-8
+       bytes and the offsets where every string begins.'''
+
+    def __init__(self, directory, name):
+        self._offsets = np.fromfile(
+            os.path.join(directory, name + '.offsets'), dtype='int64')
+        path = os.path.join(directory, name + '.strings')
+        if os.path.getsize(path) > 0:
+            self._strings = np.memmap(path, dtype='uint8', mode='r')
+        else:
+            self._strings = np.zeros(0, dtype='uint8')
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        return self._strings[
+            self._offsets[index]:self._offsets[index + 1]].tostring()
+
+
+class StringDictionaryWriter():
+    '''Assign consecutive indices to strings, and write them to disk.'''
+
+    def __init__(self, directory, name):
+        self._index = dict()
+        self._strings = open(os.path.join(directory, name + '.strings'), 'wb')
+        self._offsets_file = os.path.join(directory, name + '.offsets')
+        self._offsets = [0]
+
+    def index(self, string):
+        '''Return the index of the string, adding it if it is new.'''
+        if string in self._index:
+            return self._index[string]
+        index = len(self._offsets) - 1
+        self._index[string] = index
+        self._strings.write(string)
+        self._offsets.append(self._offsets[-1] + len(string))
+        return index
+
+    def close(self):
+        self._strings.close()
+        np.array(self._offsets, dtype='int64').tofile(self._offsets_file)
+
+
+class RevisionStoreWriter():
+    '''Build a columnar store from the split lines of a revision file.'''
+
+    def __init__(self, directory, source=None):
+        '''source is the revision file the store is built from.'''
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._directory = directory
+        self._source = source
+        self._files = dict((name, open(os.path.join(directory, name), 'wb'))
+                           for name in COLUMN_NAMES)
+        self._dictionaries = dict((name, StringDictionaryWriter(directory, name))
+                                  for name in STRING_COLUMNS)
+        self._buffers = dict((name, []) for name in COLUMN_NAMES)
+        self._rows = 0
+        self._last_timestamp = None
+        self._sorted_by_time = True
+
+    def add(self, fields):
+        '''Add a revision given as the list of its eight text fields.'''
+        for name, value in izip(COLUMN_NAMES, fields):
+            if name in STRING_COLUMNS:
+                value = self._dictionaries[name].index(value)
+            elif name == 'timestamp':
+                # These are converted in one go when flushing the buffers.
+                pass
+            elif value == '':
+                value = MISSING
+            else:
+                value = int(value)
+            self._buffers[name].append(value)
+        self._rows += 1
+        if self._rows % CHUNK_SIZE == 0:
+            self._flush()
+
+    def _flush(self):
+        timestamps = parse_timestamps(self._buffers['timestamp'])
+        if len(timestamps) > 0:
+            if np.any(np.diff(timestamps) < 0) or \
+            (self._last_timestamp is not None and
+             timestamps[0] < self._last_timestamp):
+                self._sorted_by_time = False
+            self._last_timestamp = timestamps[-1]
+        self._buffers['timestamp'] = timestamps
+        for name, dtype in COLUMNS:
+            np.asarray(self._buffers[name], dtype=dtype) \
+                .tofile(self._files[name])
+            self._buffers[name] = []
+
+    def close(self):
+        self._flush()
+        for f in self._files.itervalues():
+            f.close()
+        for dictionary in self._dictionaries.itervalues():
+            dictionary.close()
+        with open(os.path.join(self._directory, 'meta.json'), 'w') as f:
+            json.dump({'rows': self._rows,
+                       'columns': COLUMNS,
+                       'sorted_by_time': self._sorted_by_time,
+                       'source': source_signature(self._source)
+                       if self._source is not None else None}, f)
+
+
+class RevisionStore():
+    '''Read the revisions from a columnar store.'''
+
+    def __init__(self, directory):
+        self._directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        self.rows_count = meta['rows']
+        self.sorted_by_time = meta['sorted_by_time']
+        self._dtypes = dict(meta['columns'])
+        self._columns = dict()
+        self._dictionaries = dict()
+
+    def __len__(self):
+        return self.rows_count
+
+    def column(self, name):
+        '''The memory-mapped array of a column; this does not read it yet.'''
+        if name not in self._columns:
+            if self.rows_count == 0:
+                self._columns[name] = np.zeros(0, dtype=self._dtypes[name])
+            else:
+                self._columns[name] = np.memmap(
+                    os.path.join(self._directory, name),
+                    dtype=self._dtypes[name], mode='r',
+                    shape=(self.rows_count,))
+        return self._columns[name]
+
+    def dictionary(self, name):
+        '''The strings for the indices stored in a string column.'''
+        if name not in self._dictionaries:
+            self._dictionaries[name] = StringDictionary(self._directory, name)
+        return self._dictionaries[name]
+
+    def row_range(self, begin=None, end=None):
+        '''The first and last + 1 rows to look at for the time range.
+
+        If the store is sorted by time, this is exactly the time range,
+        otherwise it is all the rows.
+        '''
+        if not self.sorted_by_time:
+            return 0, self.rows_count
+        timestamps = self.column('timestamp')
+        start, stop = 0, self.rows_count
+        if begin is not None:
+            start = int(np.searchsorted(timestamps, begin, side='left'))
+        if end is not None:
+            stop = int(np.searchsorted(timestamps, end, side='left'))
+        return start, stop
+
+    def _chunks(self, begin, end):
+        '''The slices of CHUNK_SIZE rows for the time range, with the mask
+           of the rows in the range if they are not sorted by time.'''
+        start, stop = self.row_range(begin, end)
+        filter_time = not self.sorted_by_time and \
+            (begin is not None or end is not None)
+        for chunk_start in xrange(start, stop, CHUNK_SIZE):
+            chunk = slice(chunk_start, min(chunk_start + CHUNK_SIZE, stop))
+            selected = None
+            if filter_time:
+                timestamps = self.column('timestamp')[chunk]
+                selected = np.ones(len(timestamps), dtype=bool)
+                if begin is not None:
+                    selected &= timestamps >= begin
+                if end is not None:
+                    selected &= timestamps < end
+            yield chunk, selected
+
+    def column_chunks(self, columns, begin=None, end=None):
+        '''Iterate over the arrays of the given numeric columns for the
+           revisions in the time range [begin, end), CHUNK_SIZE rows at a
+           time.'''
+        for chunk, selected in self._chunks(begin, end):
+            arrays = [np.asarray(self.column(name)[chunk])
+                      for name in columns]
+            if selected is not None:
+                arrays = [array[selected] for array in arrays]
+            yield arrays
+
+    def rows(self, columns, begin=None, end=None):
+        '''Iterate over the tuples of the given columns for the revisions
+           in the time range [begin, end), given in epoch seconds.'''
+        for chunk, selected in self._chunks(begin, end):
+            values = []
+            for name in columns:
+                array = self.column(name)[chunk]
+                if selected is not None:
+                    array = array[selected]
+                if name in STRING_COLUMNS:
+                    # Decode every distinct string only once per chunk.
+                    unique, inverse = np.unique(array, return_inverse=True)
+                    dictionary = self.dictionary(name)
+                    strings = [dictionary[index] for index in unique]
+                    values.append([strings[i] for i in inverse])
+                else:
+                    values.append(array.tolist())
+            for row in izip(*values):
+                yield row
+
+
+class RevisionFile():
+    '''Read the revisions from a TSV file, with the same interface and types
+       as a RevisionStore.'''
+
+    def __init__(self, path, sorted_by_time=False):
+        self._path = path
+        self.sorted_by_time = sorted_by_time
+
+    def rows(self, columns, begin=None, end=None):
+        positions = [COLUMN_NAMES.index(name) for name in columns]
+        kinds = [name in STRING_COLUMNS for name in columns]
+        timestamp_position = COLUMN_NAMES.index('timestamp')
+        # We compare the timestamps as strings, they are in a fixed format.
+        if begin is not None:
+            begin = format_timestamp(begin)
+        if end is not None:
+            end = format_timestamp(end)
+        if self.sorted_by_time:
+            # Only read the lines in the range, seeking with the index.
+            lines = read_lines(self._path, begin, end)
+        else:
+            lines = read_all_lines(self._path)
+        for line in lines:
+            fields = line[:-1].split('\t')
+            timestamp = fields[timestamp_position]
+            if begin is not None and timestamp < begin:
+                continue
+            if end is not None and timestamp >= end:
+                continue
+            row = []
+            for position, is_string in izip(positions, kinds):
+                value = fields[position]
+                if is_string:
+                    row.append(value)
+                elif position == timestamp_position:
+                    row.append(parse_timestamp(value))
+                elif value == '':
+                    row.append(MISSING)
+                else:
+                    row.append(int(value))
+            yield tuple(row)
+
+    def column_chunks(self, columns, begin=None, end=None):
+        '''Iterate over the int64 arrays of the given numeric columns for
+           the revisions in the time range, CHUNK_SIZE rows at a time.'''
+        rows = self.rows(columns, begin, end)
+        while True:
+            chunk = list(islice(rows, CHUNK_SIZE))
+            if not chunk:
+                break
+            yield [np.array(column, dtype='int64') for column in zip(*chunk)]
+
+
+def open_revisions(revisions_file, sorted_by_time=False):
+    '''Open the columnar store of the revision file if it has been built
+       from the current version of the file, otherwise the file itself.'''
+    directory = store_path(revisions_file)
+    try:
+        with open(os.path.join(directory, 'meta.json')) as f:
+            source = json.load(f).get('source')
+    except IOError:
+        return RevisionFile(revisions_file, sorted_by_time)
+    if os.path.exists(revisions_file) and \
+    source != source_signature(revisions_file):
+        sys.stderr.write('%s is out of date, reading %s instead; rebuild it '
+                         'with src/chapter1/convert_revisions_to_columns.py\n'
+                         % (directory, revisions_file))
+        return RevisionFile(revisions_file, sorted_by_time)
+    return RevisionStore(directory)
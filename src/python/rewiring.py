@@ -0,0 +1,209 @@
+'''
+Randomize a directed graph while keeping the in- and out-degree of every
+node, by swapping the destinations of random pairs of edges: a -> b and
+c -> d become a -> d and c -> b.
+
+The swaps are drawn in batches and applied at once with NumPy. A batch
+keeps only the swaps whose edges no earlier swap of the batch touches, and
+rejects the swaps that would create a self-loop or an edge that already
+exists, looked up in a hash set of the edges, so that the result is again
+a simple graph with the same degrees.
+'''
+
+import numpy as np
+
+
+# The number of swaps drawn at a time, at most the number of edges divided
+# by BATCH_FRACTION so that few swaps of a batch touch the same edges.
+BATCH_SIZE = 1024 * 1024
+BATCH_FRACTION = 64
+# The hash set is grown when this fraction of its slots is used.
+MAX_LOAD = 0.7
+
+EMPTY = -1
+DELETED = -2
+# The golden ratio multiplier for Fibonacci hashing
+MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+class EdgeHashSet():
+    '''A set of non-negative int64 keys in an open addressing hash table with
+       linear probing, with operations on arrays of keys.'''
+
+    def __init__(self, keys, load_factor=0.5):
+        self._allocate(int(len(keys) / load_factor) + 1)
+        self.add(np.asarray(keys, dtype='int64'))
+
+    def _allocate(self, slots):
+        self._bits = max(4, int(np.ceil(np.log2(slots))))
+        self._table = np.full(1 << self._bits, EMPTY, dtype='int64')
+        self._mask = (1 << self._bits) - 1
+        # The number of keys, and the number of slots that are not empty
+        self._count = 0
+        self._used = 0
+
+    def __len__(self):
+        return self._count
+
+    def _hash(self, keys):
+        return ((keys.astype('uint64') * MULTIPLIER) >>
+                np.uint64(64 - self._bits)).astype('int64')
+
+    def _find(self, keys):
+        '''The slots of the keys, or -1 for the keys not in the set.'''
+        positions = np.full(len(keys), -1, dtype='int64')
+        active = np.arange(len(keys))
+        slots = self._hash(keys)
+        while len(active) > 0:
+            values = self._table[slots]
+            found = values == keys[active]
+            positions[active[found]] = slots[found]
+            probing = ~found & (values != EMPTY)
+            active = active[probing]
+            slots = (slots[probing] + 1) & self._mask
+        return positions
+
+    def contains(self, keys):
+        return self._find(np.asarray(keys, dtype='int64')) >= 0
+
+    def add(self, keys):
+        '''Add distinct keys that are not in the set yet.'''
+        if self._used + len(keys) > MAX_LOAD * len(self._table):
+            live = self._table[self._table >= 0]
+            self._allocate(int((len(live) + len(keys)) / 0.5) + 1)
+            self._insert(live)
+        self._insert(keys)
+
+    def _insert(self, keys):
+        active = np.arange(len(keys))
+        slots = self._hash(keys)
+        while len(active) > 0:
+            values = self._table[slots]
+            free = np.flatnonzero((values == EMPTY) | (values == DELETED))
+            # Of the keys that reached the same free slot the first one
+            # takes it, and the others probe on.
+            _, first = np.unique(slots[free], return_index=True)
+            winners = free[first]
+            self._table[slots[winners]] = keys[active[winners]]
+            self._used += np.count_nonzero(values[winners] == EMPTY)
+            self._count += len(winners)
+            left = np.ones(len(active), dtype='bool')
+            left[winners] = False
+            active = active[left]
+            slots = (slots[left] + 1) & self._mask
+
+    def remove(self, keys):
+        '''Remove keys that are in the set.'''
+        positions = self._find(np.asarray(keys, dtype='int64'))
+        positions = positions[positions >= 0]
+        self._table[positions] = DELETED
+        self._count -= len(positions)
+
+
+class RewireStatistics():
+    '''The outcomes of the swaps.'''
+
+    def __init__(self):
+        self.attempted = 0      # Swaps of two distinct edges
+        self.accepted = 0
+        self.self_loops = 0     # Rejected for creating a self-loop
+        self.multi_edges = 0    # Rejected for creating an existing edge
+        self.conflicts = 0      # Skipped for touching an edge of an earlier
+                                # swap of the same batch
+
+    def acceptance_rate(self):
+        return float(self.accepted) / max(self.attempted, 1)
+
+    def __str__(self):
+        return ('%d swaps attempted, %d accepted (%.1f%%), rejected %d for '
+                'self-loops and %d for multi-edges, %d skipped') % (
+            self.attempted, self.accepted, 100 * self.acceptance_rate(),
+            self.self_loops, self.multi_edges, self.conflicts)
+
+
+def _first_owners(e1, e2):
+    '''Whether each swap i of edges e1[i] and e2[i] is the first in the
+       batch to touch both of its edges.'''
+    count = len(e1)
+    edges = np.concatenate([e1, e2])
+    owners = np.concatenate([np.arange(count), np.arange(count)])
+    order = np.lexsort((owners, edges))
+    _, first, inverse = np.unique(edges[order], return_index=True,
+                                  return_inverse=True)
+    first_owner = np.empty(2 * count, dtype='int64')
+    first_owner[order] = owners[order][first][inverse]
+    return (first_owner[:count] == np.arange(count)) & \
+        (first_owner[count:] == np.arange(count))
+
+
+def rewire(sources, destinations, swaps, random, batch_size=BATCH_SIZE,
+           self_loops=False, multi_edges=False, on_batch=None):
+    '''Swap the destinations of random pairs of edges in place until `swaps`
+       swaps have been attempted.
+
+    The edges should be distinct unless multi_edges is True. With
+    self_loops or multi_edges the swaps that create those are accepted
+    too. random is a numpy.random.RandomState. on_batch, if given, is
+    called after every batch with the sources and destinations of the
+    removed and of the added edges, and the statistics so far. Returns the
+    RewireStatistics.
+    '''
+    statistics = RewireStatistics()
+    edge_count = len(sources)
+    if edge_count < 2:
+        return statistics
+    node_count = int(max(sources.max(), destinations.max())) + 1
+    sources = np.asarray(sources)
+    edges = None
+    if not multi_edges:
+        edges = EdgeHashSet(sources.astype('int64') * node_count +
+                            destinations)
+    batch_size = max(1, min(batch_size, edge_count // BATCH_FRACTION))
+    while statistics.attempted < swaps:
+        size = min(batch_size, swaps - statistics.attempted)
+        e1 = random.randint(0, edge_count, size)
+        e2 = random.randint(0, edge_count, size)
+        distinct = e1 != e2
+        e1, e2 = e1[distinct], e2[distinct]
+        independent = _first_owners(e1, e2)
+        statistics.conflicts += np.count_nonzero(~independent)
+        e1, e2 = e1[independent], e2[independent]
+        statistics.attempted += len(e1)
+
+        a, b = sources[e1].astype('int64'), destinations[e1].astype('int64')
+        c, d = sources[e2].astype('int64'), destinations[e2].astype('int64')
+        accept = np.ones(len(e1), dtype='bool')
+        if not self_loops:
+            loops = (a == d) | (c == b)
+            statistics.self_loops += np.count_nonzero(loops)
+            accept &= ~loops
+        if not multi_edges:
+            new_1, new_2 = a * node_count + d, c * node_count + b
+            existing = accept & (edges.contains(new_1) |
+                                 edges.contains(new_2))
+            # Two swaps of the batch may create the same edge, or one swap
+            # the same edge twice.
+            candidates = np.flatnonzero(accept & ~existing)
+            new_edges = np.concatenate([new_1[candidates],
+                                        new_2[candidates]])
+            _, inverse, counts = np.unique(new_edges, return_inverse=True,
+                                           return_counts=True)
+            shared = counts[inverse] > 1
+            repeated = np.zeros(len(e1), dtype='bool')
+            repeated[candidates] = shared[:len(candidates)] | \
+                shared[len(candidates):]
+            rejected = existing | repeated
+            statistics.multi_edges += np.count_nonzero(rejected)
+            accept &= ~rejected
+            edges.remove(np.concatenate([a[accept] * node_count + b[accept],
+                                         c[accept] * node_count + d[accept]]))
+            edges.add(np.concatenate([new_1[accept], new_2[accept]]))
+        e1, e2 = e1[accept], e2[accept]
+        destinations[e1], destinations[e2] = d[accept], b[accept]
+        statistics.accepted += len(e1)
+        if on_batch is not None:
+            a, b, c, d = a[accept], b[accept], c[accept], d[accept]
+            on_batch(np.concatenate([a, c]), np.concatenate([b, d]),
+                     np.concatenate([a, c]), np.concatenate([d, b]),
+                     statistics)
+    return statistics
@@ -0,0 +1,154 @@
+'''
+A seekable layout for time-sorted, gzip-compressed revision files.
+
+The file is written as a series of independent gzip members, each holding
+about BLOCK_SIZE bytes of whole lines. This is still a valid gzip file that
+every tool reads as usual, but we can also start decompressing at the
+beginning of any member. A sidecar index file (the name of the file with
+'.idx' appended) lists the compressed offset and the first timestamp of
+every block, so reading a time range only decompresses the blocks that
+overlap with it. The blocks are compressed, and read, by several threads
+with parallel_gzip.py.
+
+The index starts with the size of the compressed file it was built for, and
+it is ignored if the file has changed since then.
+'''
+
+import os
+from bisect import bisect_left
+
+import parallel_gzip
+from parallel_gzip import GzipReader, GzipWriter
+
+
+# The uncompressed size of the blocks.
+BLOCK_SIZE = 1024 * 1024
+
+
+def timestamp_of(line):
+    '''The timestamp is the fifth field of a revision line.'''
+    return line.split('\t', 5)[4]
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+class BlockGzipWriter():
+    '''Write lines sorted by their key into independent gzip blocks, and
+       write the index of the blocks when closed.'''
+
+    def __init__(self, path, key=timestamp_of, block_size=BLOCK_SIZE,
+                 compresslevel=9):
+        self._path = path
+        # The index of the members gives the offsets of the blocks, and
+        # lets the readers decompress them in parallel.
+        self._writer = GzipWriter(path, block_size=block_size,
+                                  compresslevel=compresslevel, index=True)
+        self._key = key
+        self._block_size = block_size
+        self._lines = []
+        self._size = 0
+        # The uncompressed offset and the first key of every block
+        self._blocks = []
+        self._position = 0
+
+    def write(self, line):
+        if not self._lines:
+            self._blocks.append((self._position, self._key(line)))
+        self._lines.append(line)
+        self._size += len(line)
+        if self._size >= self._block_size:
+            self._flush()
+
+    def _flush(self):
+        if self._lines:
+            self._writer.write(''.join(self._lines))
+            self._writer.end_member()
+            self._position += self._size
+            self._lines = []
+            self._size = 0
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+        # Every block starts a member of the gzip file.
+        members = parallel_gzip.load_index(self._path)
+        offsets = dict(zip(members.positions, members.offsets))
+        with open(index_path(self._path), 'w') as f:
+            f.write('%d\n' % os.path.getsize(self._path))
+            for position, key in self._blocks:
+                f.write('%d\t%s\n' % (offsets[position], key))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TimeIndex():
+    '''The first keys of the blocks of a file and their offsets.'''
+
+    def __init__(self, offsets, keys):
+        self.offsets = offsets
+        self.keys = keys
+
+    def offset_for(self, begin):
+        '''The offset of the block where the lines with key >= begin start.
+
+        The lines with a key equal to the first key of a block may also be
+        at the end of the previous block, hence we step back one block.
+        '''
+        block = bisect_left(self.keys, begin) - 1
+        if block < 0:
+            return 0
+        return self.offsets[block]
+
+
+def load_index(path):
+    '''Load the index of a file, or return None if it has none or it is
+       out of date.'''
+    try:
+        with open(index_path(path)) as f:
+            size = int(f.readline())
+            if size != os.path.getsize(path):
+                return None
+            offsets, keys = [], []
+            for line in f:
+                offset, key = line[:-1].split('\t', 1)
+                offsets.append(int(offset))
+                keys.append(key)
+    except IOError:
+        return None
+    return TimeIndex(offsets, keys)
+
+
+def read_lines(path, begin=None, end=None, key=timestamp_of):
+    '''Iterate over the lines of a sorted file with begin <= key < end.
+
+    With an index, we start decompressing at the first block that may hold
+    the key begin; without one we read the file from its start.
+    '''
+    index = load_index(path)
+    offset = 0
+    if index is not None and begin is not None:
+        offset = index.offset_for(begin)
+    lines = parallel_gzip.read_lines(path, offset=offset)
+    for line in lines:
+        line_key = key(line)
+        if begin is not None and line_key < begin:
+            continue
+        if end is not None and line_key >= end:
+            break
+        yield line
+    lines.close()
+
+
+def rewrite_with_index(input_path, output_path, key=timestamp_of,
+                       block_size=BLOCK_SIZE):
+    '''Rewrite a sorted gzip file into the block layout with an index.'''
+    with GzipReader(input_path) as input_file:
+        with BlockGzipWriter(output_path, key, block_size) as writer:
+            for line in input_file:
+                writer.write(line)
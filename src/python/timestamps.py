@@ -0,0 +1,107 @@
+'''
+Convert the timestamps of the Wikipedia revisions, like 2013-01-01T00:00:00Z
+or 2013-01-01T00:00:00 without the trailing Z, to integer epoch seconds and
+back.
+
+datetime.strptime is slow enough to dominate the scripts that parse every
+revision, so we take the fields apart by their fixed positions instead:
+`parse_timestamp` for single values, and `parse_timestamps` for a whole
+column of them at once with NumPy.
+
+Run this module to see how the methods compare:
+python src/python/timestamps.py
+'''
+
+import calendar, time
+import numpy as np
+
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# The length of the timestamps without the trailing Z.
+TIMESTAMP_LENGTH = 19
+
+# The epoch seconds of the midnights of the days we have seen.
+_days = dict()
+
+
+def parse_timestamp(timestamp):
+    '''Convert a timestamp to epoch seconds.'''
+    day = timestamp[:10]
+    try:
+        midnight = _days[day]
+    except KeyError:
+        midnight = calendar.timegm((int(day[0:4]), int(day[5:7]),
+                                    int(day[8:10]), 0, 0, 0))
+        _days[day] = midnight
+    return midnight + int(timestamp[11:13]) * 3600 + \
+        int(timestamp[14:16]) * 60 + int(timestamp[17:19])
+
+
+def days_from_civil(year, month, day):
+    '''The number of days since 1970-01-01 for dates in the proleptic
+    Gregorian calendar, for scalars or NumPy arrays of years >= 1.
+
+    See http://howardhinnant.github.io/date_algorithms.html#days_from_civil
+    '''
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + \
+        day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + \
+        day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def parse_timestamps(timestamps):
+    '''Convert a sequence or array of timestamps to an int64 array of epoch
+       seconds.'''
+    # As fixed-width byte strings the trailing Z is cut off, and we can look
+    # at the digits as a matrix of bytes.
+    timestamps = np.asarray(timestamps, dtype='S%d' % TIMESTAMP_LENGTH)
+    digits = timestamps.view('uint8').reshape(-1, TIMESTAMP_LENGTH) \
+        .astype('int64') - ord('0')
+
+    def number(begin, end):
+        value = digits[:, begin]
+        for position in xrange(begin + 1, end):
+            value = value * 10 + digits[:, position]
+        return value
+
+    days = days_from_civil(number(0, 4), number(5, 7), number(8, 10))
+    return days * 86400 + number(11, 13) * 3600 + number(14, 16) * 60 + \
+        number(17, 19)
+
+
+def format_timestamp(epoch):
+    '''Convert epoch seconds to the timestamp format of the revision files.'''
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(epoch))
+
+
+if __name__ == '__main__':
+    from datetime import datetime
+    import random, timeit
+
+    random.seed(0)
+    samples = [format_timestamp(random.randint(978307200, 1420070400))
+               for i in xrange(100000)]
+    samples.sort()
+    array = np.array(samples)
+    expected = [calendar.timegm(time.strptime(t, TIMESTAMP_FORMAT))
+                for t in samples]
+    assert [parse_timestamp(t) for t in samples] == expected
+    assert parse_timestamps(samples).tolist() == expected
+    assert parse_timestamps([t[:-1] for t in samples]).tolist() == expected
+
+    epoch = datetime(1970, 1, 1)
+    methods = [
+        ('datetime.strptime',
+         lambda: [int((datetime.strptime(t, TIMESTAMP_FORMAT) - epoch)
+                      .total_seconds()) for t in samples]),
+        ('calendar.timegm', lambda: [calendar.timegm(
+            time.strptime(t, TIMESTAMP_FORMAT)) for t in samples]),
+        ('parse_timestamp', lambda: [parse_timestamp(t) for t in samples]),
+        ('parse_timestamps', lambda: parse_timestamps(array))]
+    for name, method in methods:
+        seconds = min(timeit.repeat(method, number=1, repeat=3))
+        print '%-20s %8.1f ns / timestamp' % (name, 1e9 * seconds / len(samples))
@@ -0,0 +1,277 @@
+'''
+A persistent dictionary of the Wikipedia user names, so that the scripts
+that build networks of the users give every user the same index in all of
+their outputs and across runs, and the outputs can be joined.
+
+The dictionary also remembers whether every user is a bot: a user is a bot
+if the name is in the list of data/wikipedia/wikipedia_robots.txt.gz, or
+contains a word that ends on 'bot'. A name is classified once, when it is
+added, instead of on every edit. The names are reclassified when the list
+of robots changes.
+
+The dictionary is kept in a directory (data/wikipedia/users.dictionary),
+with the files
+
+    names.strings, names.offsets    the names, in the format of the
+                                    StringDictionary of revision_store.py
+    names.hashes                    the uint32 CRC-32 of every name
+    names.bots.<version>            1 for the bots, 0 for the others
+    names.table.<version>           an open addressing hash table with
+                                    linear probing of the index + 1 of the
+                                    names, 0 for the empty slots
+    meta.json                       the number of names, the version of
+                                    the bots and the table, and the size
+                                    and modification time of the robots
+                                    file
+
+which are memory-mapped, so opening it reads none of the names. The new
+names of a run are added to the files by close(). The names, offsets and
+hashes are only appended to, and the bots and the table are written as a
+new version, so until meta.json is replaced the files it describes are
+unchanged. Only one script should add names at a time.
+'''
+
+import os, re, gzip, json, zlib
+import numpy as np
+
+
+USERS_DIRECTORY = 'data/wikipedia/users.dictionary'
+ROBOTS_FILE = 'data/wikipedia/wikipedia_robots.txt.gz'
+
+# A bot is any user name that contains a word that ends on 'bot'.
+BOT_PATTERN = re.compile(r'[Bb][Oo][Tt]\b')
+
+# The hash table has at least twice as many slots as there are names.
+MIN_TABLE_SIZE = 1024
+
+
+def name_hash(name):
+    return zlib.crc32(name) & 0xffffffff
+
+
+def read_robots(path):
+    '''The set of the user names of the bots listed in the file.'''
+    with gzip.open(path) as f:
+        return set(line.rstrip('\n') for line in f if line.strip())
+
+
+def source_signature(path):
+    '''The size and modification time of a file.'''
+    if path is None or not os.path.exists(path):
+        return None
+    return [os.path.getsize(path), int(os.path.getmtime(path))]
+
+
+def build_table(hashes):
+    '''The hash table of the names with the hashes, with the index + 1 of
+       every name in its slot.'''
+    size = MIN_TABLE_SIZE
+    while size < 2 * len(hashes):
+        size *= 2
+    table = np.zeros(size, dtype='int32')
+    active = np.arange(len(hashes))
+    slots = hashes.astype('int64') & (size - 1)
+    while len(active) > 0:
+        free = np.flatnonzero(table[slots] == 0)
+        # Of the names that reached the same free slot the first one takes
+        # it, and the others probe on.
+        _, first = np.unique(slots[free], return_index=True)
+        winners = free[first]
+        table[slots[winners]] = active[winners] + 1
+        left = np.ones(len(active), dtype='bool')
+        left[winners] = False
+        active = active[left]
+        slots = (slots[left] + 1) & (size - 1)
+    return table
+
+
+def _write_from(path, array, position):
+    '''Write the array at the byte position of the file, dropping whatever
+       is there from that position on.'''
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.truncate(position)
+        f.seek(position)
+        array.tofile(f)
+
+
+class UserDictionary():
+    '''The indices of the user names, and whether the users are bots.'''
+
+    def __init__(self, directory=USERS_DIRECTORY, robots_file=ROBOTS_FILE):
+        self._directory = directory
+        self._robots_file = robots_file
+        self._robots = None
+        self._open()
+
+    def _open(self):
+        try:
+            with open(self._path('meta.json')) as f:
+                meta = json.load(f)
+        except IOError:
+            meta = {'names': 0, 'table': 0, 'robots': None}
+        # The names on disk, and the version of their bots and table
+        self._saved = meta['names']
+        self._version = meta.get('version')
+        if self._saved == 0:
+            self._offsets = np.zeros(1, dtype='int64')
+        else:
+            self._offsets = self._map('names.offsets', 'int64',
+                                      self._saved + 1)
+        self._strings = self._map('names.strings', 'uint8',
+                                  int(self._offsets[-1]))
+        self._hashes = self._map('names.hashes', 'uint32', self._saved)
+        self._bots = self._map(self._versioned('names.bots'), 'uint8',
+                               self._saved)
+        self._table = self._map(self._versioned('names.table'), 'int32',
+                                meta['table'])
+        # The names added in this run
+        self._new_names = []
+        self._new_hashes = []
+        self._new_bots = []
+        # The indices of the names looked up in this run
+        self._cache = dict()
+        # Whether the names asked about in this run that are not in the
+        # dictionary, such as the bots, are bots
+        self._other_bots = dict()
+        self._reclassified = False
+        if self._saved > 0 and \
+        meta['robots'] != source_signature(self._robots_file):
+            self._reclassify()
+
+    def _path(self, name):
+        return os.path.join(self._directory, name)
+
+    def _versioned(self, name, version=None):
+        '''The file name of a version of the bots or the table; the first
+           dictionaries had no versions.'''
+        if version is None:
+            version = self._version
+        if version is None:
+            return name
+        return '%s.%d' % (name, version)
+
+    def _map(self, name, dtype, length):
+        if length == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self._path(name), dtype=dtype, mode='r',
+                         shape=(length,))
+
+    def __len__(self):
+        return self._saved + len(self._new_names)
+
+    def __getitem__(self, index):
+        '''The name of the index.'''
+        if index >= self._saved:
+            return self._new_names[index - self._saved]
+        return self._strings[self._offsets.item(index):
+                             self._offsets.item(index + 1)].tostring()
+
+    def index(self, name):
+        '''The index of the user name, adding it if it is new.'''
+        index = self._cache.get(name)
+        if index is None:
+            index = self._find(name)
+            if index is None:
+                index = len(self)
+                self._new_names.append(name)
+                self._new_hashes.append(name_hash(name))
+                bot = self._other_bots.pop(name, None)
+                self._new_bots.append(self._classify(name) if bot is None
+                                      else bot)
+            self._cache[name] = index
+        return index
+
+    def is_bot_name(self, name):
+        '''Whether the user name is a bot, without adding it. A name is
+           classified once, or not at all if it is in the dictionary.'''
+        index = self._cache.get(name)
+        if index is not None:
+            return self.is_bot(index)
+        bot = self._other_bots.get(name)
+        if bot is None:
+            index = self._find(name)
+            if index is not None:
+                self._cache[name] = index
+                return self.is_bot(index)
+            bot = self._other_bots[name] = self._classify(name)
+        return bot
+
+    def is_bot(self, index):
+        if index >= self._saved:
+            return self._new_bots[index - self._saved]
+        return bool(self._bots.item(index))
+
+    def _find(self, name):
+        '''The index of a name on disk, or None.'''
+        if len(self._table) == 0:
+            return None
+        h = name_hash(name)
+        mask = len(self._table) - 1
+        slot = h & mask
+        while True:
+            index = self._table.item(slot) - 1
+            if index < 0:
+                return None
+            if self._hashes.item(index) == h and self[index] == name:
+                return index
+            slot = (slot + 1) & mask
+
+    def _classify(self, name):
+        if self._robots is None:
+            self._robots = read_robots(self._robots_file) \
+                if os.path.exists(self._robots_file) else set()
+        return name in self._robots or BOT_PATTERN.search(name) is not None
+
+    def _reclassify(self):
+        self._bots = np.array([self._classify(self[index])
+                               for index in xrange(self._saved)],
+                              dtype='uint8')
+        self._reclassified = True
+
+    def close(self):
+        '''Add the new names to the files.'''
+        if not self._new_names and not self._reclassified:
+            return
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+        lengths = np.array([len(name) for name in self._new_names],
+                           dtype='int64')
+        offsets = self._offsets[-1] + np.cumsum(lengths)
+        hashes = np.concatenate([self._hashes, np.array(self._new_hashes,
+                                                        dtype='uint32')])
+        bots = np.concatenate([self._bots, np.array(self._new_bots,
+                                                    dtype='uint8')])
+        table = build_table(hashes)
+        # Drop the memory maps before the files change under them.
+        end = int(self._offsets[-1])
+        self._offsets = self._strings = self._hashes = self._bots = \
+            self._table = None
+        if self._saved == 0:
+            offsets = np.concatenate([[0], offsets])
+            _write_from(self._path('names.offsets'), offsets, 0)
+        else:
+            _write_from(self._path('names.offsets'), offsets,
+                        (self._saved + 1) * 8)
+        with open(self._path('names.strings'),
+                  'r+b' if self._saved > 0 else 'wb') as f:
+            f.truncate(end)
+            f.seek(end)
+            f.write(''.join(self._new_names))
+        _write_from(self._path('names.hashes'), hashes[self._saved:],
+                    self._saved * 4)
+        version = (self._version or 0) + 1
+        _write_from(self._path(self._versioned('names.bots', version)),
+                    bots, 0)
+        _write_from(self._path(self._versioned('names.table', version)),
+                    table, 0)
+        # The metadata is written last, and replaced in one step by a
+        # rename, so that partly written names are not used.
+        with open(self._path('meta.json.tmp'), 'w') as f:
+            json.dump({'names': len(hashes), 'table': len(table),
+                       'version': version,
+                       'robots': source_signature(self._robots_file)}, f)
+        os.rename(self._path('meta.json.tmp'), self._path('meta.json'))
+        for name in ['names.bots', 'names.table']:
+            if os.path.exists(self._path(self._versioned(name))):
+                os.remove(self._path(self._versioned(name)))
+        self._open()
@@ -0,0 +1,192 @@
+'''
+An index of the sorted edit times of every Wikipedia user, to count the
+edits of users in any number of time ranges without rescanning the
+revisions.
+
+The edit times are stored grouped by user and sorted within the groups, so
+the number of edits of a user in [begin, end) is the difference of two
+binary searches. The batch method `counts` answers this for all the users
+and ranges at once with a single vectorized `searchsorted`. The name a user
+edited under is kept for every edit, so `names_in_ranges` can tell the name
+of the last edit of a user in the ranges.
+'''
+
+import os, json
+import numpy as np
+
+from revision_store import RevisionStore
+
+
+# The version of the saved index; an index of another version is rebuilt.
+VERSION = 2
+
+
+class UserEditIndex():
+    '''The edit times of the users, sorted by user and then by time.'''
+
+    def __init__(self, user_ids, starts, times, name_ids, names):
+        self.user_ids = user_ids    # The sorted IDs of the users.
+        self.starts = starts        # Where the times of every user begin,
+                                    # with the total count at the end.
+        self.times = times          # The epoch times of the edits.
+        self.name_ids = name_ids    # The index in names of every edit.
+        self.names = names          # The distinct user names.
+        # The times shifted to begin at 0, and the keys that combine the
+        # user and the time so that we can search for all users at once.
+        if len(times) > 0:
+            self._time_offset = int(times.min())
+            self._span = int(times.max()) - self._time_offset + 2
+        else:
+            self._time_offset, self._span = 0, 2
+        self._keys = None
+
+    @classmethod
+    def build(cls, user_ids, timestamps, name_ids, names):
+        '''Build the index from the columns of the revisions, with the user
+           names as indices in the list `names`.'''
+        order = np.lexsort((timestamps, user_ids))
+        sorted_users = user_ids[order]
+        unique_users, starts = np.unique(sorted_users, return_index=True)
+        starts = np.append(starts, len(order)).astype('int64')
+        # Only the names that occur are kept.
+        used, name_ids = np.unique(np.asarray(name_ids)[order],
+                                   return_inverse=True)
+        return cls(unique_users, starts, timestamps[order],
+                   name_ids.astype('int32'), [names[i] for i in used])
+
+    @classmethod
+    def from_revisions(cls, revisions):
+        '''Build the index of the registered users from a RevisionStore or a
+           RevisionFile.'''
+        if isinstance(revisions, RevisionStore):
+            user_ids = np.asarray(revisions.column('user_id'))
+            # We only keep registered users, and need to strip user ID 0 due
+            # to an early logging bug (http://en.wikipedia.org/wiki/User:0).
+            registered = np.nonzero(user_ids > 0)[0]
+            return cls.build(user_ids[registered],
+                             revisions.column('timestamp')[registered],
+                             revisions.column('user_name')[registered],
+                             revisions.dictionary('user_name'))
+        user_ids, timestamps, name_ids = [], [], []
+        # The index of every name in `names`
+        name_index = dict()
+        names = []
+        for user_id, timestamp, user_name in revisions.rows(
+                ['user_id', 'timestamp', 'user_name']):
+            if user_id > 0:
+                user_ids.append(user_id)
+                timestamps.append(timestamp)
+                name_id = name_index.get(user_name)
+                if name_id is None:
+                    name_id = name_index[user_name] = len(names)
+                    names.append(user_name)
+                name_ids.append(name_id)
+        return cls.build(np.array(user_ids, dtype='int32'),
+                         np.array(timestamps, dtype='int64'),
+                         np.array(name_ids, dtype='int32'), names)
+
+    def save(self, directory, source=None):
+        '''Save the index, with the size and modification time of the file
+           it was built from, if given.'''
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        np.save(os.path.join(directory, 'user_ids.npy'), self.user_ids)
+        np.save(os.path.join(directory, 'starts.npy'), self.starts)
+        np.save(os.path.join(directory, 'times.npy'), self.times)
+        np.save(os.path.join(directory, 'name_ids.npy'), self.name_ids)
+        with open(os.path.join(directory, 'names.txt'), 'w') as f:
+            for name in self.names:
+                f.write(name + '\n')
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'source': source_signature(source),
+                       'version': VERSION}, f)
+
+    @classmethod
+    def load(cls, directory, source=None):
+        '''Load a saved index, or return None if there is none, it was
+           built from a different version of the source file, or it is of
+           another version.'''
+        try:
+            with open(os.path.join(directory, 'meta.json')) as f:
+                meta = json.load(f)
+        except IOError:
+            return None
+        if meta.get('version') != VERSION:
+            return None
+        if source is not None and meta['source'] != source_signature(source):
+            return None
+        with open(os.path.join(directory, 'names.txt')) as f:
+            names = [line[:-1] for line in f]
+        return cls(np.load(os.path.join(directory, 'user_ids.npy'),
+                           mmap_mode='r'),
+                   np.load(os.path.join(directory, 'starts.npy'),
+                           mmap_mode='r'),
+                   np.load(os.path.join(directory, 'times.npy'),
+                           mmap_mode='r'),
+                   np.load(os.path.join(directory, 'name_ids.npy'),
+                           mmap_mode='r'),
+                   names)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def count(self, user_id, begin, end):
+        '''The number of edits of a user in [begin, end).'''
+        position = np.searchsorted(self.user_ids, user_id)
+        if position == len(self.user_ids) or \
+        self.user_ids[position] != user_id:
+            return 0
+        times = self.times[self.starts[position]:self.starts[position + 1]]
+        return max(0, int(np.searchsorted(times, end) -
+                          np.searchsorted(times, begin)))
+
+    def _clip(self, bounds):
+        '''Shift the time bounds so that they fall into a user's key range.'''
+        return np.clip(np.asarray(bounds, dtype='int64') - self._time_offset,
+                       0, self._span - 1)
+
+    def _positions(self, ranges, users):
+        '''The positions in times of the beginning (even columns) and the
+           end (odd columns) of every range, for every user (rows).'''
+        if self._keys is None:
+            user_of_edit = np.repeat(np.arange(len(self.user_ids),
+                                               dtype='int64'),
+                                     np.diff(self.starts))
+            self._keys = user_of_edit * self._span + \
+                (self.times - self._time_offset)
+        if users is None:
+            users = np.arange(len(self.user_ids), dtype='int64')
+        ranges = np.asarray(ranges, dtype='int64').reshape(-1, 2)
+        bounds = self._clip(ranges.ravel())
+        # One row of keys for every user, with the beginning and the end of
+        # every range, then search for all of them in one go.
+        queries = users.astype('int64')[:, np.newaxis] * self._span + \
+            bounds[np.newaxis, :]
+        return np.searchsorted(self._keys, queries)
+
+    def counts(self, ranges, users=None):
+        '''The matrix of the edit counts of the users (rows) in the time
+           ranges (columns) given as (begin, end) pairs. A range that ends
+           before it begins has no edits.
+
+        users are positions in user_ids, all the users by default.
+        '''
+        positions = self._positions(ranges, users)
+        return np.maximum(positions[:, 1::2] - positions[:, 0::2], 0)
+
+    def names_in_ranges(self, ranges, users=None):
+        '''The name of the last edit of each of the users in the time
+           ranges, or None for a user without edits in them.'''
+        positions = self._positions(ranges, users)
+        begins, ends = positions[:, 0::2], positions[:, 1::2]
+        # The position of the last edit in every range, -1 if it is empty
+        last = np.where(ends > begins, ends - 1, -1).max(axis=1)
+        return [self.names[self.name_ids[position]] if position >= 0
+                else None for position in last]
+
+
+def source_signature(path):
+    '''The size and modification time of a file or directory.'''
+    if path is None:
+        return None
+    return [os.path.getsize(path), int(os.path.getmtime(path))]
@@ -0,0 +1,248 @@
+'''
+Estimate local clustering coefficients by sampling wedges, when exact
+triangle counts of every node would take too long.
+
+A wedge at node u is an ordered pair (v, w) of distinct neighbors of u, and
+it is closed if there is an edge from v to w. The local clustering
+coefficient of u is the fraction of its k (k - 1) wedges that are closed,
+so the fraction of closed wedges among wedges drawn uniformly at random
+estimates it, and picking the node uniformly from a group of nodes first
+estimates the average over the group.
+
+The samples are drawn in rounds of doubling size until the Wilson score
+interval of every estimate is narrower than +-error at the given
+confidence, or the time budget runs out, so every estimate comes with the
+interval that it reached.
+'''
+
+import math, time
+import numpy as np
+
+
+CONFIDENCE = 0.95
+# The target half-width of the confidence intervals.
+ERROR = 0.01
+# The samples per estimate in the first round.
+INITIAL_SAMPLES = 32
+# The most wedges sampled at a time.
+SAMPLE_CHUNK = 1024 * 1024
+# The nodes with at most this many wedges are counted exactly.
+EXACT_WEDGES = 256
+# The degree bins are [2, 4), [4, 8), ... by default.
+BIN_BASE = 2
+
+
+def z_score(confidence):
+    '''The z value of a two-sided normal confidence interval.'''
+    low, high = 0.0, 10.0
+    for i in xrange(100):
+        middle = (low + high) / 2
+        if math.erf(middle / math.sqrt(2)) < confidence:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def proportions(hits, samples):
+    '''The proportions hits / samples, NaN where there are no samples.'''
+    samples = np.asarray(samples, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(samples > 0,
+                        np.asarray(hits, dtype='float64') / samples, np.nan)
+
+
+def wilson_interval(hits, samples, z):
+    '''The Wilson score intervals of the proportions hits / samples, NaN
+       where there are no samples.'''
+    p = proportions(hits, samples)
+    samples = np.asarray(samples, dtype='float64')
+    z2 = z * z
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = 1 + z2 / samples
+        center = (p + z2 / (2 * samples)) / denominator
+        half_width = z * np.sqrt(p * (1 - p) / samples +
+                                 z2 / (4 * samples * samples)) / denominator
+    return center - half_width, center + half_width
+
+
+class WedgeSampler():
+    '''Draw random wedges of the nodes of a CSRGraph.
+
+    The neighbors of a node are the nodes it links to or from, other than
+    itself, and a wedge (v, w) is closed by the directed edge v -> w. For an
+    undirected graph pass a graph with the edges in both directions.
+    '''
+
+    def __init__(self, graph, seed=None):
+        n = graph.node_count
+        self._node_count = n
+        self.random = np.random.RandomState(seed)
+        # The sorted source * n + destination keys of the edges
+        self._keys = np.repeat(np.arange(n, dtype='int64'),
+                               graph.out_degrees()) * n + graph.out_indices
+        # The neighbor lists, from the edges in both directions
+        sources = self._keys // n
+        destinations = graph.out_indices.astype('int64')
+        keep = sources != destinations
+        sources, destinations = sources[keep], destinations[keep]
+        neighbor_keys = np.unique(np.concatenate(
+            [sources * n + destinations, destinations * n + sources]))
+        self.degrees = np.bincount(neighbor_keys // n, minlength=n)
+        self._indptr = np.zeros(n + 1, dtype='int64')
+        np.cumsum(self.degrees, out=self._indptr[1:])
+        self._neighbors = (neighbor_keys % n).astype('int32')
+
+    def nodes(self):
+        '''The nodes with at least one wedge.'''
+        return np.flatnonzero(self.degrees >= 2)
+
+    def _closed(self, v, w):
+        queries = v.astype('int64') * self._node_count + w
+        found = np.searchsorted(self._keys, queries)
+        found[found == len(self._keys)] = 0
+        return self._keys[found] == queries
+
+    def sample(self, nodes):
+        '''Whether a random wedge of each of the nodes is closed.'''
+        k = self.degrees[nodes]
+        i = (self.random.random_sample(len(nodes)) * k).astype('int64')
+        j = (self.random.random_sample(len(nodes)) * (k - 1)).astype('int64')
+        j += j >= i
+        starts = self._indptr[nodes]
+        return self._closed(self._neighbors[starts + i],
+                            self._neighbors[starts + j])
+
+    def closed_wedges(self, nodes):
+        '''The exact number of closed wedges of each of the nodes, which
+           takes k (k - 1) lookups per node.'''
+        nodes = np.asarray(nodes)
+        k = self.degrees[nodes]
+        pairs = k * k
+        node_of_pair = np.repeat(np.arange(len(nodes)), pairs)
+        # The index of every pair within its node
+        pair = np.arange(pairs.sum()) - np.repeat(np.cumsum(pairs) - pairs,
+                                                  pairs)
+        i, j = pair // k[node_of_pair], pair % k[node_of_pair]
+        distinct = i != j
+        node_of_pair, i, j = node_of_pair[distinct], i[distinct], j[distinct]
+        starts = self._indptr[nodes][node_of_pair]
+        closed = self._closed(self._neighbors[starts + i],
+                              self._neighbors[starts + j])
+        return np.bincount(node_of_pair, closed, minlength=len(nodes)) \
+            .astype('int64')
+
+
+def _estimate(draw, unit_count, error, time_budget, confidence):
+    '''Sample the units in rounds until their intervals are narrow enough.
+
+    draw(units) returns whether a wedge sampled for each unit is closed.
+    Returns the hits, the samples and the interval bounds of the units.
+    '''
+    z = z_score(confidence)
+    hits = np.zeros(unit_count, dtype='int64')
+    samples = np.zeros(unit_count, dtype='int64')
+    low, high = wilson_interval(hits, samples, z)
+    begin = time.time()
+    active = np.arange(unit_count)
+    round_samples = INITIAL_SAMPLES
+    out_of_time = False
+    while len(active) > 0 and not out_of_time:
+        units_per_chunk = max(1, SAMPLE_CHUNK // round_samples)
+        for chunk in xrange(0, len(active), units_per_chunk):
+            units = np.repeat(active[chunk:chunk + units_per_chunk],
+                              round_samples)
+            hits += np.bincount(units, draw(units),
+                                minlength=unit_count).astype('int64')
+            samples += np.bincount(units, minlength=unit_count)
+            if time_budget is not None and \
+            time.time() - begin > time_budget:
+                out_of_time = True
+                break
+        low, high = wilson_interval(hits, samples, z)
+        # A unit left without samples when the time ran out has NaN bounds
+        # and drops out here.
+        with np.errstate(invalid='ignore'):
+            active = active[(high[active] - low[active]) / 2 > error]
+        round_samples *= 2
+    return hits, samples, low, high
+
+
+def estimate_per_node(sampler, nodes=None, error=ERROR, time_budget=None,
+                      confidence=CONFIDENCE):
+    '''Estimate the local clustering coefficients of the nodes, all nodes
+       with at least one wedge by default.
+
+    The nodes with at most EXACT_WEDGES wedges are counted exactly, as that
+    costs less than a sample would. Returns the estimates, the low and
+    high bounds of their intervals, and the number of wedges looked at per
+    node. The estimate and bounds of a node without samples are NaN.
+    '''
+    if nodes is None:
+        nodes = sampler.nodes()
+    k = sampler.degrees[nodes].astype('int64')
+    wedges = k * (k - 1)
+    exact = np.flatnonzero(wedges <= EXACT_WEDGES)
+    hits = np.zeros(len(nodes), dtype='int64')
+    samples = np.zeros(len(nodes), dtype='int64')
+    for chunk in xrange(0, len(exact), SAMPLE_CHUNK // EXACT_WEDGES):
+        part = exact[chunk:chunk + SAMPLE_CHUNK // EXACT_WEDGES]
+        hits[part] = sampler.closed_wedges(nodes[part])
+        samples[part] = wedges[part]
+    sampled = np.flatnonzero(wedges > EXACT_WEDGES)
+    sampled_hits, sampled_samples, low, high = _estimate(
+        lambda units: sampler.sample(nodes[sampled[units]]), len(sampled),
+        error, time_budget, confidence)
+    hits[sampled] = sampled_hits
+    samples[sampled] = sampled_samples
+    estimates = proportions(hits, samples)
+    lows, highs = estimates.copy(), estimates.copy()
+    lows[sampled], highs[sampled] = low, high
+    return estimates, lows, highs, samples
+
+
+def degree_bins(degrees, base=BIN_BASE):
+    '''The bounds 2 and the powers of base above it, up to the first one
+       above the largest degree.'''
+    bounds = [2]
+    power = base
+    while bounds[-1] <= degrees.max():
+        if power > bounds[-1]:
+            bounds.append(power)
+        power *= base
+    return np.array(bounds)
+
+
+def estimate_by_degree(sampler, bounds=None, error=ERROR, time_budget=None,
+                       confidence=CONFIDENCE):
+    '''Estimate the average local clustering coefficient of the nodes in
+       each degree bin.
+
+    Returns the rows (low degree, high degree, nodes, samples, estimate,
+    low bound, high bound) of the non-empty bins, where the bin holds the
+    degrees from the low one up to but not including the high one. The
+    estimate and bounds of a bin without samples are NaN.
+    '''
+    if bounds is None:
+        bounds = degree_bins(sampler.degrees)
+    nodes = sampler.nodes()
+    bins = np.searchsorted(bounds, sampler.degrees[nodes], side='right') - 1
+    order = np.argsort(bins, kind='mergesort')
+    nodes, bins = nodes[order], bins[order]
+    bin_sizes = np.bincount(bins, minlength=len(bounds) - 1)
+    bin_starts = np.cumsum(bin_sizes) - bin_sizes
+    occupied = np.flatnonzero(bin_sizes > 0)
+
+    def draw(units):
+        # A random node of the bin, then a random wedge of it.
+        bin_of_unit = occupied[units]
+        members = bin_starts[bin_of_unit] + \
+            (sampler.random.random_sample(len(units)) *
+             bin_sizes[bin_of_unit]).astype('int64')
+        return sampler.sample(nodes[members])
+
+    hits, samples, low, high = _estimate(draw, len(occupied), error,
+                                         time_budget, confidence)
+    estimates = proportions(hits, samples)
+    return [(bounds[b], bounds[b + 1], bin_sizes[b], samples[u],
+             estimates[u], low[u], high[u]) for u, b in enumerate(occupied)]